@@ -0,0 +1,938 @@
+"""Benchmark the inference stage of each coach script.
+
+Each stage runs in its own process on a fixed synthetic workload, so
+numbers are comparable across runs and machines. Stages record:
+
+    help_seconds         (startup) each script's --help, and the top level
+                         imports it makes, from python -X importtime
+    cold_start_seconds   process start to the first answer, including
+                         interpreter start, imports and model load
+    latency_p50/95/99    per request, once warm
+    requests_per_second  warm, one request at a time
+    peak_rss_bytes       the stage process' peak resident memory
+    best_threads         (threads) the thread count with the highest
+                         throughput for coach1 encode, coach3b question
+                         answering and coach4b summarization
+    top1_agreement       (precision) for the search stage in bfloat16 and
+                         int8, how often the top hit of a fixed query set
+                         matches float32's, the overlap of the top 10, and
+                         the throughput against float32
+
+The LLM stages (chat, rag) run against a local Ollama stand-in (see
+ollama_stub.py) unless --ollama-url is given. The qa and summarize stages
+need the checkpoints trained by coach3a.py and coach4a.py and are skipped
+without them.
+
+Results are written as JSON. With --baseline, they are compared against an
+earlier run and the exit status is 1 when a stage got slower (or its
+throughput dropped) by more than --tolerance.
+
+"""
+
+__usage__ = """
+examples:
+
+    Run every stage with 50 warm requests each:
+
+        ./.venv/bin/python bench.py
+
+    Only how long each script takes to start, and what it imports:
+
+        ./.venv/bin/python bench.py -s startup
+
+    Only the embedding stages, with a larger search corpus:
+
+        ./.venv/bin/python bench.py -s similarity -s intent -s search --corpus-size 10000
+
+    Find the best --threads for this host, trying 1, 2, 4 and 8:
+
+        ./.venv/bin/python bench.py -s threads --thread-counts 1,2,4,8
+
+    Compare the search stage's rankings, throughput and memory in float32,
+    bfloat16 and int8:
+
+        ./.venv/bin/python bench.py -s precision
+
+    Compare against an earlier run, failing on a 20% regression:
+
+        ./.venv/bin/python bench.py --output new.json --baseline bench_results.json --tolerance 0.2
+
+    Run the LLM stages against a running Ollama stand-in with 50ms per token:
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --token-latency 0.05
+
+        ./.venv/bin/python bench.py -s chat -s rag --ollama-url http://127.0.0.1:11435
+"""
+
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+warnings.simplefilter(action="ignore", category=UserWarning)
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from registry import PRECISIONS
+from runtime import add_runtime_arguments, configure_runtime
+
+STAGES = [
+    "startup",
+    "similarity",
+    "intent",
+    "qa",
+    "summarize",
+    "topics",
+    "ner",
+    "search",
+    "chat",
+    "rag",
+    "threads",
+    "precision",
+]
+DEFAULT_STAGES = [stage for stage in STAGES if stage not in ["threads", "precision"]]
+LLM_STAGES = ["chat", "rag"]
+# coach1 encode, coach3b question answering and coach4b summarization.
+SWEEP_STAGES = ["similarity", "qa", "summarize"]
+RANKING_QUERIES = 100
+RANKING_TOP_K = 10
+COMPARED = [("latency_p50", 1), ("latency_p95", 1), ("requests_per_second", -1)]
+SCRIPTS = [
+    "coach1.py",
+    "coach2.py",
+    "coach3a.py",
+    "coach3b.py",
+    "coach4a.py",
+    "coach4b.py",
+    "coach5.py",
+    "coach6.py",
+    "coach7a.py",
+    "coach7b.py",
+    "coach8.py",
+    "coach9a.py",
+    "coach9b.py",
+    "coach10.py",
+    "coach11.py",
+]
+
+NAMES = ["John", "Michael", "Scottie", "Dennis", "Toni", "Phil", "Horace", "Luc"]
+TEAMS = ["Bulls", "Pelicans", "Knicks", "Lakers", "Celtics", "Wizards", "Hornets"]
+CITIES = ["Chicago", "Dayton", "Charlotte", "Washington", "Wilmington", "Boston"]
+TEMPLATES = [
+    "Pass the ball to {name} when he is near the basket.",
+    "Take a {points} point shot before the {team} set up their defense.",
+    "{name} should dribble the ball to the other side of the court.",
+    "Did you see {name} slam dunk against the {team}?",
+    "The {team} are flying to {city} right after the game.",
+    "Can you get me {points} tacos before halftime?",
+    "{name} scored {number} points against the {team} in {city} in {year}.",
+    "Tell {name} to guard the {team} point guard on the next possession.",
+    "Can you zoom in on {name}'s shoes?",
+]
+QUESTIONS = [
+    "When did Michael Jordan play in {city}?",
+    "How many points did Jordan score against the {team}?",
+    "What did Jordan do in {year}?",
+    "Did Jordan ever play for the {team}?",
+    "Why is he called Air Jordan?",
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        name=rng.choice(NAMES),
+        team=rng.choice(TEAMS),
+        city=rng.choice(CITIES),
+        points=rng.choice([2, 3]),
+        number=rng.randint(10, 69),
+        year=rng.randint(1984, 2003),
+    )
+
+
+def messages(count: int, seed: int = 0, templates: List[str] = TEMPLATES) -> List[str]:
+    """Short game-day messages, the same for a given count and seed."""
+    rng = random.Random(seed)
+    return [fill(rng.choice(templates), rng) for _ in range(count)]
+
+
+def documents(count: int, words: int, seed: int = 0) -> List[str]:
+    """Longer bodies of text of about `words` words, for summarization."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        sentences = []
+        while sum(len(sentence.split()) for sentence in sentences) < words:
+            sentences.append(fill(rng.choice(TEMPLATES), rng))
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def questions_and_contexts(count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """Questions answered by one sentence of a few sentences of context."""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        name, team, year = rng.choice(NAMES), rng.choice(TEAMS), rng.randint(1984, 2003)
+        context = [fill(rng.choice(TEMPLATES), rng) for _ in range(3)]
+        context.insert(rng.randint(0, 3), f"{name} coached the {team} in {year}.")
+        pairs.append((f"Who coached the {team} in {year}?", " ".join(context)))
+    return pairs
+
+
+def setup_similarity(args) -> Tuple[Callable, Dict]:
+    from sentence_transformers import util
+    from coach1 import DOCS
+    from registry import REGISTRY
+
+    model = REGISTRY.sentence_transformer(
+        "sentence-transformers/multi-qa-MiniLM-L6-cos-v1", args.precision
+    )
+
+    def run(query: str):
+        return util.dot_score(model.encode(query), model.encode(DOCS))[0].tolist()
+
+    return run, {}
+
+
+def setup_intent(args) -> Tuple[Callable, Dict]:
+    from coach2 import LIBRARY, get_intent
+    from registry import REGISTRY
+
+    model = REGISTRY.sentence_transformer(
+        "sentence-transformers/multi-qa-MiniLM-L6-cos-v1", args.precision
+    )
+    return lambda query: get_intent(query, LIBRARY, model), {}
+
+
+def setup_qa(args) -> Tuple[Callable, Dict]:
+    from transformers import pipeline
+
+    question_answerer = pipeline("question-answering", model=args.qa_model)
+    return lambda pair: question_answerer(question=pair[0], context=pair[1]), {}
+
+
+def setup_summarize(args) -> Tuple[Callable, Dict]:
+    from transformers import pipeline
+
+    summarizer = pipeline("summarization", model=args.summarize_model)
+    return lambda content: summarizer("summarize: " + content), {}
+
+
+def setup_topics(args) -> Tuple[Callable, Dict]:
+    from registry import REGISTRY
+
+    topic_model = REGISTRY.bertopic(
+        "MaartenGr/BERTopic_Wikipedia",
+        "sentence-transformers/all-MiniLM-L6-v2",
+        args.precision,
+    )
+    return topic_model.transform, {}
+
+
+def setup_ner(args) -> Tuple[Callable, Dict]:
+    from coach6 import EntityExtractor
+
+    # No gazetteer or cache, every message goes through the model.
+    extractor = EntityExtractor(
+        "tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super"
+    )
+    return extractor.predict, {}
+
+
+def setup_search(args) -> Tuple[Callable, Dict]:
+    from sentence_transformers.util import semantic_search
+    from registry import REGISTRY
+
+    model = REGISTRY.sentence_transformer(
+        "sentence-transformers/all-MiniLM-L6-v2", args.precision
+    )
+    info = {"corpus_size": args.corpus_size, "model_bytes": REGISTRY.total_bytes()}
+
+    started = time.perf_counter()
+    corpus = model.encode(
+        messages(args.corpus_size, seed=args.seed + 1), convert_to_tensor=True
+    ).float()
+    if args.worker_rankings:
+        queries = model.encode(
+            messages(RANKING_QUERIES, seed=args.seed + 2), convert_to_tensor=True
+        ).float()
+        info["rankings"] = [
+            [hit["corpus_id"] for hit in hits]
+            for hits in semantic_search(queries, corpus, top_k=RANKING_TOP_K)
+        ]
+    info["prepare_seconds"] = time.perf_counter() - started
+
+    def run(query: str):
+        return semantic_search(
+            model.encode(query, convert_to_tensor=True).float(), corpus, top_k=5
+        )
+
+    return run, info
+
+
+def setup_chat(args) -> Tuple[Callable, Dict]:
+    from langchain_community.llms import Ollama
+    from langchain_core._api.deprecation import suppress_langchain_deprecation_warning
+    from coach8 import answer_query
+
+    llm = Ollama(model="llama3", base_url=args.ollama_url, stop=["<|eot_id|>"])
+    system_prompt = "Give a one or two word answers only."
+
+    def run(query: str):
+        with suppress_langchain_deprecation_warning():
+            return answer_query(llm, query, system_prompt)
+
+    return run, {}
+
+
+def setup_rag(args) -> Tuple[Callable, Dict]:
+    import chromadb
+    from coach9a import ingest, read_facts
+    from coach9b import RAGPipeline
+    from embedders import load_embedder
+
+    embedder = load_embedder("llama3", ollama_url=args.ollama_url)
+    directory = tempfile.mkdtemp(prefix="bench_rag_")
+    collection = chromadb.PersistentClient(path=directory).get_or_create_collection(
+        name="bench"
+    )
+    started = time.perf_counter()
+    ingest(collection, embedder, read_facts(args.facts))
+    prepare_seconds = time.perf_counter() - started
+
+    pipeline = RAGPipeline(collection, embedder, ollama_url=args.ollama_url)
+    return pipeline.answer, {"prepare_seconds": prepare_seconds}
+
+
+SETUPS = {
+    "similarity": setup_similarity,
+    "intent": setup_intent,
+    "qa": setup_qa,
+    "summarize": setup_summarize,
+    "topics": setup_topics,
+    "ner": setup_ner,
+    "search": setup_search,
+    "chat": setup_chat,
+    "rag": setup_rag,
+}
+
+
+def workload(stage: str, count: int, args) -> List:
+    if stage == "qa":
+        return questions_and_contexts(count, seed=args.seed)
+    if stage == "summarize":
+        return documents(count, args.document_words, seed=args.seed)
+    if stage in LLM_STAGES:
+        return messages(count, seed=args.seed, templates=QUESTIONS)
+    return messages(count, seed=args.seed)
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def library_versions() -> Dict[str, str]:
+    versions = {}
+    for name in ["torch", "transformers", "sentence_transformers", "chromadb"]:
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, "__version__", "unknown")
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        versions["torch_threads"] = str(torch.get_num_threads())
+    return versions
+
+
+def run_stage(stage: str, args, started: float) -> Dict:
+    """Runs one stage in this process. `started` is when the process was
+    launched, so interpreter start up counts toward the cold start. Work a
+    stage reports as prepare_seconds (building a search corpus or a
+    collection) does not."""
+    setup_started = time.perf_counter()
+    run, info = SETUPS[stage](args)
+    load_seconds = time.perf_counter() - setup_started - info.get("prepare_seconds", 0)
+
+    warmup = max(1, args.warmup)
+    items = workload(stage, warmup + args.requests, args)
+
+    first_started = time.perf_counter()
+    run(items[0])
+    first_seconds = time.perf_counter() - first_started
+    cold_start = time.time() - started - info.get("prepare_seconds", 0)
+
+    for item in items[1:warmup]:
+        run(item)
+
+    latencies = []
+    warm_started = time.perf_counter()
+    for item in items[warmup:]:
+        request_started = time.perf_counter()
+        run(item)
+        latencies.append(time.perf_counter() - request_started)
+    warm_seconds = time.perf_counter() - warm_started
+
+    return {
+        "stage": stage,
+        "status": "ok",
+        "cold_start_seconds": cold_start,
+        "load_seconds": load_seconds,
+        "first_request_seconds": first_seconds,
+        "requests": len(latencies),
+        "latency_mean": statistics.fmean(latencies),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "requests_per_second": len(latencies) / warm_seconds,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "versions": library_versions(),
+        **info,
+    }
+
+
+def parse_importtime(output: str) -> List[Tuple[str, float]]:
+    """Returns the (module, seconds) of the top level imports in
+    `python -X importtime` output, including what they imported in turn."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name[1:2] != " ":
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return imports
+
+
+def startup(args, top: int = 5) -> Dict:
+    """Times `--help` of each script, the common short lived case, and what
+    it imports before it can print it."""
+    scripts = []
+    for script in SCRIPTS:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+        seconds = []
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, path, "--help"], capture_output=True, text=True
+            )
+            seconds.append(time.perf_counter() - started)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+            scripts.append({"script": script, "status": "failed", "error": error[0]})
+            continue
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", path, "--help"],
+            capture_output=True,
+            text=True,
+        )
+        imports = parse_importtime(completed.stderr)
+        scripts.append(
+            {
+                "script": script,
+                "status": "ok",
+                "help_seconds": statistics.median(seconds),
+                "import_seconds": sum(seconds for _, seconds in imports),
+                "modules": len(imports),
+                "slowest_imports": sorted(imports, key=lambda item: -item[1])[:top],
+            }
+        )
+    return {"stage": "startup", "status": "ok", "scripts": scripts}
+
+
+def skip_reason(stage: str, args) -> str:
+    if stage == "qa" and not os.path.isdir(args.qa_model):
+        return f"no checkpoint at {args.qa_model}, run coach3a.py"
+    if stage == "summarize" and not os.path.isdir(args.summarize_model):
+        return f"no checkpoint at {args.summarize_model}, run coach4a.py"
+    return ""
+
+
+def benchmark(stage: str, args, threads: Optional[int] = None, extra=()) -> Dict:
+    """Runs a stage in a new process and returns its results. `extra`
+    arguments are passed to the stage's process."""
+    if stage == "startup":
+        return startup(args)
+    if stage == "threads":
+        return sweep_threads(args)
+    if stage == "precision":
+        return compare_precisions(args)
+    reason = skip_reason(stage, args)
+    if reason:
+        return {"stage": stage, "status": "skipped", "reason": reason}
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "result.json")
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            *sys.argv[1:],
+            "--ollama-url",
+            args.ollama_url,
+            "--worker",
+            stage,
+            "--worker-output",
+            output,
+            "--worker-started",
+            repr(time.time()),
+        ]
+        if threads is not None:
+            command.extend(["--threads", str(threads)])
+        command.extend(extra)
+        try:
+            completed = subprocess.run(
+                command, capture_output=True, text=True, timeout=args.timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {
+                "stage": stage,
+                "status": "failed",
+                "error": f"timed out after {args.timeout}s",
+            }
+        if completed.returncode != 0 or not os.path.exists(output):
+            error = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+            return {"stage": stage, "status": "failed", "error": error[0]}
+        with open(output, "r") as output_file:
+            return json.load(output_file)
+
+
+def thread_counts(cpu_count: int) -> List[int]:
+    """Powers of two up to the number of cores, and the number of cores."""
+    counts = [1]
+    while counts[-1] * 2 < cpu_count:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpu_count:
+        counts.append(cpu_count)
+    return counts
+
+
+def sweep_threads(args) -> Dict:
+    """Runs each of SWEEP_STAGES once per thread count and picks the count
+    with the highest warm throughput."""
+    counts = args.thread_counts or thread_counts(os.cpu_count() or 1)
+    sweeps = []
+    for stage in SWEEP_STAGES:
+        reason = skip_reason(stage, args)
+        if reason:
+            sweeps.append({"stage": stage, "status": "skipped", "reason": reason})
+            continue
+        runs = []
+        for count in counts:
+            result = benchmark(stage, args, threads=count)
+            run = {"threads": count, "status": result["status"]}
+            if result["status"] == "ok":
+                run["requests_per_second"] = result["requests_per_second"]
+                run["latency_p50"] = result["latency_p50"]
+            else:
+                run["error"] = result.get("error")
+            runs.append(run)
+        ok = [run for run in runs if run["status"] == "ok"]
+        if not ok:
+            sweeps.append({"stage": stage, "status": "failed", "runs": runs})
+            continue
+        best = max(ok, key=lambda run: run["requests_per_second"])
+        sweeps.append(
+            {
+                "stage": stage,
+                "status": "ok",
+                "runs": runs,
+                "best_threads": best["threads"],
+            }
+        )
+    return {"stage": "threads", "status": "ok", "sweeps": sweeps}
+
+
+def ranking_agreement(rankings: List[List[int]], reference: List[List[int]]) -> Dict:
+    """How often the top hit matches the reference's, and the mean share of
+    the reference's top k found in the top k."""
+    top1 = [ranked[:1] == expected[:1] for ranked, expected in zip(rankings, reference)]
+    overlap = [
+        len(set(ranked) & set(expected)) / len(expected)
+        for ranked, expected in zip(rankings, reference)
+    ]
+    return {
+        "top1_agreement": statistics.fmean(top1),
+        f"overlap_at_{RANKING_TOP_K}": statistics.fmean(overlap),
+    }
+
+
+def compare_precisions(args) -> Dict:
+    """Runs the search stage once per precision, and compares the rankings of
+    a fixed query set and the throughput against float32."""
+    runs = []
+    reference = None
+    for precision in PRECISIONS:
+        result = benchmark(
+            "search", args, extra=["--precision", precision, "--worker-rankings"]
+        )
+        run = {"precision": precision, "status": result["status"]}
+        if result["status"] != "ok":
+            run["error"] = result.get("error")
+            runs.append(run)
+            continue
+        rankings = result.pop("rankings")
+        if precision == "float32":
+            reference = (rankings, result)
+        run.update(
+            {
+                key: result[key]
+                for key in [
+                    "latency_p50",
+                    "requests_per_second",
+                    "peak_rss_bytes",
+                    "model_bytes",
+                ]
+            }
+        )
+        if reference is not None:
+            run.update(ranking_agreement(rankings, reference[0]))
+            run["speedup"] = (
+                result["requests_per_second"] / reference[1]["requests_per_second"]
+            )
+        runs.append(run)
+    if reference is None:
+        return {"stage": "precision", "status": "failed", "runs": runs}
+    return {"stage": "precision", "status": "ok", "runs": runs}
+
+
+def host_info() -> Dict:
+    info = {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+    try:
+        info["memory_bytes"] = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        pass
+    return info
+
+
+def metrics(result: Dict) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    """The compared (name, metric) values of a stage result, with 1 when
+    higher is worse and -1 when lower is worse."""
+    if result["status"] != "ok":
+        return {}
+    if result["stage"] == "startup":
+        return {
+            (script["script"], "help_seconds"): (script["help_seconds"], 1)
+            for script in result["scripts"]
+            if script["status"] == "ok"
+        }
+    if result["stage"] == "precision":
+        compared = {}
+        for run in result["runs"]:
+            if run["status"] != "ok":
+                continue
+            name = f"search@{run['precision']}"
+            compared[(name, "requests_per_second")] = (run["requests_per_second"], -1)
+            if "top1_agreement" in run:
+                compared[(name, "top1_agreement")] = (run["top1_agreement"], -1)
+        return compared
+    if result["stage"] == "threads":
+        return {
+            (sweep["stage"], f"rps_{run['threads']}_threads"): (
+                run["requests_per_second"],
+                -1,
+            )
+            for sweep in result["sweeps"]
+            for run in sweep.get("runs", [])
+            if run["status"] == "ok"
+        }
+    return {
+        (result["stage"], key): (result[key], direction) for key, direction in COMPARED
+    }
+
+
+def compare(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Prints each stage's change against a baseline run and returns the
+    regressions beyond the tolerance."""
+    previous = {}
+    for result in baseline["stages"]:
+        previous.update(metrics(result))
+    regressions = []
+    for result in results:
+        for (name, key), (value, direction) in metrics(result).items():
+            if (name, key) not in previous:
+                continue
+            before = previous[(name, key)][0]
+            change = (value - before) / before if before else 0.0
+            regressed = change * direction > tolerance
+            print(
+                f"{name:>10} {key:<20} {before:>10.4f}"
+                f" {value:>10.4f} {change:>+8.1%}{' REGRESSION' if regressed else ''}",
+                file=sys.stderr,
+            )
+            if regressed:
+                regressions.append(f"{name} {key} {change:+.1%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "-s",
+        "--stage",
+        dest="stages",
+        action="append",
+        choices=STAGES,
+        help="A stage to run, can be repeated. (default: all but threads)",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=50,
+        help="The number of warm requests timed per stage. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=3,
+        help="The number of requests, including the first, before timing. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="The seed of the synthetic workloads. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--corpus-size",
+        type=int,
+        default=1000,
+        help="The number of messages searched by the search stage. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--document-words",
+        type=int,
+        default=300,
+        help="The length of the documents summarized. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--facts",
+        type=str,
+        default="michael_jordan_facts.jsonl",
+        help="The facts the rag stage retrieves from. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--qa-model",
+        type=str,
+        default="team_knowledge_base/checkpoint-1500",
+        help="The coach3a.py checkpoint. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--summarize-model",
+        type=str,
+        default="team_legal/checkpoint-2000",
+        help="The coach4a.py checkpoint. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        help="The Ollama server for the chat and rag stages. (default: start an ollama_stub.py)",
+    )
+    parser.add_argument(
+        "--startup-runs",
+        type=int,
+        default=3,
+        help="The number of times each script's --help is timed. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="The precision of the sentence-transformer stages. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--thread-counts",
+        type=lambda value: [int(count) for count in value.split(",")],
+        help="The comma separated thread counts the threads stage sweeps. (default: powers of two up to the number of cores)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=1800.0,
+        help="Seconds before a stage is stopped. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="bench_results.json",
+        help="Where to write the results. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="An earlier --output to compare against.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="The relative slow down reported as a regression. (default: %(default)s)",
+    )
+    parser.add_argument("--worker", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-started", type=float, help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--worker-rankings", action="store_true", help=argparse.SUPPRESS
+    )
+
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    configure_runtime(args)
+
+    if args.worker:
+        result = run_stage(args.worker, args, args.worker_started)
+        result["threads"] = args.threads
+        with open(args.worker_output, "w") as output_file:
+            json.dump(result, output_file)
+        sys.exit(0)
+
+    stages = args.stages or DEFAULT_STAGES
+    stub = None
+    if args.ollama_url is None:
+        if any(stage in LLM_STAGES for stage in stages):
+            from ollama_stub import start_stub
+
+            stub = start_stub()
+            args.ollama_url = stub.url
+        else:
+            args.ollama_url = "http://localhost:11434"
+
+    results = []
+    for stage in stages:
+        result = benchmark(stage, args)
+        results.append(result)
+        if stage == "startup":
+            for script in result["scripts"]:
+                if script["status"] != "ok":
+                    print(
+                        f"{script['script']:>10} failed: {script['error']}",
+                        file=sys.stderr,
+                    )
+                    continue
+                print(
+                    f"{script['script']:>10} help={script['help_seconds']:.2f}s"
+                    f" imports={script['import_seconds']:.2f}s"
+                    f" slowest="
+                    + ",".join(
+                        f"{name}:{seconds:.2f}s"
+                        for name, seconds in script["slowest_imports"][:3]
+                    ),
+                    file=sys.stderr,
+                )
+        elif stage == "precision":
+            for run in result["runs"]:
+                if run["status"] != "ok":
+                    print(
+                        f"{run['precision']:>10} {run['status']}: {run['error']}",
+                        file=sys.stderr,
+                    )
+                    continue
+                print(
+                    f"{run['precision']:>10} p50={run['latency_p50'] * 1000:.1f}ms"
+                    f" rps={run['requests_per_second']:.1f}"
+                    f" model={run['model_bytes'] / 1e6:.0f}MB"
+                    f" peak_rss={run['peak_rss_bytes'] / 1e6:.0f}MB"
+                    + (
+                        f" speedup={run['speedup']:.2f}x"
+                        f" top1={run['top1_agreement']:.1%}"
+                        f" overlap@{RANKING_TOP_K}={run[f'overlap_at_{RANKING_TOP_K}']:.1%}"
+                        if "speedup" in run
+                        else ""
+                    ),
+                    file=sys.stderr,
+                )
+        elif stage == "threads":
+            for sweep in result["sweeps"]:
+                if sweep["status"] == "skipped":
+                    print(
+                        f"{sweep['stage']:>10} skipped: {sweep['reason']}",
+                        file=sys.stderr,
+                    )
+                    continue
+                for run in sweep["runs"]:
+                    if run["status"] != "ok":
+                        print(
+                            f"{sweep['stage']:>10} threads={run['threads']}"
+                            f" {run['status']}: {run['error']}",
+                            file=sys.stderr,
+                        )
+                        continue
+                    print(
+                        f"{sweep['stage']:>10} threads={run['threads']}"
+                        f" p50={run['latency_p50'] * 1000:.1f}ms"
+                        f" rps={run['requests_per_second']:.1f}"
+                        f"{' best' if run['threads'] == sweep.get('best_threads') else ''}",
+                        file=sys.stderr,
+                    )
+        elif result["status"] == "ok":
+            print(
+                f"{stage:>10} cold_start={result['cold_start_seconds']:.2f}s"
+                f" p50={result['latency_p50'] * 1000:.1f}ms"
+                f" p95={result['latency_p95'] * 1000:.1f}ms"
+                f" p99={result['latency_p99'] * 1000:.1f}ms"
+                f" rps={result['requests_per_second']:.1f}"
+                f" peak_rss={result['peak_rss_bytes'] / 1e6:.0f}MB",
+                file=sys.stderr,
+            )
+        else:
+            print(
+                f"{stage:>10} {result['status']}:"
+                f" {result.get('reason') or result.get('error')}",
+                file=sys.stderr,
+            )
+
+    if stub is not None:
+        stub.shutdown()
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "host": host_info(),
+        "config": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "corpus_size": args.corpus_size,
+            "document_words": args.document_words,
+            "precision": args.precision,
+            "threads": args.threads,
+            "interop_threads": args.interop_threads,
+            "ollama_url": None if stub is not None else args.ollama_url,
+        },
+        "stages": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=4)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
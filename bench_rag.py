@@ -0,0 +1,578 @@
+"""Benchmark the coach9a/coach9b RAG tools.
+
+For each embedder, the facts are ingested into a scratch chromadb collection
+and a fixed set of questions with known answers is run against it, recording
+ingest time, query latency and retrieval recall.
+
+With --context-tokens, each question is also answered end-to-end through
+the coach9b pipeline with and without context budgeting, recording prompt
+tokens, latency and whether the answering fact survived the budget.
+
+With --chunk-tokens, the facts are also ingested as chunks of that size and
+compared against the unchunked collection, recording retrieval precision and
+recall by parent fact and the size of the context and prompt.
+
+With --hybrid, retrieval is also run with the BM25 index fused in, and with
+the embedding call skipped for clear lexical matches, recording retrieval
+latency and hit rates on the evaluation and name/year questions.
+
+With --replay, a question log is replayed through the coach9b pipeline with
+its retrieval cache for several passes, recording cache hit rates and
+embed/retrieve latency once the cache is warm.
+
+With --url, a running `coach9b.py --serve` process is load tested instead,
+recording requests/sec, end-to-end latency and the server's per-stage
+latency.
+
+"""
+
+__usage__ = """
+examples:
+
+    Compare llama3 against the MiniLM sentence-transformers:
+
+        ./.venv/bin/python bench_rag.py -e llama3 -e sentence-transformers/all-MiniLM-L6-v2 -e sentence-transformers/multi-qa-MiniLM-L6-cos-v1
+
+    Run against a local Ollama stand-in (see ollama_stub.py):
+
+        ./.venv/bin/python bench_rag.py --ollama-url http://127.0.0.1:11435 -e llama3
+
+    Compare prompt size and latency with the full context against 200 and 100
+    token budgets, extracting only relevant sentences:
+
+        ./.venv/bin/python bench_rag.py -e llama3 --context-tokens 200 --context-tokens 100 --extract-sentences
+
+    Compare whole facts against 32 and 64 token chunks, expanding to whole
+    facts only when several of their chunks are retrieved:
+
+        ./.venv/bin/python bench_rag.py -e llama3 --chunk-tokens 32 --chunk-tokens 64 --expand-parents auto
+
+    Compare vector, hybrid and lexical-first retrieval:
+
+        ./.venv/bin/python bench_rag.py -e llama3 --hybrid --lexical-margin 2
+
+    Replay a question log three times through the retrieval cache:
+
+        ./.venv/bin/python bench_rag.py -e llama3 --replay questions.txt --passes 3
+
+    Load test a serving coach9b at several concurrency levels:
+
+        ./.venv/bin/python bench_rag.py --url http://127.0.0.1:8009 --requests 200 --concurrency 1 --concurrency 16
+"""
+
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+warnings.simplefilter(action="ignore", category=UserWarning)
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import chromadb
+from bm25 import BM25Index
+from chunking import Chunker
+from coach9a import ingest, read_facts
+from coach9b import EXPAND_MODES, RAGPipeline, RetrievalCache
+from context_budget import count_tokens
+from embedders import load_embedder
+
+# Questions about the Jordan facts set, each with the id of the fact that
+# answers it.
+EVAL_QUESTIONS: List[Tuple[str, str]] = [
+    ("What does Michael Jordan do now that he has stopped playing?", "mj1"),
+    ("When was Michael Jordan drafted by the Chicago Bulls?", "mj2"),
+    ("How many times was Jordan named the NBA's Most Valuable Player?", "mj2"),
+    ("Where did Jordan grow up and go to college?", "mj3"),
+    ("Which Olympic gold medals did Jordan win?", "mj3"),
+    ("Why did Jordan leave basketball in 1993?", "mj4"),
+    ("What was the Bulls' record in the 1995-96 season?", "mj4"),
+    ("Why is he called Air Jordan?", "mj5"),
+    ("Which shoes did Jordan endorse for Nike?", "mj5"),
+    ("When did Jordan play for the Washington Wizards?", "mj6"),
+    ("How many total points did Jordan score in his career?", "mj6"),
+    ("Which NBA team did Jordan own?", "mj7"),
+    ("What movie did Michael Jordan star in?", "mj8"),
+    ("When was Jordan elected to the Hall of Fame?", "mj8"),
+]
+
+
+# Name- and year-heavy questions, where lexical matching is expected to beat
+# dense similarity.
+LEXICAL_QUESTIONS: List[Tuple[str, str]] = [
+    ("What happened in 1993?", "mj4"),
+    ("What did Jordan do in 2006?", "mj7"),
+    ("What happened in 2016?", "mj8"),
+    ("Bobcats", "mj7"),
+    ("Space Jam", "mj8"),
+    ("Dream Team", "mj3"),
+    ("Wizards comeback", "mj6"),
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def benchmark_embedder(
+    spec: str,
+    facts: List[Tuple[str, str]],
+    directory: str,
+    k: int = 5,
+    ollama_url: str = None,
+    context_tokens: List[int] = None,
+    extract_sentences: bool = False,
+    replay: List[str] = None,
+    passes: int = 2,
+    chunk_tokens: List[int] = None,
+    chunk_overlap: int = 16,
+    expand_parents: str = "auto",
+    lexical_margins: List[float] = None,
+) -> List[Dict]:
+    load_started = time.perf_counter()
+    embedder = load_embedder(spec, ollama_url=ollama_url)
+    load_seconds = time.perf_counter() - load_started
+
+    client = chromadb.PersistentClient(path=directory)
+    collection_name = "bench_" + "".join(c if c.isalnum() else "_" for c in spec)
+    collection = client.get_or_create_collection(name=collection_name)
+
+    stats = ingest(collection, embedder, facts)
+
+    embed_seconds = []
+    query_seconds = []
+    hits_at_1 = 0
+    hits_at_k = 0
+    for question, expected in EVAL_QUESTIONS:
+        started = time.perf_counter()
+        vector = embedder.embed_query(question)
+        embedded = time.perf_counter()
+        result = collection.query(query_embeddings=[vector], n_results=k)
+        embed_seconds.append(embedded - started)
+        query_seconds.append(time.perf_counter() - embedded)
+
+        ids = result["ids"][0]
+        hits_at_1 += int(ids[:1] == [expected])
+        hits_at_k += int(expected in ids)
+
+    results = [
+        {
+            "embedder": embedder.name,
+            "dimensions": len(vector),
+            "load_seconds": load_seconds,
+            "ingest_seconds": stats["seconds"],
+            "ingest_docs_per_second": stats["docs_per_second"],
+            "query_embed_p50": statistics.median(embed_seconds),
+            "query_embed_p95": percentile(embed_seconds, 0.95),
+            "query_search_p50": statistics.median(query_seconds),
+            "recall_at_1": hits_at_1 / len(EVAL_QUESTIONS),
+            f"recall_at_{k}": hits_at_k / len(EVAL_QUESTIONS),
+        }
+    ]
+
+    if context_tokens:
+        for budget in [0] + context_tokens:
+            results.append(
+                benchmark_context(
+                    collection, embedder, budget, extract_sentences, k, ollama_url
+                )
+            )
+
+    if chunk_tokens:
+        for size in [0] + chunk_tokens:
+            chunked = collection
+            if size:
+                chunked = client.get_or_create_collection(
+                    name=f"{collection_name}_chunks_{size}"
+                )
+                ingest(
+                    chunked,
+                    embedder,
+                    facts,
+                    chunker=Chunker(size, min(chunk_overlap, size // 2)),
+                )
+            results.append(
+                benchmark_chunking(
+                    chunked, embedder, size, expand_parents, k, ollama_url
+                )
+            )
+
+    if lexical_margins is not None:
+        index = BM25Index.from_collection(collection)
+        for lexical, margin in [(None, 0.0), (index, 0.0)] + [
+            (index, margin) for margin in lexical_margins
+        ]:
+            results.append(benchmark_hybrid(collection, embedder, lexical, margin, k))
+
+    if replay:
+        results.extend(
+            benchmark_cache(client, collection, embedder, replay, passes, k, ollama_url)
+        )
+
+    return results
+
+
+def benchmark_context(
+    collection,
+    embedder,
+    context_tokens: int,
+    extract_sentences: bool,
+    k: int = 5,
+    ollama_url: str = None,
+) -> Dict:
+    pipeline = RAGPipeline(
+        collection,
+        embedder,
+        ollama_url=ollama_url,
+        k=k,
+        context_tokens=context_tokens,
+        extract_sentences=extract_sentences and context_tokens > 0,
+    )
+    prompt_tokens = []
+    totals = []
+    generates = []
+    kept = 0
+    for question, expected in EVAL_QUESTIONS:
+        response = pipeline.answer(question)
+        prompt_tokens.append(response["prompt_tokens"])
+        totals.append(response["timings"]["total"])
+        generates.append(response["timings"]["generate"])
+        kept += int(any(doc["id"] == expected for doc in response["context"]))
+
+    return {
+        "embedder": embedder.name,
+        "context_tokens": context_tokens,
+        "extract_sentences": pipeline.extract_sentences,
+        "prompt_tokens_mean": statistics.fmean(prompt_tokens),
+        "prompt_tokens_max": max(prompt_tokens),
+        "latency_p50": statistics.median(totals),
+        "generate_p50": statistics.median(generates),
+        "answer_fact_in_context": kept / len(EVAL_QUESTIONS),
+    }
+
+
+def benchmark_chunking(
+    collection,
+    embedder,
+    chunk_tokens: int,
+    expand_parents: str = "auto",
+    k: int = 5,
+    ollama_url: str = None,
+) -> Dict:
+    """Measures retrieval precision and recall by parent fact, and the size of
+    the context that reaches the prompt."""
+    pipeline = RAGPipeline(
+        collection,
+        embedder,
+        ollama_url=ollama_url,
+        k=k,
+        expand_parents=expand_parents,
+    )
+    precisions = []
+    hits = 0
+    context_tokens = []
+    prompt_tokens = []
+    for question, expected in EVAL_QUESTIONS:
+        result = collection.query(
+            query_embeddings=[embedder.embed_query(question)],
+            n_results=k,
+            include=["metadatas"],
+        )
+        parents = [
+            (metadata or {}).get("parent_id", id)
+            for id, metadata in zip(result["ids"][0], result["metadatas"][0])
+        ]
+        precisions.append(parents.count(expected) / len(parents))
+        hits += int(expected in parents)
+
+        response = pipeline.answer(question)
+        context_tokens.append(
+            sum(count_tokens(doc["page_content"]) for doc in response["context"])
+        )
+        prompt_tokens.append(response["prompt_tokens"])
+
+    return {
+        "embedder": embedder.name,
+        "chunk_tokens": chunk_tokens,
+        "expand_parents": expand_parents if chunk_tokens else None,
+        "documents": collection.count(),
+        f"precision_at_{k}": statistics.fmean(precisions),
+        f"recall_at_{k}": hits / len(EVAL_QUESTIONS),
+        "context_tokens_mean": statistics.fmean(context_tokens),
+        "prompt_tokens_mean": statistics.fmean(prompt_tokens),
+        "prompt_tokens_max": max(prompt_tokens),
+    }
+
+
+def benchmark_hybrid(
+    collection,
+    embedder,
+    lexical: BM25Index = None,
+    lexical_margin: float = 0.0,
+    k: int = 5,
+) -> Dict:
+    """Measures retrieval alone, without generation, for one retrieval mode."""
+    pipeline = RAGPipeline(
+        collection, embedder, k=k, lexical=lexical, lexical_margin=lexical_margin
+    )
+    loop = asyncio.new_event_loop()
+    results = {
+        "embedder": embedder.name,
+        "mode": "vector" if lexical is None else "hybrid",
+        "lexical_margin": lexical_margin,
+    }
+    for name, questions in [("eval", EVAL_QUESTIONS), ("lexical", LEXICAL_QUESTIONS)]:
+        latencies = []
+        hits_at_1 = 0
+        hits_at_k = 0
+        skipped = 0
+        for question, expected in questions:
+            timings = {}
+            context, retrieval = loop.run_until_complete(
+                pipeline.retrieve(question, timings)
+            )
+            latencies.append(sum(timings.values()))
+            parents = [parent_id for _, _, parent_id in context]
+            hits_at_1 += int(parents[:1] == [expected])
+            hits_at_k += int(expected in parents)
+            skipped += int(retrieval == "lexical")
+        results.update(
+            {
+                f"{name}_recall_at_1": hits_at_1 / len(questions),
+                f"{name}_recall_at_{k}": hits_at_k / len(questions),
+                f"{name}_retrieve_p50": statistics.median(latencies),
+                f"{name}_embedding_skipped": skipped / len(questions),
+            }
+        )
+    loop.close()
+    return results
+
+
+def benchmark_cache(
+    client,
+    collection,
+    embedder,
+    questions: List[str],
+    passes: int = 2,
+    k: int = 5,
+    ollama_url: str = None,
+) -> List[Dict]:
+    cache = RetrievalCache(client, collection.name)
+    pipeline = RAGPipeline(
+        collection, embedder, ollama_url=ollama_url, k=k, cache=cache
+    )
+
+    results = []
+    for number in range(1, passes + 1):
+        before = cache.summary()
+        retrievals = []
+        for question in questions:
+            timings = pipeline.answer(question)["timings"]
+            retrievals.append(timings["embed"] + timings["retrieve"])
+        after = cache.summary()
+
+        lookups = len(questions)
+        results.append(
+            {
+                "embedder": embedder.name,
+                "pass": number,
+                "questions": lookups,
+                "embedding_hit_rate": (
+                    after["embedding_hits"] - before["embedding_hits"]
+                )
+                / lookups,
+                "result_hit_rate": (after["result_hits"] - before["result_hits"])
+                / lookups,
+                "embed_and_retrieve_p50": statistics.median(retrievals),
+                "embed_and_retrieve_mean": statistics.fmean(retrievals),
+            }
+        )
+    return results
+
+
+def load_test(url: str, requests: int, concurrency: int) -> Dict:
+    """Posts the evaluation questions round-robin to a serving coach9b."""
+
+    def ask(index: int) -> float:
+        question = EVAL_QUESTIONS[index % len(EVAL_QUESTIONS)][0]
+        request = urllib.request.Request(
+            f"{url}/ask",
+            data=json.dumps({"query": question}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        started = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(ask, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        stats = json.load(response)
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": percentile(latencies, 0.95),
+        "server_stages": stats["stages"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "-e",
+        "--embedder",
+        dest="embedders",
+        action="append",
+        help="An embedding model to benchmark, may be repeated. (default: llama3 and sentence-transformers/all-MiniLM-L6-v2)",
+    )
+    parser.add_argument(
+        "-f",
+        "--facts",
+        type=str,
+        default="michael_jordan_facts.jsonl",
+        help="A JSON lines file of facts with id and text fields. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-k",
+        type=int,
+        default=5,
+        help="The number of documents retrieved per question. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        action="append",
+        help="Also answer each question with this context token budget and with the full context, may be repeated.",
+    )
+    parser.add_argument(
+        "--extract-sentences",
+        action="store_true",
+        help="With --context-tokens, keep only the sentences relevant to the question.",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        action="append",
+        help="Also ingest the facts as chunks of this many tokens and compare them with whole facts, may be repeated.",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=16,
+        help="The number of tokens repeated between consecutive chunks. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--expand-parents",
+        choices=EXPAND_MODES,
+        default="auto",
+        help="When chunked retrieval is expanded to whole facts, see coach9b.py. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--hybrid",
+        action="store_true",
+        help="Also compare vector retrieval with BM25 hybrid retrieval.",
+    )
+    parser.add_argument(
+        "--lexical-margin",
+        type=float,
+        action="append",
+        help="With --hybrid, also skip embedding for clear BM25 matches at this margin, may be repeated.",
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        help="A file of questions, one per line, to replay through the retrieval cache.",
+    )
+    parser.add_argument(
+        "--passes",
+        type=int,
+        default=2,
+        help="The number of times the replay file is run. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--url",
+        type=str,
+        help="Load test a running coach9b.py --serve at this address instead.",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=100,
+        help="The number of requests sent in a load test. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        action="append",
+        help="The number of concurrent clients in a load test, may be repeated. (default: 8)",
+    )
+    args = parser.parse_args()
+
+    if args.url:
+        results = [
+            load_test(args.url, args.requests, concurrency)
+            for concurrency in args.concurrency or [8]
+        ]
+    else:
+        embedders = args.embedders or [
+            "llama3",
+            "sentence-transformers/all-MiniLM-L6-v2",
+        ]
+        facts = list(read_facts(args.facts))
+
+        replay = None
+        if args.replay:
+            with open(args.replay, "r") as replay_file:
+                replay = [line.strip() for line in replay_file if line.strip()]
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for spec in embedders:
+                results.extend(
+                    benchmark_embedder(
+                        spec,
+                        facts,
+                        directory,
+                        k=args.k,
+                        ollama_url=args.ollama_url,
+                        context_tokens=args.context_tokens,
+                        extract_sentences=args.extract_sentences,
+                        replay=replay,
+                        passes=args.passes,
+                        chunk_tokens=args.chunk_tokens,
+                        chunk_overlap=args.chunk_overlap,
+                        expand_parents=args.expand_parents,
+                        lexical_margins=(
+                            (args.lexical_margin or []) if args.hybrid else None
+                        ),
+                    )
+                )
+
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,154 @@
+"""An in-process BM25 index over the documents of a chromadb collection.
+
+coach9a.py keeps the index up to date as it writes the collection and saves
+it next to the database, and coach9b.py fuses its rankings with the vector
+search (see reciprocal_rank_fusion). Names and years, which dense embeddings
+match poorly, are matched exactly here.
+
+"""
+
+import json
+import math
+import os
+import tempfile
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from context_budget import STOPWORDS, WORD_PATTERN
+
+
+def index_path(db: str, collection_name: str) -> str:
+    return os.path.join(db, f"{collection_name}.bm25.json")
+
+
+def analyze(text: str) -> List[str]:
+    return [
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """An inverted index scoring documents with Okapi BM25.
+
+    `version` is the collection version the index was last synced with, so
+    readers can tell when it is stale.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = 0
+        self.documents: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, id: str, text: str):
+        self.remove([id])
+        counts = Counter(analyze(text))
+        self.documents[id] = dict(counts)
+        self.lengths[id] = sum(counts.values())
+        self.total_length += self.lengths[id]
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[id] = count
+
+    def remove(self, ids: Iterable[str]):
+        for id in ids:
+            counts = self.documents.pop(id, None)
+            if counts is None:
+                continue
+            self.total_length -= self.lengths.pop(id)
+            for term in counts:
+                posting = self.postings[term]
+                del posting[id]
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Returns up to k (id, score) pairs, best first."""
+        if not self.documents:
+            return []
+        average_length = self.total_length / len(self.documents)
+        scores: Dict[str, float] = {}
+        for term in set(analyze(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(
+                1 + (len(self.documents) - len(posting) + 0.5) / (len(posting) + 0.5)
+            )
+            for id, count in posting.items():
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.lengths[id] / average_length
+                )
+                scores[id] = scores.get(id, 0.0) + idf * count * (self.k1 + 1) / (
+                    count + norm
+                )
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def save(self, path: str):
+        """Writes the index to a temporary file and renames it over `path`, so
+        a serving coach9b.py never reloads a partly written index."""
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".", suffix=".tmp"
+        )
+        with os.fdopen(descriptor, "w") as index_file:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "version": self.version,
+                    "documents": self.documents,
+                },
+                index_file,
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r") as index_file:
+            data = json.load(index_file)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.version = data["version"]
+        for id, counts in data["documents"].items():
+            index.documents[id] = counts
+            index.lengths[id] = sum(counts.values())
+            index.total_length += index.lengths[id]
+            for term, count in counts.items():
+                index.postings.setdefault(term, {})[id] = count
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 1000) -> "BM25Index":
+        """Builds an index of every document in a collection."""
+        index = cls()
+        offset = 0
+        while True:
+            batch = collection.get(
+                include=["documents"], limit=batch_size, offset=offset
+            )
+            for id, text in zip(batch["ids"], batch["documents"]):
+                index.add(id, text)
+            if len(batch["ids"]) < batch_size:
+                break
+            offset += batch_size
+        return index
+
+
+def confident(hits: List[Tuple[str, float]], margin: float) -> bool:
+    """True when the best lexical hit outscores the runner-up by `margin`
+    times, which is when the vector search rarely changes the answer."""
+    if not hits or hits[0][1] <= 0:
+        return False
+    return len(hits) == 1 or hits[0][1] >= margin * hits[1][1]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merges ranked id lists, scoring each id by the sum of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda id: -scores[id])
@@ -1,7 +1,13 @@
 """
 cache.py
 
-This file will cache the models and datasets used in this project.
+This file will cache the models and datasets used in this project, or with
+--profile just the ones the named scripts need. What will be downloaded and
+how much disk it takes is printed before anything is fetched.
+
+Models and datasets are fetched concurrently. Anything already complete in the local cache
+is skipped, and a manifest of every cached file with its size and sha256 is
+written at the end.
 
 """
 
@@ -19,6 +25,26 @@ examples:
     Using the rust-backed download accelerator:
 
         HF_HUB_ENABLE_HF_TRANSFER=1 ./.venv/bin/python cache.py
+
+    Fetch 8 artifacts at a time and re-hash every file into the manifest:
+
+        ./.venv/bin/python cache.py --workers 8 --verify --manifest cache_manifest.json
+
+    Only cache what the coach7 search and coach6 NER scripts need, after
+    checking the download size:
+
+        ./.venv/bin/python cache.py --profile search,ner --dry-run
+
+        ./.venv/bin/python cache.py --profile search,ner
+
+    Also save squad and billsum tokenized for coach3a.py and coach4a.py
+    --tokenized, so training starts without a tokenization pass:
+
+        ./.venv/bin/python cache.py --profile qa,summarize --materialize
+
+    Try it against a local stand-in hub (see hub_stub.py) with a scratch cache:
+
+        HF_HOME=/tmp/hub_stub_cache ./.venv/bin/python cache.py --endpoint http://127.0.0.1:8011 --skip-ollama --skip-datasets
 """
 
 import os
@@ -27,9 +53,533 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from datasets import load_dataset
-from huggingface_hub import snapshot_download, login
+import hashlib
+import importlib
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import ollama
+from tokenized import SEED, is_materialized, metadata, save_tokenized, tokenized_path
+
+if TYPE_CHECKING:
+    from huggingface_hub import HfApi
+
+MODELS = [
+    "distilbert/distilbert-base-uncased",
+    "google-t5/t5-small",
+    "MaartenGr/BERTopic_Wikipedia",
+    "sentence-transformers/all-MiniLM-L6-v2",
+    "sentence-transformers/multi-qa-MiniLM-L6-cos-v1",
+    "sentence-transformers/sentence-t5-xxl",
+    "tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super",
+    "tomaarsen/span-marker-bert-base-fewnerd-fine-super",
+    "bert-base-cased",
+    "xlm-roberta-base",
+    "meta-llama/Meta-Llama-3-8B-Instruct",
+]
+# Download sizes in bytes, the Ollama API only reports them once pulled.
+OLLAMA_MODELS = {
+    "llama3": 4_700_000_000,
+    "llama3:8b": 4_700_000_000,
+    "llama3:70b": 39_000_000_000,
+}
+# Hub repo and the split of each dataset, and the training script that
+# tokenizes it for --materialize.
+DATASETS = {
+    "squad": ("rajpurkar/squad", "train[:10100]", "coach3a"),
+    "billsum": ("FiscalNote/billsum", "train[:10000]", "coach4a"),
+}
+
+# What each script needs, so a host running only some of them can cache just
+# that subset with --profile.
+PROFILES = {
+    "similarity": {
+        "scripts": ["coach1.py"],
+        "models": ["sentence-transformers/multi-qa-MiniLM-L6-cos-v1"],
+    },
+    "intent": {
+        "scripts": ["coach2.py"],
+        "models": ["sentence-transformers/multi-qa-MiniLM-L6-cos-v1"],
+    },
+    "intent-xxl": {
+        "scripts": ["coach2.py -m sentence-transformers/sentence-t5-xxl"],
+        "models": ["sentence-transformers/sentence-t5-xxl"],
+    },
+    "qa": {
+        "scripts": ["coach3a.py", "coach3b.py"],
+        "models": ["distilbert/distilbert-base-uncased"],
+        "datasets": ["squad"],
+    },
+    "summarize": {
+        "scripts": ["coach4a.py", "coach4b.py"],
+        "models": ["google-t5/t5-small"],
+        "datasets": ["billsum"],
+    },
+    "topics": {
+        "scripts": ["coach5.py"],
+        "models": [
+            "MaartenGr/BERTopic_Wikipedia",
+            "sentence-transformers/all-MiniLM-L6-v2",
+        ],
+    },
+    "ner": {
+        "scripts": ["coach6.py"],
+        "models": [
+            "tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super",
+            "xlm-roberta-base",
+        ],
+    },
+    "ner-bert": {
+        "scripts": ["coach6.py -m tomaarsen/span-marker-bert-base-fewnerd-fine-super"],
+        "models": [
+            "tomaarsen/span-marker-bert-base-fewnerd-fine-super",
+            "bert-base-cased",
+        ],
+    },
+    "search": {
+        "scripts": ["coach7a.py", "coach7b.py"],
+        "models": ["sentence-transformers/all-MiniLM-L6-v2"],
+    },
+    "chat": {
+        "scripts": ["coach8.py"],
+        "models": ["sentence-transformers/all-MiniLM-L6-v2"],
+        "ollama": ["llama3"],
+    },
+    "rag": {
+        "scripts": ["coach9a.py", "coach9b.py"],
+        "ollama": ["llama3"],
+    },
+    "agent": {
+        "scripts": ["coach10.py"],
+        "models": ["meta-llama/Meta-Llama-3-8B-Instruct"],
+    },
+    "agent-ollama": {
+        "scripts": ["coach10.py --engine ollama"],
+        "ollama": ["llama3"],
+    },
+    "llama3-large": {
+        "scripts": ["coach8.py -m llama3:8b", "coach8.py -m llama3:70b"],
+        "ollama": ["llama3:8b", "llama3:70b"],
+    },
+}
+PROFILES["all"] = {
+    "scripts": ["every script"],
+    "models": MODELS,
+    "datasets": list(DATASETS),
+    "ollama": list(OLLAMA_MODELS),
+}
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def format_bytes(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1000:
+            return f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} TB"
+
+
+def repo_cache_dir(repo_id: str, repo_type: str = "model") -> str:
+    from huggingface_hub import constants
+
+    return os.path.join(
+        constants.HF_HUB_CACHE, f"{repo_type}s--{repo_id.replace('/', '--')}"
+    )
+
+
+def directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                # Snapshot files link to blobs that are already counted.
+                continue
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    return total
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as content:
+        for block in iter(lambda: content.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Progress:
+    """Tracks bytes fetched per artifact and prints a status line for each
+    active one every `interval` seconds."""
+
+    def __init__(self, total: int, interval: float = 5.0, log_level: int = 1):
+        self.total = total
+        self.interval = interval
+        self.log_level = log_level
+        self.lock = threading.Lock()
+        self.finished = 0
+        self.active: Dict[str, Dict] = {}
+        self.stopped = threading.Event()
+
+    def log(self, message: str):
+        if self.log_level > 0:
+            with self.lock:
+                sys.stderr.write(message + "\n")
+                sys.stderr.flush()
+
+    def start(self, name: str, total_bytes: int, measure):
+        """`measure` is called to read the bytes fetched so far."""
+        with self.lock:
+            self.active[name] = {
+                "started": time.perf_counter(),
+                "total": total_bytes,
+                "measure": measure,
+            }
+        self.log(f"start {name} ({format_bytes(total_bytes)})")
+
+    def finish(self, name: str, status: str, fetched: int = 0, seconds: float = 0.0):
+        with self.lock:
+            self.active.pop(name, None)
+            self.finished += 1
+            finished = self.finished
+        detail = ""
+        if seconds:
+            detail = f" {format_bytes(fetched)} in {seconds:.1f}s"
+            if fetched:
+                detail += f" ({format_bytes(fetched / seconds)}/s)"
+        self.log(f"[{finished}/{self.total}] {status} {name}{detail}")
+
+    def report(self):
+        with self.lock:
+            active = list(self.active.items())
+        for name, state in active:
+            fetched = state["measure"]()
+            elapsed = time.perf_counter() - state["started"]
+            total = f"/{format_bytes(state['total'])}" if state["total"] else ""
+            self.log(
+                f"  {name}: {format_bytes(fetched)}{total}"
+                f" ({format_bytes(fetched / elapsed if elapsed else 0)}/s)"
+            )
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def __enter__(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+
+
+def hub_files(snapshot: str, verify: bool = False) -> List[Dict]:
+    """Lists the files of a cached snapshot with their size and sha256. The
+    sha256 of LFS files is their blob name, unless `verify` is set."""
+    files = []
+    for root, _, names in os.walk(snapshot):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            blob = os.path.realpath(path)
+            blob_name = os.path.basename(blob)
+            if SHA256_PATTERN.match(blob_name) and not verify:
+                sha256 = blob_name
+            else:
+                sha256 = sha256_file(blob)
+            entry = {
+                "path": os.path.relpath(path, snapshot),
+                "size": os.path.getsize(blob),
+                "sha256": sha256,
+            }
+            if SHA256_PATTERN.match(blob_name) and sha256 != blob_name:
+                entry["error"] = "sha256 mismatch"
+            files.append(entry)
+    return files
+
+
+def plan_hub(api: "HfApi", repo_id: str, repo_type: str) -> Dict:
+    """Looks up a model or dataset snapshot's current revision and file sizes,
+    and how much of it is not in the local cache yet."""
+    from huggingface_hub import snapshot_download
+    from huggingface_hub.errors import LocalEntryNotFoundError
+
+    info = api.repo_info(repo_id, repo_type=repo_type, files_metadata=True)
+    sizes = {sibling.rfilename: sibling.size or 0 for sibling in info.siblings}
+    try:
+        local = snapshot_download(repo_id, repo_type=repo_type, local_files_only=True)
+    except LocalEntryNotFoundError:
+        local = None
+
+    needed = sum(sizes.values())
+    if local is not None and os.path.basename(local) == info.sha:
+        needed = sum(
+            size
+            for path, size in sizes.items()
+            if not os.path.isfile(os.path.join(local, path))
+            or os.path.getsize(os.path.join(local, path)) != size
+        )
+    return {
+        "kind": repo_type,
+        "name": repo_id,
+        "revision": info.sha,
+        "size": sum(sizes.values()),
+        "needed": needed,
+        "complete": local is not None
+        and os.path.basename(local) == info.sha
+        and needed == 0,
+        "local": local,
+    }
+
+
+def plan_ollama(client: ollama.Client, model: str) -> Dict:
+    """Checks whether the Ollama server already has a model. Sizes are the
+    last known download sizes."""
+    try:
+        client.show(model)
+        complete = True
+    except ollama.ResponseError:
+        complete = False
+    size = OLLAMA_MODELS.get(model, 0)
+    return {
+        "kind": "ollama",
+        "name": model,
+        "size": size,
+        "needed": 0 if complete else size,
+        "complete": complete,
+    }
+
+
+def plan(
+    hub: List[Tuple[str, str]],
+    ollama_models: List[str],
+    api: "HfApi",
+    client: ollama.Client,
+    workers: int = 4,
+) -> List[Dict]:
+    """Plans (repo_id, repo_type) hub snapshots and Ollama models
+    concurrently. Artifacts that cannot be looked up are returned with an
+    "error" instead of stopping the others."""
+    plans = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (repo_type, repo_id, executor.submit(plan_hub, api, repo_id, repo_type))
+            for repo_id, repo_type in hub
+        ]
+        futures += [
+            ("ollama", model, executor.submit(plan_ollama, client, model))
+            for model in ollama_models
+        ]
+        for kind, name, future in futures:
+            try:
+                plans.append(future.result())
+            except Exception as error:
+                plans.append(
+                    {
+                        "kind": kind,
+                        "name": name,
+                        "size": 0,
+                        "needed": 0,
+                        "complete": False,
+                        "error": str(error),
+                    }
+                )
+    return plans
+
+
+def fetch_hub(
+    api: "HfApi", plan: Dict, progress: Progress, verify: bool = False
+) -> Dict:
+    """Downloads a planned model or dataset snapshot unless the cached copy is
+    already complete for the current revision."""
+    from huggingface_hub import snapshot_download
+
+    repo_id, repo_type = plan["name"], plan["kind"]
+    name = f"{repo_type}:{repo_id}"
+    result = {"kind": repo_type, "name": repo_id, "revision": plan["revision"]}
+
+    if plan["complete"]:
+        progress.finish(name, "complete")
+        return {
+            **result,
+            "status": "complete",
+            "files": hub_files(plan["local"], verify),
+        }
+
+    started = time.perf_counter()
+    cache_dir = repo_cache_dir(repo_id, repo_type)
+    before = directory_bytes(cache_dir)
+    progress.start(name, plan["needed"], lambda: directory_bytes(cache_dir) - before)
+    snapshot = snapshot_download(repo_id, repo_type=repo_type, endpoint=api.endpoint)
+    seconds = time.perf_counter() - started
+    fetched = directory_bytes(cache_dir) - before
+    progress.finish(name, "downloaded", fetched, seconds)
+    return {
+        **result,
+        "status": "downloaded",
+        "seconds": seconds,
+        "bytes": fetched,
+        "bytes_per_second": fetched / seconds if seconds else 0,
+        "files": hub_files(snapshot, verify),
+    }
+
+
+def fetch_ollama(client: ollama.Client, plan: Dict, progress: Progress) -> Dict:
+    """Pulls a planned Ollama model unless it is already present. Ollama
+    resumes partially downloaded layers itself."""
+    model = plan["name"]
+    name = f"ollama:{model}"
+    if plan["complete"]:
+        progress.finish(name, "complete")
+        return {"kind": "ollama", "name": model, "status": "complete"}
+
+    started = time.perf_counter()
+    layers: Dict[str, Tuple[int, int]] = {}
+    progress.start(
+        name, plan["needed"], lambda: sum(done for done, _ in list(layers.values()))
+    )
+    for update in client.pull(model, stream=True):
+        digest = update.get("digest")
+        if digest and update.get("total"):
+            layers[digest] = (update.get("completed") or 0, update["total"])
+    seconds = time.perf_counter() - started
+    fetched = sum(total for _, total in layers.values())
+    progress.finish(name, "downloaded", fetched, seconds)
+    return {
+        "kind": "ollama",
+        "name": model,
+        "status": "downloaded",
+        "seconds": seconds,
+        "bytes": fetched,
+        "bytes_per_second": fetched / seconds if seconds else 0,
+    }
+
+
+def ollama_manifest(client: ollama.Client) -> Dict[str, Dict]:
+    models = {}
+    for model in client.list()["models"]:
+        name = model.get("model") or model.get("name")
+        models[name] = {"size": model.get("size"), "digest": model.get("digest")}
+    return models
+
+
+def prefetch(
+    plans: List[Dict],
+    api: "HfApi",
+    client: ollama.Client,
+    workers: int = 4,
+    verify: bool = False,
+    interval: float = 5.0,
+    log_level: int = 1,
+) -> List[Dict]:
+    """Fetches planned artifacts with up to `workers` at a time. Failures,
+    including artifacts that could not be planned, are recorded in the
+    returned entries instead of stopping the other downloads."""
+    results = [
+        {
+            "kind": planned["kind"],
+            "name": planned["name"],
+            "status": "failed",
+            "error": planned["error"],
+        }
+        for planned in plans
+        if "error" in planned
+    ]
+    with Progress(len(plans) - len(results), interval, log_level) as progress:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for planned in plans:
+                if "error" in planned:
+                    continue
+                if planned["kind"] == "ollama":
+                    future = executor.submit(fetch_ollama, client, planned, progress)
+                else:
+                    future = executor.submit(
+                        fetch_hub, api, planned, progress, verify=verify
+                    )
+                futures[future] = planned
+            for future in as_completed(futures):
+                planned = futures[future]
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    progress.finish(f"{planned['kind']}:{planned['name']}", "failed")
+                    progress.log(f"  {error}")
+                    results.append(
+                        {
+                            "kind": planned["kind"],
+                            "name": planned["name"],
+                            "status": "failed",
+                            "error": str(error),
+                        }
+                    )
+
+    if any(r["kind"] == "ollama" and r["status"] != "failed" for r in results):
+        pulled = ollama_manifest(client)
+        for result in results:
+            if result["kind"] == "ollama":
+                result.update(pulled.get(result["name"], {}))
+    return results
+
+
+def materialize(
+    name: str, root: str, num_proc: Optional[int] = None, log_level: int = 1
+) -> Dict:
+    """Tokenizes a cached dataset with its training script's tokenize_dataset
+    and saves it under `root` for --tokenized. Already materialized datasets
+    are left alone."""
+    from datasets import load_dataset
+    from transformers import AutoTokenizer
+
+    repo_id, split, script_name = DATASETS[name]
+    script = importlib.import_module(script_name)
+    expected = metadata(repo_id, split, script.MODEL, script.MAX_LENGTH)
+    path = tokenized_path(root, name, script.MODEL, script.MAX_LENGTH)
+    result = {"kind": "tokenized", "name": name, "path": path}
+    if is_materialized(path, expected):
+        return {**result, "status": "complete"}
+
+    started = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(script.MODEL)
+    tokenized_dataset = script.tokenize_dataset(
+        load_dataset(repo_id, split=split),
+        tokenizer,
+        script.MAX_LENGTH,
+        seed=SEED,
+        num_proc=num_proc,
+    )
+    save_tokenized(tokenized_dataset, path, expected)
+    seconds = time.perf_counter() - started
+    if log_level > 0:
+        print(f"materialized {name} to {path} in {seconds:.1f}s", file=sys.stderr)
+    return {
+        **result,
+        "status": "materialized",
+        "seconds": seconds,
+        "bytes": directory_bytes(path),
+        "rows": tokenized_dataset.num_rows,
+    }
+
+
+def select(profiles: List[str]) -> Dict[str, List[str]]:
+    """Merges the models, datasets and Ollama models of the named profiles,
+    keeping their order and dropping duplicates."""
+    unknown = [name for name in profiles if name not in PROFILES]
+    if unknown:
+        raise ValueError(
+            f"Unknown profile {', '.join(unknown)}, expected one of {', '.join(PROFILES)}"
+        )
+    selected = {"models": [], "datasets": [], "ollama": []}
+    for name in profiles:
+        for kind, items in selected.items():
+            items.extend(x for x in PROFILES[name].get(kind, []) if x not in items)
+    return selected
 
 
 if __name__ == "__main__":
@@ -53,48 +603,207 @@ if __name__ == "__main__":
         action="append_const",
         const=-1,
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="The number of artifacts downloaded at a time. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=str,
+        default=os.getenv("HF_ENDPOINT", "https://huggingface.co"),
+        help="The Hugging Face Hub to download from. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="cache_manifest.json",
+        help="Where to write the sizes and hashes of everything cached. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-hash every cached file for the manifest instead of trusting LFS blob names.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between progress reports of active downloads. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default="all",
+        help="Comma separated profiles to cache, see --list-profiles. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--list-profiles",
+        action="store_true",
+        help="Show the profiles, the scripts they serve and what they cache.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show what would be downloaded and how much disk it needs.",
+    )
+    parser.add_argument(
+        "--materialize",
+        action="store_true",
+        help="Also save the datasets tokenized for coach3a.py and coach4a.py --tokenized.",
+    )
+    parser.add_argument(
+        "--tokenized-dir",
+        type=str,
+        default="tokenized",
+        help="Where the tokenized datasets are saved. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--num-proc",
+        type=int,
+        help="The number of processes tokenizing each dataset. (default: one)",
+    )
+    parser.add_argument(
+        "--skip-ollama",
+        action="store_true",
+        help="Do not pull the Ollama models.",
+    )
+    parser.add_argument(
+        "--skip-datasets",
+        action="store_true",
+        help="Do not cache the datasets.",
+    )
 
     args = parser.parse_args()
     log_level = sum((args.log_level or []) + [1])
 
-    login(os.getenv("HF_TOKEN"))
-
-    models = [
-        "distilbert/distilbert-base-uncased",
-        "google-t5/t5-small",
-        "MaartenGr/BERTopic_Wikipedia",
-        "sentence-transformers/all-MiniLM-L6-v2",
-        "sentence-transformers/multi-qa-MiniLM-L6-cos-v1",
-        "sentence-transformers/sentence-t5-xxl",
-        "tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super",
-        "tomaarsen/span-marker-bert-base-fewnerd-fine-super",
-        "bert-base-cased",
-        "xlm-roberta-base",
-        "meta-llama/Meta-Llama-3-8B-Instruct",
-    ]
-    datasets = ["billsum", "squad"]
-
-    for model in models:
-        if log_level > 0:
-            print(f"Downloading model: {model}")
-        snapshot_download(repo_id=model)
-
-    # BUG: datasets does not use the same cache as snapshot_download.
-    # for dataset in datasets:
-    #     if args.verbose > 0:
-    #         print(f"Downloading dataset: {dataset}")
-    #     snapshot_download(repo_id=dataset, repo_type="dataset")
-
-    load_dataset("squad", split="train[:10100]")
-    load_dataset("billsum", split="train[:10000]")
-
-    for ollama_model, last_known_size in [
-        ("llama3", "4.7 GB"),
-        ("llama3:8b", "4.7 GB"),
-        ("llama3:70b", "39 GB"),
-    ]:
-        if log_level > 0:
+    if args.list_profiles:
+        for name, profile in PROFILES.items():
+            print(f"{name}: {', '.join(profile['scripts'])}")
+            for kind in ["models", "datasets", "ollama"]:
+                for item in profile.get(kind, []):
+                    print(f"    {kind}: {item}")
+        sys.exit(0)
+
+    # huggingface_hub reads the endpoint when it is first imported, so
+    # load_dataset and the tokenizers in --materialize use the same hub as
+    # snapshot_download.
+    os.environ["HF_ENDPOINT"] = args.endpoint
+
+    from datasets import load_dataset
+    from huggingface_hub import HfApi, login
+    from huggingface_hub.utils import disable_progress_bars
+
+    if os.getenv("HF_TOKEN"):
+        login(os.getenv("HF_TOKEN"))
+
+    if log_level < 2:
+        # Concurrent per-file progress bars interleave, report per artifact instead.
+        disable_progress_bars()
+
+    profiles = [name.strip() for name in args.profile.split(",") if name.strip()]
+    try:
+        selected = select(profiles)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.skip_ollama:
+        selected["ollama"] = []
+    if args.skip_datasets:
+        selected["datasets"] = []
+
+    api = HfApi(endpoint=args.endpoint)
+    client = ollama.Client(host=args.ollama_url)
+
+    started = time.perf_counter()
+    plans = plan(
+        [(model, "model") for model in selected["models"]]
+        + [(DATASETS[name][0], "dataset") for name in selected["datasets"]],
+        selected["ollama"],
+        api,
+        client,
+        workers=args.workers,
+    )
+
+    if log_level > 0 or args.dry_run:
+        for planned in plans:
+            status = "cached" if planned["complete"] else "fetch"
+            if "error" in planned:
+                status = f"error: {planned['error']}"
             print(
-                f"Downloading Ollama model (approx {last_known_size}): {ollama_model}"
+                f"{planned['kind']:>7} {planned['name']:<60}"
+                f" {format_bytes(planned['size']):>10}"
+                f" {format_bytes(planned['needed']):>10} {status}",
+                file=sys.stderr,
             )
-        ollama.pull(ollama_model)
+        print(
+            f"total {format_bytes(sum(p['size'] for p in plans))},"
+            f" {format_bytes(sum(p['needed'] for p in plans))} to download",
+            file=sys.stderr,
+        )
+    if args.dry_run:
+        sys.exit(0)
+
+    results = prefetch(
+        plans,
+        api,
+        client,
+        workers=args.workers,
+        verify=args.verify,
+        interval=args.progress_interval,
+        log_level=log_level,
+    )
+
+    # load_dataset reads the files downloaded above from the same hub cache,
+    # this only builds the Arrow tables for the splits the scripts use.
+    fetched = {r["name"] for r in results if r["status"] != "failed"}
+    for name in selected["datasets"]:
+        repo_id, split, _ = DATASETS[name]
+        if repo_id not in fetched:
+            continue
+        load_dataset(repo_id, split=split)
+        if args.materialize:
+            try:
+                results.append(
+                    materialize(
+                        name, args.tokenized_dir, args.num_proc, log_level=log_level
+                    )
+                )
+            except Exception as error:
+                results.append(
+                    {
+                        "kind": "tokenized",
+                        "name": name,
+                        "status": "failed",
+                        "error": str(error),
+                    }
+                )
+
+    elapsed = time.perf_counter() - started
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "endpoint": args.endpoint,
+        "profiles": profiles,
+        "seconds": elapsed,
+        "artifacts": sorted(results, key=lambda r: (r["kind"], r["name"])),
+    }
+    with open(args.manifest, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    failed = [r for r in results if r["status"] == "failed"]
+    if log_level > 0:
+        downloaded = sum(r.get("bytes", 0) for r in results)
+        print(
+            f"artifacts={len(results)} failed={len(failed)}"
+            f" downloaded={format_bytes(downloaded)} seconds={elapsed:.1f}"
+            f" manifest={args.manifest}",
+            file=sys.stderr,
+        )
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,111 @@
+"""Split long facts into small overlapping chunks for retrieval.
+
+Chunks are returned as character spans of the original text, so a parent can
+be rebuilt exactly from its chunks (see stitch).
+
+"""
+
+from typing import List, Tuple
+from context_budget import SENTENCE_PATTERN, TOKEN_PATTERN
+
+Span = Tuple[int, int]
+
+
+def sentence_spans(text: str) -> List[Span]:
+    spans = []
+    start = 0
+    for boundary in SENTENCE_PATTERN.finditer(text):
+        spans.append((start, boundary.start()))
+        start = boundary.end()
+    spans.append((start, len(text.rstrip())))
+    return [(start, end) for start, end in spans if end > start]
+
+
+def token_spans(text: str, start: int = 0, end: int = None) -> List[Span]:
+    end = len(text) if end is None else end
+    return [match.span() for match in TOKEN_PATTERN.finditer(text, start, end)]
+
+
+class Chunker:
+    """Splits text into chunks of at most `max_tokens` tokens, with each chunk
+    repeating about `overlap` tokens from the end of the previous one.
+
+    When `sentence_aware` is set, chunks are built from whole sentences and
+    only sentences longer than `max_tokens` are split mid-sentence.
+    """
+
+    def __init__(self, max_tokens: int = 64, overlap: int = 16, sentence_aware=True):
+        if overlap >= max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.sentence_aware = sentence_aware
+
+    @property
+    def signature(self) -> str:
+        mode = "sentence" if self.sentence_aware else "window"
+        return f"{self.max_tokens}/{self.overlap}/{mode}"
+
+    def _windows(self, tokens: List[Span]) -> List[Span]:
+        spans = []
+        stride = self.max_tokens - self.overlap
+        for first in range(0, len(tokens), stride):
+            window = tokens[first : first + self.max_tokens]
+            spans.append((window[0][0], window[-1][1]))
+            if first + self.max_tokens >= len(tokens):
+                break
+        return spans
+
+    def chunk(self, text: str) -> List[Span]:
+        if not self.sentence_aware:
+            return self._windows(token_spans(text))
+
+        # Each unit is a sentence, or a window of a sentence that is too long.
+        units = []
+        for start, end in sentence_spans(text):
+            tokens = token_spans(text, start, end)
+            if len(tokens) > self.max_tokens:
+                units.extend((s, e, self.max_tokens) for s, e in self._windows(tokens))
+            else:
+                units.append((start, end, len(tokens)))
+
+        spans = []
+        first = 0
+        while first < len(units):
+            last = first
+            size = units[first][2]
+            while (
+                last + 1 < len(units) and size + units[last + 1][2] <= self.max_tokens
+            ):
+                last += 1
+                size += units[last][2]
+            spans.append((units[first][0], units[last][1]))
+            if last + 1 >= len(units):
+                break
+
+            # Step back over trailing units that fit in the overlap, but
+            # always make progress.
+            next_first = last + 1
+            carried = 0
+            while (
+                next_first - 1 > first
+                and carried + units[next_first - 1][2] <= self.overlap
+            ):
+                next_first -= 1
+                carried += units[next_first][2]
+            first = next_first
+        return spans
+
+
+def stitch(chunks: List[Tuple[int, int, str]]) -> str:
+    """Rebuilds a parent from (start, end, text) chunks of it."""
+    text = ""
+    covered = 0
+    for start, end, chunk in sorted(chunks):
+        if end <= covered:
+            continue
+        if start > covered and text:
+            text += " "
+        text += chunk[max(0, covered - start) :]
+        covered = end
+    return text
@@ -23,7 +23,14 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from sentence_transformers import SentenceTransformer, util
+from registry import REGISTRY, add_precision_argument
+from runtime import add_runtime_arguments, configure_runtime
+
+DOCS = [
+    "Pass the ball to someone else.",
+    "Take a 2 point shot",
+    "Take a 3 point shot",
+]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -46,20 +53,19 @@ if __name__ == "__main__":
         default="Pass the ball to John when he is near the basket.",
         help="The query to be processed. (default: %(default)s)",
     )
+    add_precision_argument(parser)
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
 
-    docs = [
-        "Pass the ball to someone else.",
-        "Take a 2 point shot",
-        "Take a 3 point shot",
-    ]
+    from sentence_transformers import util
 
     # Load the model
-    model = SentenceTransformer(args.model)
+    model = REGISTRY.sentence_transformer(args.model, args.precision)
 
     # Encode query and documents
     query_emb = model.encode(args.query)
-    doc_emb = model.encode(docs)
+    doc_emb = model.encode(DOCS)
     if args.verbose > 1:
         print(query_emb)
         print(doc_emb)
@@ -68,10 +74,13 @@ if __name__ == "__main__":
     scores = util.dot_score(query_emb, doc_emb)[0].cpu().tolist()
 
     # Combine docs & scores
-    doc_score_pairs = list(zip(docs, scores))
+    doc_score_pairs = list(zip(DOCS, scores))
 
     # Sort by decreasing score
     doc_score_pairs = sorted(doc_score_pairs, key=lambda x: x[1], reverse=True)
 
     for doc, score in doc_score_pairs:
         print(score, doc)
+
+    if args.verbose > 0:
+        REGISTRY.report()
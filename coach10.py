@@ -16,64 +16,320 @@ Usage:
 
 """
 
+__usage__ = """
+examples:
+
+    ./.venv/bin/python coach10.py "Can you give me the weather in Chicago?"
+
+    Run offline against a local stand-in for the open-meteo APIs (see
+    weather_stub.py), printing tool cache statistics:
+
+        ./.venv/bin/python weather_stub.py --port 8010
+
+        ./.venv/bin/python coach10.py -v --geocoding-url http://127.0.0.1:8010 --forecast-url http://127.0.0.1:8010
+
+    Compare several cities, with the per-step LLM and tool time printed to
+    stderr. The agent can look them all up concurrently in one batch tool
+    call, disable that with --no-batch-tool to compare:
+
+        ./.venv/bin/python coach10.py -v "Compare the weather in Dayton, Ohio and Chicago, Illinois."
+
+    Run the agent on a local llama3 through Ollama instead of the Hugging
+    Face inference API, reporting per-step latency and tokens processed:
+
+        ./.venv/bin/python coach10.py -v --engine ollama
+
+    Fully offline, against ollama_stub.py and weather_stub.py:
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --prompt-latency 0.001 --prefix-cache
+
+        ./.venv/bin/python coach10.py -v --engine ollama --ollama-url http://127.0.0.1:11435 --geocoding-url http://127.0.0.1:8010 --forecast-url http://127.0.0.1:8010
+"""
+
 # FROM https://huggingface.co/docs/transformers/agents
 
-from transformers import CodeAgent, HfEngine, Tool
-import requests
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List
+from runtime import add_runtime_arguments, configure_runtime
+
+if TYPE_CHECKING:
+    from transformers import Tool
+
+
+class OllamaEngine:
+    """An agent LLM engine backed by a local Ollama chat model.
+
+    One client is reused for every step, so its connection stays open. The
+    system prompt with the tool descriptions is identical on every step, and
+    `keep_alive` keeps the model loaded between steps, so Ollama can reuse
+    the evaluated prompt prefix instead of processing it again. Responses are
+    streamed and the time to first token and token counts of each call are
+    recorded in `calls`.
+    """
+
+    role_conversions = {"tool-call": "assistant", "tool-response": "user"}
+
+    def __init__(
+        self,
+        model: str = "llama3",
+        url: str = None,
+        keep_alive: str = "30m",
+        verbose: int = 0,
+    ):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.verbose = verbose
+        from ollama import Client
+
+        self.client = Client(
+            host=url or os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        )
+        self.calls: List[Dict] = []
+
+    def messages(self, messages: List[Dict]) -> List[Dict]:
+        """Maps agent roles to chat roles, merging consecutive messages from
+        the same role."""
+        converted = []
+        for message in messages:
+            role = getattr(message["role"], "value", message["role"])
+            role = self.role_conversions.get(role, role)
+            if converted and converted[-1]["role"] == role:
+                converted[-1]["content"] += "\n" + message["content"]
+            else:
+                converted.append({"role": role, "content": message["content"]})
+        return converted
+
+    def __call__(
+        self, messages: List[Dict], stop_sequences: List[str] = None, **kwargs
+    ):
+        started = time.perf_counter()
+        first_token = None
+        text = ""
+        final = {}
+        stream = self.client.chat(
+            model=self.model,
+            messages=self.messages(messages),
+            stream=True,
+            keep_alive=self.keep_alive,
+            options={"stop": list(stop_sequences or [])},
+        )
+        for chunk in stream:
+            piece = chunk["message"]["content"]
+            if piece and first_token is None:
+                first_token = time.perf_counter() - started
+            if self.verbose > 1:
+                print(piece, end="", flush=True, file=sys.stderr)
+            text += piece
+            if chunk.get("done"):
+                final = chunk
+
+        self.calls.append(
+            {
+                "seconds": time.perf_counter() - started,
+                "first_token_seconds": first_token or 0.0,
+                "prompt_eval_count": final.get("prompt_eval_count") or 0,
+                "eval_count": final.get("eval_count") or 0,
+            }
+        )
+        for stop in stop_sequences or []:
+            text = text.split(stop)[0]
+        return text
+
+    def report(self, file=sys.stderr):
+        for number, call in enumerate(self.calls, start=1):
+            print(
+                f"llm call {number}: seconds={call['seconds']:.3f}"
+                f" first_token={call['first_token_seconds']:.3f}"
+                f" prompt_eval_count={call['prompt_eval_count']}"
+                f" eval_count={call['eval_count']}",
+                file=file,
+            )
+        print(
+            f"prompt_eval_count={sum(c['prompt_eval_count'] for c in self.calls)}"
+            f" eval_count={sum(c['eval_count'] for c in self.calls)}",
+            file=file,
+        )
+
+
+class AgentTrace:
+    """Records, per agent step, the time spent waiting on the LLM and on each
+    tool call.
+
+    A step starts with each LLM call. Wrap the engine with `engine` and
+    register tools with `watch` before handing them to the agent.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict] = []
+        self.lock = threading.Lock()
+
+    def engine(self, llm_engine):
+        def timed(messages, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return llm_engine(messages, *args, **kwargs)
+            finally:
+                with self.lock:
+                    self.steps.append(
+                        {"llm": time.perf_counter() - started, "tools": []}
+                    )
+
+        return timed
+
+    def watch(self, tool: "Tool") -> "Tool":
+        forward = tool.forward
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return forward(*args, **kwargs)
+            finally:
+                with self.lock:
+                    if not self.steps:
+                        self.steps.append({"llm": 0.0, "tools": []})
+                    self.steps[-1]["tools"].append(
+                        (tool.name, time.perf_counter() - started)
+                    )
+
+        tool.forward = timed
+        return tool
+
+    def summary(self) -> Dict[str, float]:
+        llm = sum(step["llm"] for step in self.steps)
+        tools = sum(seconds for step in self.steps for _, seconds in step["tools"])
+        return {"steps": len(self.steps), "llm_seconds": llm, "tool_seconds": tools}
+
+    def report(self, file=sys.stderr):
+        for number, step in enumerate(self.steps, start=1):
+            tools = " ".join(
+                f"{name}={seconds:.3f}s" for name, seconds in step["tools"]
+            )
+            print(f"step {number}: llm={step['llm']:.3f}s {tools}".rstrip(), file=file)
+        summary = self.summary()
+        print(
+            f"steps={summary['steps']} llm={summary['llm_seconds']:.3f}s"
+            f" tools={summary['tool_seconds']:.3f}s",
+            file=file,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "--geocoding-url",
+        type=str,
+        help="The open-meteo geocoding API. (default: https://geocoding-api.open-meteo.com)",
+    )
+    parser.add_argument(
+        "--forecast-url",
+        type=str,
+        help="The open-meteo forecast API. (default: https://api.open-meteo.com)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=5.0,
+        help="Seconds to wait for a weather API response. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--forecast-ttl",
+        type=float,
+        default=600.0,
+        help="Seconds a forecast is reused for the same location. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["hf", "ollama"],
+        default="hf",
+        help="Run the agent's LLM through the Hugging Face inference API or a local Ollama. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        help="The agent's LLM. (default: meta-llama/Meta-Llama-3-8B-Instruct for hf, llama3 for ollama)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=str,
+        default="30m",
+        help="How long Ollama keeps the model and its prompt cache loaded between steps. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-batch-tool",
+        dest="batch_tool",
+        action="store_false",
+        help="Only give the agent the single location weather tool.",
+    )
+    parser.add_argument(
+        "query",
+        nargs="?",
+        type=str,
+        default="Can you give me the weather in Dayton, Ohio?",
+        help="The question to ask the agent. (default: %(default)s)",
+    )
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    configure_runtime(args)
+
+    from transformers import CodeAgent, HfEngine
+    from weather_tools import (
+        FORECAST_URL,
+        GEOCODING_URL,
+        WeatherBatchLookupTool,
+        WeatherLookupTool,
+    )
+
+    weather_tool = WeatherLookupTool(
+        geocoding_url=args.geocoding_url or GEOCODING_URL,
+        forecast_url=args.forecast_url or FORECAST_URL,
+        timeout=args.timeout,
+        forecast_ttl=args.forecast_ttl,
+    )
+
+    trace = AgentTrace()
+    tools = [trace.watch(weather_tool)]
+    if args.batch_tool:
+        tools.append(trace.watch(WeatherBatchLookupTool(weather_tool)))
 
+    if args.engine == "ollama":
+        llm_engine = OllamaEngine(
+            model=args.model or "llama3",
+            url=args.ollama_url,
+            keep_alive=args.keep_alive,
+            verbose=args.verbose,
+        )
+    else:
+        llm_engine = HfEngine(model=args.model or "meta-llama/Meta-Llama-3-8B-Instruct")
 
-class WeatherLookupTool(Tool):
-    name = "get_the_weather"
-    description = (
-        "This is a tool that returns the weather of a specific location."
-        "It returns the temperature in fahrenheit."
+    agent = CodeAgent(
+        tools=tools, llm_engine=trace.engine(llm_engine), add_base_tools=False
     )
+    started = time.perf_counter()
+    response = agent.run(args.query)
+    elapsed = time.perf_counter() - started
 
-    inputs = {
-        "location": {
-            "type": "text",
-            "description": "the location (i.e. Dayton, Ohio)",
-        }
-    }
-    output_type = "text"
-
-    def forward(self, location: str) -> str:
-        city = "Dayton"
-        parts = list(filter(None, [x.strip() for x in location.split(",")]))
-        if len(parts) >= 1:
-            city = parts[0]
-
-        geocode = requests.get(
-            f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=en&format=json"
-        ).json()
-
-        latitude = 39.7589478
-        longitude = -84.1916069
-        if (
-            len(geocode) > 0
-            and "results" in geocode
-            and len(geocode["results"]) > 0
-            and "latitude" in geocode["results"][0]
-            and "longitude" in geocode["results"][0]
-        ):
-            latitude = geocode["results"][0]["latitude"]
-            longitude = geocode["results"][0]["longitude"]
-
-        weather = requests.get(
-            f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&temperature_unit=fahrenheit&forecast_days=1"
-        ).json()
-
-        if "current" in weather and "temperature_2m" in weather["current"]:
-            return f"{weather['current']['temperature_2m']}"
-
-        return f"unknown"
-
-
-llm_engine = HfEngine(model="meta-llama/Meta-Llama-3-8B-Instruct")
-
-agent = CodeAgent(
-    tools=[WeatherLookupTool()], llm_engine=llm_engine, add_base_tools=False
-)
-response = agent.run("Can you give me the weather in Dayton, Ohio?")
-
-print(f"Response: {response}")
+    print(f"Response: {response}")
+    if args.verbose > 0:
+        trace.report()
+        if isinstance(llm_engine, OllamaEngine):
+            llm_engine.report()
+        print(f"total={elapsed:.3f}s", file=sys.stderr)
+        print(
+            " ".join(f"{k}={v}" for k, v in weather_tool.stats.items()),
+            file=sys.stderr,
+        )
@@ -0,0 +1,350 @@
+"""Run intent, topic and entity extraction over a stream of messages in one pass.
+
+Scenario:
+
+    You are an assistant coach of a basketball team. Every message relayed
+    during the game is classified by play call (coach2.py), checked for
+    relevance by topic (coach5.py) and searched for key people, places and
+    things (coach6.py). Running them as three processes embeds and tokenizes
+    each message three times.
+
+    Read the messages once, embed each one once and use that embedding for
+    both the intent scores and the BERTopic transform. Only extract entities
+    from messages on a relevant topic, and write one JSON record per message.
+
+"""
+
+__usage__ = """
+examples:
+
+    ./.venv/bin/python coach11.py "Pass the ball to Michael Jordan."
+
+    Process a file of messages, one per line, reporting per-stage latency and
+    throughput on stderr:
+
+        ./.venv/bin/python coach11.py -v -i game_messages.txt > records.jsonl
+
+    Also run the same messages through the coach2, coach5 and coach6 steps
+    one message at a time, as the separate scripts do, and compare:
+
+        ./.venv/bin/python coach11.py -v --compare -i game_messages.txt > records.jsonl
+
+    Treat any topic mentioning basketball or the Bulls as relevant:
+
+        ./.venv/bin/python coach11.py -r basketball -r bulls -i game_messages.txt
+"""
+
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+from coach2 import LIBRARY, collect_docs, get_intent, match_intents
+from coach6 import (
+    DEFAULT_GAZETTEER,
+    EntityCache,
+    EntityExtractor,
+    Gazetteer,
+    read_messages,
+)
+from registry import REGISTRY
+from runtime import add_runtime_arguments, configure_runtime
+
+STAGES = ["embed", "intent", "topic", "ner"]
+
+
+class StageTimings:
+    """Collects per-message latencies for each stage."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def add(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            summary[stage] = {
+                "count": len(ordered),
+                "mean": statistics.fmean(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            }
+        return summary
+
+
+def batched(messages: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def topic_probability(probs, index: int) -> Optional[float]:
+    """BERTopic returns one probability per message, or a row of topic
+    probabilities when the model was fit with calculate_probabilities."""
+    if probs is None:
+        return None
+    prob = probs[index]
+    if getattr(prob, "ndim", 0) > 0:
+        return float(prob.max())
+    return float(prob)
+
+
+def is_relevant(label: str, relevant_topics: List[str]) -> bool:
+    label = label.lower()
+    return any(topic.lower() in label for topic in relevant_topics)
+
+
+class MessagePipeline:
+    """Classifies batches of messages by intent and topic from one shared
+    embedding, then extracts entities from the relevant ones.
+
+    The intent library is embedded once, up front. Batch stages (embed,
+    intent, topic) are timed per batch and charged evenly to its messages.
+    """
+
+    def __init__(
+        self,
+        embedding_model: str,
+        topic_model: str,
+        extractor: EntityExtractor,
+        relevant_topics: List[str],
+        library=LIBRARY,
+    ):
+        self.encoder = REGISTRY.sentence_transformer(embedding_model)
+        self.topic_model = REGISTRY.bertopic(topic_model, embedding_model)
+        self.extractor = extractor
+        self.relevant_topics = relevant_topics
+        self.library = library
+        self.docs = collect_docs(library)
+        self.doc_embeddings = self.encoder.encode(self.docs)
+        self.timings = StageTimings()
+
+    def process(self, messages: List[str]) -> List[Dict]:
+        from sentence_transformers import util
+
+        mark = time.perf_counter()
+        embeddings = self.encoder.encode(messages)
+        embed_seconds = (time.perf_counter() - mark) / len(messages)
+
+        mark = time.perf_counter()
+        scores = util.dot_score(embeddings, self.doc_embeddings).cpu().tolist()
+        intents = [match_intents(row, self.docs, self.library) for row in scores]
+        intent_seconds = (time.perf_counter() - mark) / len(messages)
+
+        mark = time.perf_counter()
+        topics, probs = self.topic_model.transform(messages, embeddings=embeddings)
+        topic_seconds = (time.perf_counter() - mark) / len(messages)
+
+        records = []
+        for index, message in enumerate(messages):
+            topic = int(topics[index])
+            label = self.topic_model.topic_labels_.get(topic, "unknown")
+            relevant = is_relevant(label, self.relevant_topics)
+            latency = {
+                "embed": embed_seconds,
+                "intent": intent_seconds,
+                "topic": topic_seconds,
+            }
+
+            entities = None
+            if relevant:
+                mark = time.perf_counter()
+                entities = self.extractor.predict(message)
+                latency["ner"] = time.perf_counter() - mark
+
+            for stage, seconds in latency.items():
+                self.timings.add(stage, seconds)
+            records.append(
+                {
+                    "message": message,
+                    "intents": [
+                        {"intent": intent, "phrase": phrase, "score": score}
+                        for score, intent, phrase in sorted(intents[index])
+                    ],
+                    "topic": {
+                        "id": topic,
+                        "label": label,
+                        "probability": topic_probability(probs, index),
+                    },
+                    "relevant": relevant,
+                    "entities": entities,
+                    "latency_ms": {
+                        stage: round(seconds * 1000, 3)
+                        for stage, seconds in latency.items()
+                    },
+                }
+            )
+        return records
+
+
+def run_separately(
+    messages: List[str],
+    embedding_model: str,
+    topic_model: str,
+    ner_model: str,
+    gazetteer: Optional[Gazetteer] = None,
+) -> float:
+    """Runs each message through the coach2, coach5 and coach6 steps in turn,
+    as the three scripts do, and returns the elapsed seconds. Models come
+    from the registry, so loading is not counted."""
+    encoder = REGISTRY.sentence_transformer(embedding_model)
+    topics = REGISTRY.bertopic(topic_model, embedding_model)
+    # The pipeline may never have needed the NER model, load it before timing.
+    REGISTRY.span_marker(ner_model)
+    extractor = EntityExtractor(ner_model, gazetteer=gazetteer)
+
+    started = time.perf_counter()
+    for message in messages:
+        get_intent(message, LIBRARY, encoder)
+        topics.transform(message)
+        extractor.predict(message)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "--embedding-model",
+        type=str,
+        default="sentence-transformers/all-MiniLM-L6-v2",
+        help="The model used for both intent scores and topics. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--topic-model",
+        type=str,
+        default="MaartenGr/BERTopic_Wikipedia",
+        help="The BERTopic model. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ner-model",
+        type=str,
+        default="tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super",
+        help="The NER model. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-r",
+        "--relevant-topic",
+        action="append",
+        dest="relevant_topics",
+        help="A word that marks a topic label as relevant, can be repeated. (default: basketball)",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        help="A file of messages to process, one per line, or - for stdin.",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=16,
+        help="The number of messages embedded and classified together. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-gazetteer",
+        action="store_true",
+        help="Disable the coach6 gazetteer pre-pass.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="",
+        help="The file used to persist extracted entities. Empty to disable. (default: disabled)",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Also time the messages through the coach2, coach5 and coach6 steps one at a time.",
+    )
+    parser.add_argument(
+        "content",
+        nargs="?",
+        type=str,
+        default="Pass the ball to Michael Jordan.",
+        help="The message to process (default: %(default)s)",
+    )
+
+    add_runtime_arguments(parser, tokenizers_parallelism="false")
+    args = parser.parse_args()
+    configure_runtime(args)
+
+    cache = EntityCache(args.cache) if args.cache else None
+    gazetteer = None if args.no_gazetteer else Gazetteer(DEFAULT_GAZETTEER)
+    extractor = EntityExtractor(args.ner_model, gazetteer=gazetteer, cache=cache)
+
+    pipeline = MessagePipeline(
+        args.embedding_model,
+        args.topic_model,
+        extractor,
+        args.relevant_topics or ["basketball"],
+    )
+
+    messages = read_messages(args.input) if args.input else [args.content]
+    if args.compare:
+        messages = list(messages)
+
+    count = 0
+    started = time.perf_counter()
+    for batch in batched(messages, args.batch_size):
+        for record in pipeline.process(batch):
+            print(json.dumps(record))
+            count += 1
+    elapsed = time.perf_counter() - started
+
+    if cache is not None:
+        cache.save()
+
+    if args.verbose > 0:
+        for stage, summary in pipeline.timings.summary().items():
+            print(
+                f"{stage:>6} count={summary['count']}"
+                f" mean={summary['mean'] * 1000:.2f}ms"
+                f" p50={summary['p50'] * 1000:.2f}ms"
+                f" p95={summary['p95'] * 1000:.2f}ms",
+                file=sys.stderr,
+            )
+        print(
+            f"pipeline: {count} messages in {elapsed:.2f}s"
+            f" ({count / elapsed if elapsed else 0:.1f} msgs/sec),"
+            f" {pipeline.timings.summary().get('ner', {}).get('count', 0)} relevant",
+            file=sys.stderr,
+        )
+
+    if args.compare:
+        separate = run_separately(
+            messages,
+            args.embedding_model,
+            args.topic_model,
+            args.ner_model,
+            gazetteer=gazetteer,
+        )
+        print(
+            f"separately: {len(messages)} messages in {separate:.2f}s"
+            f" ({len(messages) / separate if separate else 0:.1f} msgs/sec),"
+            f" {separate / elapsed if elapsed else 0:.1f}x the pipeline's time",
+            file=sys.stderr,
+        )
+
+    if args.verbose > 0:
+        REGISTRY.report()
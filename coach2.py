@@ -25,6 +25,22 @@ examples:
 
     ./.venv/bin/python coach2.py -m sentence-transformers/all-MiniLM-L6-v2 "Dribble the ball."
 
+    Keep the intents in an index file, created from the built-in library on
+    first use, and teach it a new play call. Only the new phrases are
+    embedded:
+
+        ./.venv/bin/python coach2.py --index intents.json --add SCREEN "Set a screen for the ball handler." --add SCREEN "Pick and roll."
+
+        ./.venv/bin/python coach2.py --index intents.json "Set a pick for Jon"
+
+    Reword a phrase, rename an intent, drop a phrase or a whole intent, and
+    list what is left:
+
+        ./.venv/bin/python coach2.py --index intents.json --replace SHOOT "Atempt a 3 point shot." "Attempt a 3 point shot."
+
+        ./.venv/bin/python coach2.py --index intents.json --rename TRAVEL DRIBBLE
+
+        ./.venv/bin/python coach2.py --index intents.json --remove-phrase PASS "Pass the ball to your teammate." --remove SCREEN --list
 """
 
 # FROM https://huggingface.co/docs/hub/en/sentence-transformers
@@ -34,34 +50,35 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from typing import List, Set, Dict, Tuple
-from sentence_transformers import SentenceTransformer, util
-
-
-def main(query: str, model_name: str):
-    model = SentenceTransformer(model_name)
-
-    library = {
-        "TRAVEL": set(["Dribble the ball to the other side of the court."]),
-        "PASS": set(
-            [
-                "Pass the ball to your teammate.",
-                "Pass the ball to the player on your left.",
-                "Pass the ball to the player on your right.",
-            ]
-        ),
-        "SHOOT": set(
-            [
-                "Shoot the ball into the hoop.",
-                "Shoot the ball into the basket.",
-                "Atempt a 3 point shot.",
-                "Attempt a 2 point shot.",
-                "Attempt a free throw.",
-                "Attempt to dunk the ball into the hoop.",
-            ]
-        ),
-    }
-    print(get_intent(query, library, model))
+import os
+import sys
+from typing import TYPE_CHECKING, List, Set, Dict, Tuple
+from registry import REGISTRY, add_precision_argument
+from runtime import add_runtime_arguments, configure_runtime
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+LIBRARY = {
+    "TRAVEL": set(["Dribble the ball to the other side of the court."]),
+    "PASS": set(
+        [
+            "Pass the ball to your teammate.",
+            "Pass the ball to the player on your left.",
+            "Pass the ball to the player on your right.",
+        ]
+    ),
+    "SHOOT": set(
+        [
+            "Shoot the ball into the hoop.",
+            "Shoot the ball into the basket.",
+            "Atempt a 3 point shot.",
+            "Attempt a 2 point shot.",
+            "Attempt a free throw.",
+            "Attempt to dunk the ball into the hoop.",
+        ]
+    ),
+}
 
 
 def collect_docs(library: Dict[str, Set[str]]) -> List[str]:
@@ -72,8 +89,10 @@ def collect_docs(library: Dict[str, Set[str]]) -> List[str]:
 
 
 def get_intent(
-    query: str, library: Dict[str, Set[str]], model: SentenceTransformer
+    query: str, library: Dict[str, Set[str]], model: "SentenceTransformer"
 ) -> Set[Tuple[float, str, str]]:
+    from sentence_transformers import util
+
     docs = collect_docs(library)
 
     query_emb = model.encode(query)
@@ -81,6 +100,14 @@ def get_intent(
 
     scores = util.dot_score(query_emb, doc_emb)[0].cpu().tolist()
 
+    return match_intents(scores, docs, library)
+
+
+def match_intents(
+    scores: List[float], docs: List[str], library: Dict[str, Set[str]]
+) -> Set[Tuple[float, str, str]]:
+    """The intents of the best scoring phrases, given each phrase's score in
+    the order collect_docs returns them."""
     top_score = max(scores)
 
     doc_score_pairs = list(zip(docs, scores))
@@ -121,5 +148,107 @@ if __name__ == "__main__":
         help="The query to be processed. (default: %(default)s)",
     )
 
+    add_precision_argument(parser)
+    parser.add_argument(
+        "--index",
+        type=str,
+        default="",
+        help="A file keeping the intents, phrases and their embeddings, created from the built-in library when missing. (default: the built-in library, not saved)",
+    )
+    parser.add_argument(
+        "--add",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("INTENT", "PHRASE"),
+        help="Add a phrase to an intent, creating the intent if needed. Can be repeated.",
+    )
+    parser.add_argument(
+        "--replace",
+        nargs=3,
+        action="append",
+        default=[],
+        metavar=("INTENT", "PHRASE", "NEW_PHRASE"),
+        help="Reword one of an intent's phrases. Can be repeated.",
+    )
+    parser.add_argument(
+        "--rename",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("INTENT", "NEW_INTENT"),
+        help="Rename an intent, merging it into NEW_INTENT if that exists. Can be repeated.",
+    )
+    parser.add_argument(
+        "--remove-phrase",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("INTENT", "PHRASE"),
+        help="Remove a phrase from an intent. Can be repeated.",
+    )
+    parser.add_argument(
+        "--remove",
+        action="append",
+        default=[],
+        metavar="INTENT",
+        help="Remove an intent and all of its phrases. Can be repeated.",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="Print the intents and their phrases.",
+    )
+    add_runtime_arguments(parser)
     args = parser.parse_args()
-    main(args.query, args.model)
+    configure_runtime(args)
+
+    from intent_index import IntentIndex
+
+    model = REGISTRY.sentence_transformer(args.model, args.precision)
+
+    if args.index and os.path.exists(args.index):
+        try:
+            index = IntentIndex.load(args.index, model, args.model, args.precision)
+        except ValueError as error:
+            parser.error(str(error))
+        changed = False
+    else:
+        index = IntentIndex.from_library(model, args.model, LIBRARY, args.precision)
+        changed = True
+
+    changes = 0
+    for intent, phrase in args.add:
+        changes += index.add(intent, [phrase])
+    for intent, phrase, new_phrase in args.replace:
+        changes += index.replace(intent, phrase, new_phrase)
+    for intent, new_intent in args.rename:
+        changes += index.rename(intent, new_intent)
+    for intent, phrase in args.remove_phrase:
+        changes += index.remove(intent, [phrase])
+    for intent in args.remove:
+        changes += index.remove(intent)
+
+    if args.verbose > 0:
+        print(
+            f"{changes} rows changed, {len(index.snapshot.phrases)} phrases"
+            f" at version {index.snapshot.version}",
+            file=sys.stderr,
+        )
+
+    if args.index and (changed or changes):
+        try:
+            index.save(args.index)
+        except ValueError as error:
+            parser.error(str(error))
+    elif changes:
+        print("Changes are not saved without --index.", file=sys.stderr)
+
+    if args.list:
+        for intent, phrases in sorted(index.snapshot.library().items()):
+            print(intent)
+            for phrase in sorted(phrases):
+                print(f"    {phrase}")
+
+    if args.query is not None:
+        print(index.classify(args.query))
@@ -22,6 +22,12 @@ examples:
 
     ./.venv/bin/python coach3a.py
 
+    Train from a dataset tokenized ahead of time by cache.py:
+
+        ./.venv/bin/python cache.py --profile qa --materialize
+
+        ./.venv/bin/python coach3a.py --tokenized
+
 """
 
 # FROM https://huggingface.co/docs/transformers/en/tasks/question_answering
@@ -31,22 +37,22 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from datasets import load_dataset
-from transformers import (
-    AutoTokenizer,
-    DefaultDataCollator,
-    AutoModelForQuestionAnswering,
-    TrainingArguments,
-    Trainer,
-)
+from tokenized import TEST_SIZE, load_tokenized, metadata, tokenized_path
+from runtime import add_runtime_arguments, configure_runtime
 
+# https://huggingface.co/datasets/rajpurkar/squad
+DATASET = "rajpurkar/squad"
+DATASET_SPLIT = "train[:10100]"
+MODEL = "distilbert/distilbert-base-uncased"
+MAX_LENGTH = 384
 
-def preprocess_function(examples, tokenizer):
+
+def preprocess_function(examples, tokenizer, max_length: int = MAX_LENGTH):
     questions = [q.strip() for q in examples["question"]]
     inputs = tokenizer(
         questions,
         examples["context"],
-        max_length=384,
+        max_length=max_length,
         truncation="only_second",
         return_offsets_mapping=True,
         padding="max_length",
@@ -93,6 +99,21 @@ def preprocess_function(examples, tokenizer):
     return inputs
 
 
+def tokenize_dataset(
+    dataset, tokenizer, max_length: int = MAX_LENGTH, seed=None, num_proc=None
+):
+    """Splits the raw squad rows into train and test and tokenizes both. Also
+    used by cache.py --materialize, with a fixed seed."""
+    dataset = dataset.train_test_split(test_size=TEST_SIZE, seed=seed)
+    return dataset.map(
+        preprocess_function,
+        fn_kwargs={"tokenizer": tokenizer, "max_length": max_length},
+        batched=True,
+        num_proc=num_proc,
+        remove_columns=dataset["train"].column_names,
+    )
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -106,28 +127,51 @@ if __name__ == "__main__":
         default="team_knowledge_base",
         help="The directory that the trained model will be placed. (default: %(default)s)",
     )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=MAX_LENGTH,
+        help="The number of tokens questions and contexts are padded or truncated to. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tokenized",
+        action="store_true",
+        help="Load the dataset tokenized by cache.py --materialize instead of tokenizing it.",
+    )
+    parser.add_argument(
+        "--tokenized-dir",
+        type=str,
+        default="tokenized",
+        help="Where cache.py --materialize saved the tokenized datasets. (default: %(default)s)",
+    )
 
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
+
+    from datasets import load_dataset
+    from transformers import (
+        AutoTokenizer,
+        DefaultDataCollator,
+        AutoModelForQuestionAnswering,
+        TrainingArguments,
+        Trainer,
+    )
 
-    # https://huggingface.co/datasets/rajpurkar/squad
-
-    squad = load_dataset("squad", split="train[:10100]")
-    squad = squad.train_test_split(test_size=0.2)
-
-    tokenizer = AutoTokenizer.from_pretrained("distilbert/distilbert-base-uncased")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
 
-    tokenized_squad = squad.map(
-        preprocess_function,
-        fn_kwargs={"tokenizer": tokenizer},
-        batched=True,
-        remove_columns=squad["train"].column_names,
-    )
+    if args.tokenized:
+        tokenized_squad = load_tokenized(
+            tokenized_path(args.tokenized_dir, "squad", MODEL, args.max_length),
+            metadata(DATASET, DATASET_SPLIT, MODEL, args.max_length),
+        )
+    else:
+        squad = load_dataset(DATASET, split=DATASET_SPLIT)
+        tokenized_squad = tokenize_dataset(squad, tokenizer, args.max_length)
 
     data_collator = DefaultDataCollator()
 
-    model = AutoModelForQuestionAnswering.from_pretrained(
-        "distilbert/distilbert-base-uncased"
-    )
+    model = AutoModelForQuestionAnswering.from_pretrained(MODEL)
 
     training_args = TrainingArguments(
         output_dir=args.directory,
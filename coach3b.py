@@ -28,8 +28,7 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from transformers import pipeline
-
+from runtime import add_runtime_arguments, configure_runtime
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -65,7 +64,11 @@ if __name__ == "__main__":
         help="The context of the question (default: %(default)s)",
     )
 
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
+
+    from transformers import pipeline
 
     question_answerer = pipeline(
         "question-answering", model=f"./{args.directory}/checkpoint-{args.checkpoint}/"
@@ -24,6 +24,12 @@ examples:
 
         date && time ./.venv/bin/python coach4a.py
 
+    Train from a dataset tokenized ahead of time by cache.py:
+
+        ./.venv/bin/python cache.py --profile summarize --materialize
+
+        ./.venv/bin/python coach4a.py --tokenized
+
 """
 
 
@@ -34,21 +40,22 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from datasets import load_dataset
-from transformers import (
-    AutoTokenizer,
-    DataCollatorForSeq2Seq,
-    AutoModelForSeq2SeqLM,
-    Seq2SeqTrainingArguments,
-    Seq2SeqTrainer,
-)
-import evaluate
-import numpy as np
-
-
-def preprocess_function(examples):
+from tokenized import TEST_SIZE, load_tokenized, metadata, tokenized_path
+from runtime import add_runtime_arguments, configure_runtime
+
+# https://huggingface.co/datasets/FiscalNote/billsum
+DATASET = "FiscalNote/billsum"
+DATASET_SPLIT = "train[:10000]"
+MODEL = "google-t5/t5-small"
+MAX_LENGTH = 1024
+PREFIX = "summarize: "
+
+
+def preprocess_function(
+    examples, tokenizer, max_length: int = MAX_LENGTH, prefix: str = PREFIX
+):
     inputs = [prefix + doc for doc in examples["text"]]
-    model_inputs = tokenizer(inputs, max_length=1024, truncation=True)
+    model_inputs = tokenizer(inputs, max_length=max_length, truncation=True)
 
     labels = tokenizer(text_target=examples["summary"], max_length=128, truncation=True)
 
@@ -56,6 +63,20 @@ def preprocess_function(examples):
     return model_inputs
 
 
+def tokenize_dataset(
+    dataset, tokenizer, max_length: int = MAX_LENGTH, seed=None, num_proc=None
+):
+    """Splits the raw billsum rows into train and test and tokenizes both.
+    Also used by cache.py --materialize, with a fixed seed."""
+    dataset = dataset.train_test_split(test_size=TEST_SIZE, seed=seed)
+    return dataset.map(
+        preprocess_function,
+        fn_kwargs={"tokenizer": tokenizer, "max_length": max_length},
+        batched=True,
+        num_proc=num_proc,
+    )
+
+
 def compute_metrics(eval_pred):
     predictions, labels = eval_pred
     decoded_preds = tokenizer.batch_decode(predictions, skip_special_tokens=True)
@@ -90,32 +111,64 @@ if __name__ == "__main__":
     parser.add_argument(
         "--dataset",
         type=str,
-        default="billsum",
+        default=DATASET,
         help="The dataset used to train the model. (default: %(default)s)",
     )
     parser.add_argument(
         "--dataset-split",
         type=str,
-        default="train[:10000]",
+        default=DATASET_SPLIT,
         help="The split argument to the dataset loader. (default: %(default)s)",
     )
     parser.add_argument(
         "--model",
         type=str,
-        default="google-t5/t5-small",
+        default=MODEL,
         help="The checkpoint used to base the trained model off of. (default: %(default)s)",
     )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=MAX_LENGTH,
+        help="The number of tokens bills are truncated to. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tokenized",
+        action="store_true",
+        help="Load the dataset tokenized by cache.py --materialize instead of tokenizing it.",
+    )
+    parser.add_argument(
+        "--tokenized-dir",
+        type=str,
+        default="tokenized",
+        help="Where cache.py --materialize saved the tokenized datasets. (default: %(default)s)",
+    )
 
+    add_runtime_arguments(parser)
     args = parser.parse_args()
-
-    dataset = load_dataset(args.dataset, split=args.dataset_split)
-    dataset = dataset.train_test_split(test_size=0.2)
+    configure_runtime(args)
+
+    from datasets import load_dataset
+    from transformers import (
+        AutoTokenizer,
+        DataCollatorForSeq2Seq,
+        AutoModelForSeq2SeqLM,
+        Seq2SeqTrainingArguments,
+        Seq2SeqTrainer,
+    )
+    import evaluate
+    import numpy as np
 
     tokenizer = AutoTokenizer.from_pretrained(args.model)
 
-    prefix = "summarize: "
-
-    tokenized_dataset = dataset.map(preprocess_function, batched=True)
+    if args.tokenized:
+        tokenized_dataset = load_tokenized(
+            tokenized_path(args.tokenized_dir, "billsum", args.model, args.max_length),
+            metadata(args.dataset, args.dataset_split, args.model, args.max_length),
+        )
+    else:
+        dataset = load_dataset(args.dataset, split=args.dataset_split)
+        tokenized_dataset = tokenize_dataset(dataset, tokenizer, args.max_length)
 
     data_collator = DataCollatorForSeq2Seq(tokenizer=tokenizer, model=args.model)
 
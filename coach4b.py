@@ -29,7 +29,7 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from transformers import pipeline
+from runtime import add_runtime_arguments, configure_runtime
 
 default_content = 'Marine and Hydrokinetic Renewable Energy Promotion Act of 2011 - Amends the Energy Independence and Security Act of 2007 to require the program of marine and hydrokinetic renewable energy technology research, development, demonstration, and commercial application to: (1) apply advanced systems engineering and system integration methods to identify critical interfaces and develop open standards for marine and hydrokinetic renewable energy; (2) transfer the resulting environmental data to industry stakeholders as public information through published interface definitions, standards, and demonstration projects; and (3) develop incentives for industry to comply with such standards.\n\nRequires the Secretary of Energy (DOE) to award competitive grants to support modifying or constructing four or more geographically dispersed marine and hydrokinetic renewable energy technology research, development, and demonstration test facilities for the demonstration of multiple technologies in actual operating environments. Requires the Secretary to give preference to existing facilities and National Marine Renewable Energy Research, Development, and Demonstration Centers. Renames such Centers as the "National Marine and Hydrokinetic Renewable Energy Research, Development, and Demonstration Centers" and expands their research and clearinghouse duties to include hydrokinetic as well as marine renewable energy research. Authorizes such Centers to serve as technology test facilities. Requires the Secretary to establish a marine-based energy device verification program to provide a bridge from the marine and hydrokinetic renewable energy capture device design and development efforts underway across the industry to commercial deployment of such devices. Requires the Secretary to establish a grant program to: (1) advance the development of marine and hydrokinetic renewable energy; (2) help fund the costs of environmental analysis affecting the deployment of marine hydrokinetic devices; (3) help eligible entities to collect the types of environmental data that are required when working in a public resource, monitor the impacts of demonstration projects, and make the resulting information available for dissemination to aid future projects; and (4) help fund the cost of advancing renewable marine and hydrokinetic technologies in ocean and riverine environments from demonstration projects to development and deployment. Authorizes appropriations for marine and hydrokinetic renewable energy technologies through FY2013.'
 
@@ -60,7 +60,11 @@ if __name__ == "__main__":
         help="The content to summarize (default: %(default)s)",
     )
 
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
+
+    from transformers import pipeline
 
     content = args.content
     if not content.startswith("summarize: "):
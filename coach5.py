@@ -31,9 +31,8 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
-from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
-
+from registry import REGISTRY, add_precision_argument
+from runtime import add_runtime_arguments, configure_runtime
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -64,11 +63,12 @@ if __name__ == "__main__":
         help="The message to categorize (default: %(default)s)",
     )
 
+    add_precision_argument(parser)
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
 
-    embedding_model = SentenceTransformer(args.embedding_model)
-
-    topic_model = BERTopic.load(args.model, embedding_model=embedding_model)
+    topic_model = REGISTRY.bertopic(args.model, args.embedding_model, args.precision)
 
     topic, prob = topic_model.transform(args.content)
 
@@ -77,3 +77,6 @@ if __name__ == "__main__":
     for topic, prob in topic_pairs:
         topic_label = topic_model.topic_labels_.get(topic, "unknown")
         print(f"{topic_label} {prob}")
+
+    if args.verbose > 0:
+        REGISTRY.report()
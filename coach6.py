@@ -19,6 +19,15 @@ examples:
     ./.venv/bin/python coach6.py "The Pelicans aren't going to know what hits them at this rate."
 
     ./.venv/bin/python coach6.py "Can you zoom in on the player's shoes?"
+
+    Process a file of messages, one per line, and report how many were resolved
+    without running the model:
+
+        ./.venv/bin/python coach6.py -i game_messages.txt
+
+    Disable the gazetteer pre-pass and the result cache:
+
+        ./.venv/bin/python coach6.py --no-gazetteer --cache "" "Go Bulls!"
 """
 
 # FROM https://huggingface.co/docs/hub/en/span_marker
@@ -28,12 +37,324 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
-import os
+import argparse
+import hashlib
+import json
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from context_budget import STOPWORDS
+from registry import REGISTRY
+from runtime import add_runtime_arguments, configure_runtime
 
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+# Labels follow the FewNERD fine-grained scheme used by the default model.
+DEFAULT_GAZETTEER: Dict[str, List[str]] = {
+    "person-athlete": [
+        "Michael Jordan",
+        "Scottie Pippen",
+        "Dennis Rodman",
+        "Wilt Chamberlain",
+        "Magic Johnson",
+        "Larry Bird",
+    ],
+    "organization-sportsteam": [
+        "Chicago Bulls",
+        "Bulls",
+        "New Orleans Pelicans",
+        "Pelicans",
+        "Washington Wizards",
+        "Charlotte Hornets",
+        "Golden State Warriors",
+        "Los Angeles Lakers",
+    ],
+    "organization-sportsleague": [
+        "National Basketball Association",
+        "NBA",
+    ],
+    "building-sportsfacility": [
+        "United Center",
+        "Chicago Stadium",
+    ],
+}
 
-import argparse
-from span_marker import SpanMarkerModel
+
+class Gazetteer:
+    """A compiled multi-pattern matcher (Aho-Corasick) over known entity names.
+
+    Names of several words match case-insensitively. A single word name only
+    matches as written, so "the bulls ran" is not the Chicago Bulls. Matches
+    must fall on word boundaries, and overlaps are resolved by preferring the
+    leftmost, then longest, match. `fingerprint` identifies the names and
+    labels, for caching what the gazetteer found.
+    """
+
+    def __init__(self, entries: Dict[str, Iterable[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, str, Optional[str]]]] = [[]]
+
+        entries = {label: sorted(set(names)) for label, names in entries.items()}
+        for label, names in entries.items():
+            for name in names:
+                self._add(name.lower(), label, None if " " in name.strip() else name)
+        self._build()
+        self.fingerprint = hashlib.sha256(
+            json.dumps(entries, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def _add(self, pattern: str, label: str, exact: Optional[str] = None):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(pattern), label, exact))
+
+    def _build(self):
+        queue = list(self.goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state].extend(self.output[self.fail[next_state]])
+
+    def find(self, text: str) -> List[Dict]:
+        lowered = text.lower()
+        candidates = []
+        state = 0
+        for end, char in enumerate(lowered, start=1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, label, exact in self.output[state]:
+                start = end - length
+                if exact is not None and text[start:end] != exact:
+                    continue
+                if _is_boundary(lowered, start - 1) and _is_boundary(lowered, end):
+                    candidates.append((start, end, label))
+
+        entities = []
+        last_end = 0
+        for start, end, label in sorted(candidates, key=lambda c: (c[0], -c[1])):
+            if start < last_end:
+                continue
+            entities.append(
+                {
+                    "span": text[start:end],
+                    "label": label,
+                    "score": 1.0,
+                    "char_start_index": start,
+                    "char_end_index": end,
+                }
+            )
+            last_end = end
+        return entities
+
+    @classmethod
+    def from_file(cls, path: str) -> "Gazetteer":
+        with open(path, "r") as gazetteer_file:
+            return cls(json.load(gazetteer_file))
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+NAME_PATTERN = re.compile(r"\b[A-Z][\w'-]*")
+SENTENCE_START_PATTERN = re.compile(r"(^|[.!?]\s+)$")
+# Words that are only capitalized because they start a sentence. Any other
+# capitalized first word may be a name, as "Pippen" in "Pippen passes".
+SENTENCE_START_WORDS = STOPWORDS | {
+    "all",
+    "also",
+    "but",
+    "can",
+    "could",
+    "don't",
+    "get",
+    "give",
+    "go",
+    "good",
+    "great",
+    "hey",
+    "i'm",
+    "if",
+    "it's",
+    "just",
+    "keep",
+    "let's",
+    "look",
+    "make",
+    "my",
+    "no",
+    "not",
+    "now",
+    "ok",
+    "okay",
+    "our",
+    "pass",
+    "please",
+    "run",
+    "she",
+    "should",
+    "so",
+    "tell",
+    "that",
+    "that's",
+    "their",
+    "then",
+    "there",
+    "these",
+    "they",
+    "this",
+    "those",
+    "watch",
+    "we",
+    "we're",
+    "well",
+    "will",
+    "would",
+    "yeah",
+    "yes",
+    "you",
+    "your",
+    "zoom",
+}
+
+
+def has_unknown_names(text: str, entities: List[Dict]) -> bool:
+    """Returns true if the text has capitalized words that the gazetteer did
+    not account for. The first word of a sentence only counts when it is not
+    a common word."""
+    covered = [(e["char_start_index"], e["char_end_index"]) for e in entities]
+    for match in NAME_PATTERN.finditer(text):
+        if any(start <= match.start() < end for start, end in covered):
+            continue
+        if (
+            SENTENCE_START_PATTERN.search(text[: match.start()])
+            and match.group().lower() in SENTENCE_START_WORDS
+        ):
+            continue
+        if match.group() == "I":
+            continue
+        return True
+    return False
+
+
+# Bumped when the rules deciding what reaches the model change, so entities
+# cached under the old rules are not returned.
+CACHE_VERSION = 2
+
+
+class EntityCache:
+    """A size-bounded cache of extracted entities keyed by a hash of the
+    message and what extracted them, the NER model and the gazetteer."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        if path:
+            try:
+                with open(path, "r") as cache_file:
+                    self.entries.update(json.load(cache_file))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key(model: str, gazetteer: Optional[str], message: str) -> str:
+        material = json.dumps([CACHE_VERSION, model, gazetteer, message])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(
+        self, model: str, gazetteer: Optional[str], message: str
+    ) -> Optional[List[Dict]]:
+        key = self.key(model, gazetteer, message)
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(
+        self, model: str, gazetteer: Optional[str], message: str, entities: List[Dict]
+    ):
+        key = self.key(model, gazetteer, message)
+        self.entries[key] = entities
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if self.path:
+            with open(self.path, "w") as cache_file:
+                json.dump(self.entries, cache_file)
+
+
+class EntityExtractor:
+    """Resolves entities from the cache, then the gazetteer, and only falls
+    back to the NER model when neither can account for the message. The
+    model is loaded from the registry on first use."""
+
+    def __init__(
+        self,
+        model_name: str,
+        gazetteer: Optional[Gazetteer] = None,
+        cache: Optional[EntityCache] = None,
+        registry=None,
+    ):
+        self.model_name = model_name
+        self.registry = registry or REGISTRY
+        self.gazetteer = gazetteer
+        self.cache = cache
+        self.stats = {"cache": 0, "gazetteer": 0, "model": 0}
+
+    def predict(self, message: str) -> List[Dict]:
+        fingerprint = self.gazetteer.fingerprint if self.gazetteer else None
+        if self.cache is not None:
+            entities = self.cache.get(self.model_name, fingerprint, message)
+            if entities is not None:
+                self.stats["cache"] += 1
+                return entities
+
+        entities = self.gazetteer.find(message) if self.gazetteer else []
+        if entities and not has_unknown_names(message, entities):
+            self.stats["gazetteer"] += 1
+        else:
+            model = self.registry.span_marker(self.model_name)
+            entities = [dict(entity) for entity in model.predict(message)]
+            self.stats["model"] += 1
+
+        if self.cache is not None:
+            self.cache.put(self.model_name, fingerprint, message, entities)
+        return entities
+
+    def resolved_without_model(self) -> float:
+        total = sum(self.stats.values())
+        if total == 0:
+            return 0.0
+        return (total - self.stats["model"]) / total
+
+
+def read_messages(path: str) -> Iterable[str]:
+    if path == "-":
+        lines = sys.stdin
+    else:
+        lines = open(path, "r")
+    with lines:
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
 
 
 if __name__ == "__main__":
@@ -50,6 +371,29 @@ if __name__ == "__main__":
         default="tomaarsen/span-marker-xlm-roberta-base-fewnerd-fine-super",
         help="The NER model. (default: %(default)s)",
     )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        help="A file of messages to process, one per line, or - for stdin.",
+    )
+    parser.add_argument(
+        "-g",
+        "--gazetteer",
+        type=str,
+        help="A JSON file mapping entity labels to lists of known names. (default: built-in basketball entities)",
+    )
+    parser.add_argument(
+        "--no-gazetteer",
+        action="store_true",
+        help="Disable the gazetteer pre-pass.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="entity_cache.json",
+        help="The file used to persist extracted entities. Empty to disable. (default: %(default)s)",
+    )
     parser.add_argument(
         "content",
         nargs="?",
@@ -58,13 +402,48 @@ if __name__ == "__main__":
         help="The message to process (default: %(default)s)",
     )
 
+    add_runtime_arguments(parser, tokenizers_parallelism="false")
     args = parser.parse_args()
+    configure_runtime(args)
+
+    gazetteer = None
+    if not args.no_gazetteer:
+        if args.gazetteer:
+            gazetteer = Gazetteer.from_file(args.gazetteer)
+        else:
+            gazetteer = Gazetteer(DEFAULT_GAZETTEER)
+
+    cache = EntityCache(args.cache) if args.cache else None
+
+    extractor = EntityExtractor(args.model, gazetteer=gazetteer, cache=cache)
+
+    messages = read_messages(args.input) if args.input else [args.content]
+
+    for message in messages:
+        entities = extractor.predict(message)
+
+        if args.input:
+            print(message)
+
+        if len(entities) == 0:
+            print("no entities found")
+
+        for entity in entities:
+            print("%.3f" % (entity["score"]), entity["label"], entity["span"])
 
-    model = SpanMarkerModel.from_pretrained(args.model)
-    entities = model.predict(args.content)
+    if cache is not None:
+        cache.save()
 
-    if len(entities) == 0:
-        print("no entities found")
+    if args.input or args.verbose > 0:
+        total = sum(extractor.stats.values())
+        print(
+            f"resolved without model: {total - extractor.stats['model']}/{total}"
+            f" ({extractor.resolved_without_model():.1%})"
+            f" cache={extractor.stats['cache']}"
+            f" gazetteer={extractor.stats['gazetteer']}"
+            f" model={extractor.stats['model']}",
+            file=sys.stderr,
+        )
 
-    for entity in entities:
-        print("%.3f" % (entity["score"]), entity["label"], entity["span"])
+    if args.verbose > 0:
+        REGISTRY.report()
@@ -28,8 +28,8 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
 import json
-from sentence_transformers import SentenceTransformer
-import pandas as pd
+from registry import REGISTRY, add_precision_argument
+from runtime import add_runtime_arguments, configure_runtime
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -60,7 +60,12 @@ if __name__ == "__main__":
         help="The file to write embeddings to. (default: %(default)s)",
     )
 
+    add_precision_argument(parser)
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
+
+    import pandas as pd
 
     docs = [
         "An adventure is an exciting experience or undertaking that is typically bold, sometimes risky. Adventures may be activities with danger such as traveling, exploring, skydiving, mountain climbing, scuba diving, river rafting, or other extreme sports. Adventures are often undertaken to create psychological arousal or in order to achieve a greater goal, such as the pursuit of knowledge that can only be obtained by such activities.",
@@ -77,7 +82,7 @@ if __name__ == "__main__":
         "A shot clock is a countdown timer used in a variety of games and sports, indicating a set amount of time that a team may possess the object of play before attempting to score a goal. Shot clocks are used in several sports including basketball, water polo, canoe polo, lacrosse, poker, ringette, korfball, tennis, ten-pin bowling, and various cue sports. It is analogous with the play clock used in American and Canadian football, and the pitch clock used in baseball. This article deals chiefly with the shot clock used in basketball.",
     ]
 
-    model = SentenceTransformer(args.model)
+    model = REGISTRY.sentence_transformer(args.model, args.precision)
 
     docs_embeddings = model.encode(docs)
 
@@ -85,7 +90,15 @@ if __name__ == "__main__":
 
     docs_df.to_csv(args.embeddings, index=False)
 
+    # coach7b.py checks these, a query embedded by another model or in another
+    # precision does not compare with the documents.
+    with open(f"{args.embeddings}.json", "w") as metadata_file:
+        json.dump({"model": args.model, "precision": args.precision}, metadata_file)
+
     json_object = json.dumps(docs, indent=4)
 
     with open(args.docs, "w") as outfile:
         outfile.write(json_object)
+
+    if args.verbose > 0:
+        REGISTRY.report()
@@ -28,10 +28,8 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import argparse
 import json
-import torch
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import semantic_search
-from datasets import load_dataset
+from registry import REGISTRY, add_precision_argument
+from runtime import add_runtime_arguments, configure_runtime
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -69,9 +67,29 @@ if __name__ == "__main__":
         help="The message to process (default: %(default)s)",
     )
 
+    add_precision_argument(parser)
+    add_runtime_arguments(parser)
     args = parser.parse_args()
-
-    model = SentenceTransformer(args.model)
+    configure_runtime(args)
+
+    try:
+        with open(f"{args.embeddings}.json", "r") as metadata_file:
+            built_with = json.load(metadata_file)
+    except FileNotFoundError:
+        # Embeddings written before coach7a.py recorded this are float32.
+        built_with = {"model": args.model, "precision": "float32"}
+    if built_with != {"model": args.model, "precision": args.precision}:
+        parser.error(
+            f"{args.embeddings} was built with {built_with['model']} in"
+            f" {built_with['precision']}, not {args.model} in {args.precision}."
+            " Use the same model and precision or re-run coach7a.py."
+        )
+
+    import torch
+    from sentence_transformers.util import semantic_search
+    from datasets import load_dataset
+
+    model = REGISTRY.sentence_transformer(args.model, args.precision)
 
     with open(args.docs, "r") as team_messages_file:
         docs = json.load(team_messages_file)
@@ -97,3 +115,6 @@ if __name__ == "__main__":
         print("%.4f" % (top_hit["score"]), docs[top_hit["corpus_id"]])
     else:
         print("no results")
+
+    if args.verbose > 0:
+        REGISTRY.report()
@@ -17,6 +17,39 @@ examples:
 
     ./.venv/bin/python coach8.py "Who is Michael Jordan"
 
+    Repeat questions are answered from the response cache. Show cache counters:
+
+        ./.venv/bin/python coach8.py -v "Who is Michael Jordan"
+
+    Disable the response cache:
+
+        ./.venv/bin/python coach8.py --cache "" "Who is Michael Jordan"
+
+    Also answer similar questions from the semantic cache. It is off by
+    default, a low threshold matches questions that only look alike (the
+    capital of America and of France):
+
+        ./.venv/bin/python coach8.py --semantic-threshold 0.95 "Who is MJ?"
+
+    Replay a question log and report hit rate, latency saved and agreement:
+
+        ./.venv/bin/python coach8.py --replay questions.txt --verify
+
+    Answer a file of questions concurrently, in input order:
+
+        ./.venv/bin/python coach8.py --batch questions.txt --concurrency 8
+
+    Stream the answer and stop as soon as two words have arrived:
+
+        ./.venv/bin/python coach8.py --stream "Who is Michael Jordan"
+
+        ./.venv/bin/python coach8.py --stream --max-words 5 --no-newline-stop "Who is Michael Jordan"
+
+    Measure batch throughput against a local stand-in (see ollama_stub.py):
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --latency 0.5 &
+        ./.venv/bin/python coach8.py --ollama-url http://127.0.0.1:11435 --batch questions.txt --sweep 1,2,4,8,16
+
 """
 
 import warnings
@@ -26,14 +59,23 @@ warnings.simplefilter(action="ignore", category=UserWarning)
 
 
 import argparse
-from langchain_community.llms import Ollama
-from langchain import PromptTemplate
-from langchain_core._api.deprecation import suppress_langchain_deprecation_warning
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from runtime import add_runtime_arguments, configure_runtime
 
+if TYPE_CHECKING:
+    import numpy as np
+    from ollama import AsyncClient, Client
 
-def get_model_response(user_prompt, system_prompt):
-    # NOTE: No f string and no whitespace in curly braces
-    template = """
+# NOTE: No f string and no whitespace in curly braces, it is filled in with
+# str.format.
+TEMPLATE = """
         <|begin_of_text|>
         <|start_header_id|>system<|end_header_id|>
         {system_prompt}
@@ -44,15 +86,499 @@ def get_model_response(user_prompt, system_prompt):
         <|start_header_id|>assistant<|end_header_id|>
         """
 
-    # Added prompt template
-    prompt = PromptTemplate(
-        input_variables=["system_prompt", "user_prompt"], template=template
+
+def normalize_prompt(user_prompt: str) -> str:
+    return " ".join(user_prompt.lower().split()).rstrip("?.! ")
+
+
+class ResponseCache:
+    """An exact-match cache of model responses with TTL and LRU eviction.
+
+    Entries are keyed by the model, the system prompt, and the normalized user
+    prompt, and are persisted to a JSON file between runs.
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, ttl: float = 86400, max_entries: int = 1000
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "hit_seconds": 0.0, "miss_seconds": 0.0}
+        if path:
+            try:
+                with open(path, "r") as cache_file:
+                    self.entries.update(json.load(cache_file))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str) -> str:
+        material = json.dumps([model, system_prompt, normalize_prompt(user_prompt)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, system_prompt: str, user_prompt: str) -> Optional[str]:
+        key = self.key(model, system_prompt, user_prompt)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry["created"] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry["response"]
+
+    def put(self, model: str, system_prompt: str, user_prompt: str, response: str):
+        key = self.key(model, system_prompt, user_prompt)
+        self.entries[key] = {
+            "response": response,
+            "created": time.time(),
+            "model": model,
+            "system_prompt": system_prompt,
+            "prompt": normalize_prompt(user_prompt),
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def record(self, hit: bool, seconds: float):
+        if hit:
+            self.stats["hits"] += 1
+            self.stats["hit_seconds"] += seconds
+        else:
+            self.stats["misses"] += 1
+            self.stats["miss_seconds"] += seconds
+
+    def summary(self) -> str:
+        hits, misses = self.stats["hits"], self.stats["misses"]
+        hit_avg = self.stats["hit_seconds"] / hits if hits else 0.0
+        miss_avg = self.stats["miss_seconds"] / misses if misses else 0.0
+        return (
+            f"cache hits={hits} misses={misses}"
+            f" hit_avg={hit_avg * 1e6:.1f}us miss_avg={miss_avg:.3f}s"
+            f" entries={len(self.entries)}"
+        )
+
+    def save(self):
+        if self.path:
+            with open(self.path, "w") as cache_file:
+                json.dump(self.entries, cache_file)
+
+
+class SemanticCache:
+    """A similarity-based cache of model responses.
+
+    Questions are embedded with a sentence-transformer model and kept in a
+    small in-memory index. A lookup returns the response of the most similar
+    prior question from the same model and system prompt when its cosine
+    similarity is at or above the threshold. The index, vectors included, is
+    persisted to its own file, so a new process never re-embeds it, and the
+    embedding model is only loaded on the first lookup.
+
+    Semantic hits are never copied into the exact ResponseCache: a false
+    match stays a near miss instead of becoming the exact answer.
+    """
+
+    def __init__(
+        self,
+        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        path: Optional[str] = None,
+    ):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.model = None
+        self.namespaces: List[Tuple[str, str]] = []
+        self.prompts: List[str] = []
+        self.responses: List[str] = []
+        self.vectors = None
+        self.stats = {"hits": 0, "misses": 0, "hit_seconds": 0.0, "embed_seconds": 0.0}
+
+    def _load(self):
+        if self.model is not None:
+            return
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(self.embedding_model)
+        self.vectors = np.zeros(
+            (0, self.model.get_sentence_embedding_dimension()), dtype=np.float32
+        )
+        if not self.path:
+            return
+        try:
+            with np.load(self.path) as saved:
+                if str(saved["embedding_model"]) != self.embedding_model:
+                    return
+                self.namespaces = list(
+                    zip(saved["models"].tolist(), saved["system_prompts"].tolist())
+                )
+                self.prompts = saved["prompts"].tolist()
+                self.responses = saved["responses"].tolist()
+                self.vectors = saved["vectors"].astype(np.float32)
+        except FileNotFoundError:
+            pass
+
+    def _embed(self, prompts: List[str]):
+        import numpy as np
+
+        started = time.perf_counter()
+        vectors = self.model.encode(
+            [normalize_prompt(prompt) for prompt in prompts],
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        self.stats["embed_seconds"] += time.perf_counter() - started
+        return vectors.astype(np.float32)
+
+    def _append(self, model, system_prompt, prompt, response, vector):
+        import numpy as np
+
+        self.namespaces.append((model, system_prompt))
+        self.prompts.append(prompt)
+        self.responses.append(response)
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+        if len(self.prompts) > self.max_entries:
+            del self.namespaces[0], self.prompts[0], self.responses[0]
+            self.vectors = self.vectors[1:]
+
+    def lookup(
+        self, model: str, system_prompt: str, user_prompt: str
+    ) -> Tuple[Optional[Tuple[float, str, str]], "np.ndarray"]:
+        """Returns ((score, prompt, response) or None, query embedding)."""
+        import numpy as np
+
+        started = time.perf_counter()
+        self._load()
+        vector = self._embed([user_prompt])[0]
+        best = None
+        if len(self.prompts) > 0:
+            scores = self.vectors @ vector
+            for index in np.argsort(-scores):
+                if scores[index] < self.threshold:
+                    break
+                if self.namespaces[index] == (model, system_prompt):
+                    best = (
+                        float(scores[index]),
+                        self.prompts[index],
+                        self.responses[index],
+                    )
+                    break
+        if best:
+            self.stats["hits"] += 1
+            self.stats["hit_seconds"] += time.perf_counter() - started
+        else:
+            self.stats["misses"] += 1
+        return best, vector
+
+    def add(self, model, system_prompt, user_prompt, response, vector=None):
+        self._load()
+        if vector is None:
+            vector = self._embed([user_prompt])[0]
+        self._append(
+            model, system_prompt, normalize_prompt(user_prompt), response, vector
+        )
+
+    def save(self):
+        # Nothing to save when the cache was never used in this process.
+        if not self.path or self.model is None:
+            return
+        import numpy as np
+
+        with open(self.path, "wb") as cache_file:
+            np.savez(
+                cache_file,
+                embedding_model=np.array(self.embedding_model),
+                models=np.array([model for model, _ in self.namespaces], dtype=str),
+                system_prompts=np.array(
+                    [system_prompt for _, system_prompt in self.namespaces], dtype=str
+                ),
+                prompts=np.array(self.prompts, dtype=str),
+                responses=np.array(self.responses, dtype=str),
+                vectors=self.vectors,
+            )
+
+    def summary(self) -> str:
+        hits = self.stats["hits"]
+        hit_avg = self.stats["hit_seconds"] / hits if hits else 0.0
+        return (
+            f"semantic hits={hits} misses={self.stats['misses']}"
+            f" hit_avg={hit_avg * 1e3:.1f}ms"
+            f" embed_seconds={self.stats['embed_seconds']:.3f}"
+            f" entries={len(self.prompts)}"
+        )
+
+
+def answer_query(
+    llm, user_prompt, system_prompt, cache=None, semantic_cache=None
+) -> Tuple[str, str]:
+    """Returns the response and where it came from: exact, semantic or model.
+    Exact and semantic hits are counted by their own cache."""
+    started = time.perf_counter()
+
+    if cache is not None:
+        response = cache.get(llm.model, system_prompt, user_prompt)
+        if response is not None:
+            cache.record(True, time.perf_counter() - started)
+            return response, "exact"
+
+    vector = None
+    if semantic_cache is not None:
+        match, vector = semantic_cache.lookup(llm.model, system_prompt, user_prompt)
+        if match is not None:
+            return match[2], "semantic"
+
+    response = llm(
+        TEMPLATE.format(system_prompt=system_prompt, user_prompt=user_prompt)
+    )
+
+    if cache is not None:
+        cache.put(llm.model, system_prompt, user_prompt, response)
+        cache.record(False, time.perf_counter() - started)
+    if semantic_cache is not None:
+        semantic_cache.add(llm.model, system_prompt, user_prompt, response, vector)
+
+    return response, "model"
+
+
+def get_model_response(
+    llm, user_prompt, system_prompt, cache=None, semantic_cache=None
+):
+    return answer_query(llm, user_prompt, system_prompt, cache, semantic_cache)[0]
+
+
+def normalize_answer(response: str) -> str:
+    return " ".join(
+        "".join(c for c in response.lower() if c.isalnum() or c.isspace()).split()
+    )
+
+
+def replay(llm, questions, system_prompt, cache, semantic_cache, verify=False):
+    """Replays a question log through the caches and reports hit rate, the
+    latency saved relative to calling the model, and, when verify is set, how
+    often cached answers agree with a fresh model answer."""
+    counts = {"exact": 0, "semantic": 0, "model": 0}
+    hit_seconds = 0.0
+    model_seconds = []
+    agreements = []
+
+    for question in questions:
+        started = time.perf_counter()
+        response, source = answer_query(
+            llm, question, system_prompt, cache, semantic_cache
+        )
+        elapsed = time.perf_counter() - started
+        counts[source] += 1
+
+        if source == "model":
+            model_seconds.append(elapsed)
+        else:
+            hit_seconds += elapsed
+            if verify:
+                started = time.perf_counter()
+                fresh = llm(
+                    TEMPLATE.format(system_prompt=system_prompt, user_prompt=question)
+                )
+                model_seconds.append(time.perf_counter() - started)
+                agreements.append(normalize_answer(fresh) == normalize_answer(response))
+
+        print(f"{source}\t{elapsed:.4f}s\t{question}\t{response.strip()}")
+
+    total = sum(counts.values())
+    hits = counts["exact"] + counts["semantic"]
+    model_avg = sum(model_seconds) / len(model_seconds) if model_seconds else 0.0
+    report = {
+        "questions": total,
+        "exact_hits": counts["exact"],
+        "semantic_hits": counts["semantic"],
+        "misses": counts["model"],
+        "hit_rate": hits / total if total else 0.0,
+        "model_avg_seconds": model_avg,
+        "latency_saved_seconds": max(0.0, hits * model_avg - hit_seconds),
+    }
+    if verify:
+        report["verified"] = len(agreements)
+        report["agreement"] = sum(agreements) / len(agreements) if agreements else None
+    return report
+
+
+async def answer_batch(
+    client: "AsyncClient",
+    model: str,
+    questions: List[str],
+    system_prompt: str,
+    concurrency: int = 4,
+    cache: Optional[ResponseCache] = None,
+    emit: Optional[Callable[[str, str], None]] = None,
+) -> List[str]:
+    """Answers questions concurrently with at most `concurrency` requests in
+    flight. Answers are passed to `emit` in input order as soon as every
+    earlier answer is also available."""
+    semaphore = asyncio.Semaphore(concurrency)
+    answers: List[Optional[str]] = [None] * len(questions)
+    next_index = 0
+
+    async def ask(index: int, question: str):
+        nonlocal next_index
+
+        started = time.perf_counter()
+        response = None
+        if cache is not None:
+            response = cache.get(model, system_prompt, question)
+            if response is not None:
+                cache.record(True, time.perf_counter() - started)
+        if response is None:
+            async with semaphore:
+                result = await client.generate(
+                    model=model,
+                    prompt=TEMPLATE.format(
+                        system_prompt=system_prompt, user_prompt=question
+                    ),
+                    options={"stop": ["<|eot_id|>"]},
+                )
+            response = result["response"]
+            if cache is not None:
+                cache.put(model, system_prompt, question, response)
+                cache.record(False, time.perf_counter() - started)
+        answers[index] = response
+
+        while next_index < len(questions) and answers[next_index] is not None:
+            if emit is not None:
+                emit(questions[next_index], answers[next_index])
+            next_index += 1
+
+    await asyncio.gather(*(ask(i, q) for i, q in enumerate(questions)))
+    return answers
+
+
+def run_batch(
+    url: str,
+    model: str,
+    questions: List[str],
+    system_prompt: str,
+    concurrency: int = 4,
+    cache: Optional[ResponseCache] = None,
+    emit: Optional[Callable[[str, str], None]] = None,
+) -> Tuple[List[str], float]:
+    """Runs answer_batch over one pooled connection and returns the answers
+    and the elapsed wall-clock seconds."""
+
+    import httpx
+    from ollama import AsyncClient
+
+    async def run():
+        async with AsyncClient(
+            host=url,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+        ) as client:
+            return await answer_batch(
+                client, model, questions, system_prompt, concurrency, cache, emit
+            )
+
+    started = time.perf_counter()
+    answers = asyncio.run(run())
+    return answers, time.perf_counter() - started
+
+
+def stream_model_response(
+    client: "Client",
+    model: str,
+    user_prompt: str,
+    system_prompt: str,
+    max_words: int = 2,
+    max_chars: int = 40,
+    stop_on_newline: bool = True,
+    emit: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, dict]:
+    """Streams a response, passing text to `emit` as it arrives, and aborts
+    generation once the word or character budget is reached or a newline
+    appears. Returns the response and its timings."""
+    started = time.perf_counter()
+    first_token = None
+    stopped = "done"
+    text = ""
+    printed = 0
+
+    stream = client.generate(
+        model=model,
+        prompt=TEMPLATE.format(system_prompt=system_prompt, user_prompt=user_prompt),
+        options={"stop": ["<|eot_id|>"]},
+        stream=True,
     )
+    try:
+        for chunk in stream:
+            candidate = (text + chunk["response"]).lstrip()
+            if first_token is None and candidate:
+                first_token = time.perf_counter() - started
+
+            words = candidate.split()
+            if stop_on_newline and "\n" in candidate:
+                text, stopped = candidate.split("\n", 1)[0], "newline"
+            elif max_words and (
+                len(words) > max_words
+                or (len(words) == max_words and candidate[-1].isspace())
+            ):
+                text = candidate[: _word_end(candidate, max_words)]
+                stopped = "words"
+            elif max_chars and len(candidate) >= max_chars:
+                text, stopped = candidate[:max_chars], "chars"
+            else:
+                text = candidate
+
+            if emit is not None and len(text) > printed:
+                emit(text[printed:])
+                printed = len(text)
+            if stopped != "done":
+                break
+    finally:
+        # Closing the stream drops the connection, which aborts generation.
+        stream.close()
+
+    timings = {
+        "time_to_first_token": first_token,
+        "total": time.perf_counter() - started,
+        "stopped": stopped,
+    }
+    return text.strip(), timings
+
+
+def _word_end(text: str, count: int) -> int:
+    """Returns the index just past the `count`-th whitespace separated word."""
+    seen = 0
+    in_word = False
+    for index, char in enumerate(text):
+        if char.isspace():
+            if in_word:
+                seen += 1
+                if seen == count:
+                    return index
+            in_word = False
+        else:
+            in_word = True
+    return len(text)
+
+
+def load_llm(model: str, url: str):
+    """The langchain Ollama LLM. The batch and stream modes call Ollama
+    directly and never import langchain."""
+    from langchain_community.llms import Ollama
 
-    # Modified invoking the model
-    response = llm(prompt.format(system_prompt=system_prompt, user_prompt=user_prompt))
+    return Ollama(model=model, base_url=url, stop=["<|eot_id|>"])
 
-    return response
+
+def read_questions(path: str) -> List[str]:
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, "r") as questions_file:
+            lines = questions_file.readlines()
+    return [line.strip() for line in lines if line.strip()]
 
 
 if __name__ == "__main__":
@@ -69,6 +595,97 @@ if __name__ == "__main__":
         default="llama3",
         help="The model to be used for encoding the query and documents. (default: %(default)s)",
     )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="coach8_cache.json",
+        help="The file used to persist responses. Empty to disable. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=86400,
+        help="Seconds before a cached response expires, 0 to never expire. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1000,
+        help="The maximum number of cached responses. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--semantic-threshold",
+        type=float,
+        default=0.0,
+        help="The minimum cosine similarity for a semantic cache hit, 0 to disable. Batch and stream modes only use the exact cache. (default: disabled)",
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        type=str,
+        default="coach8_semantic_cache.npz",
+        help="The file used to persist the semantic cache and its vectors. Empty to keep it in memory. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--semantic-model",
+        type=str,
+        default="sentence-transformers/all-MiniLM-L6-v2",
+        help="The model used to embed questions for the semantic cache. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        help="A file of questions, one per line, to replay through the caches.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="When replaying, also ask the model on cache hits and report answer agreement.",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        help="A file of questions, one per line, or - for stdin, to answer concurrently. Only the exact cache is used in batch mode.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="The maximum number of in-flight requests in batch mode. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sweep",
+        type=str,
+        help="A comma separated list of concurrency levels to measure batch throughput at.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print tokens as they arrive and stop early once the answer is complete.",
+    )
+    parser.add_argument(
+        "--max-words",
+        type=int,
+        default=2,
+        help="In stream mode, stop after this many words, 0 for no limit. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-chars",
+        type=int,
+        default=40,
+        help="In stream mode, stop after this many characters, 0 for no limit. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-newline-stop",
+        dest="newline_stop",
+        action="store_false",
+        help="In stream mode, do not stop at the first newline.",
+    )
     parser.add_argument(
         "query",
         nargs="?",
@@ -76,15 +693,131 @@ if __name__ == "__main__":
         default="What is capital of America?",
         help="The query to process. (default: %(default)s)",
     )
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
 
     supported_models = ["llama3", "llama3:8b", "llama3:70b"]
     if args.model not in supported_models:
         raise ValueError(f"Unsupported model. Choose one of: {supported_models}")
 
-    llm = Ollama(model=args.model, stop=["<|eot_id|>"])
-
     system_prompt = "Give a one or two word answers only."
 
-    with suppress_langchain_deprecation_warning():
-        print(get_model_response(args.query, system_prompt))
+    llm = None
+    if not args.batch and not args.stream:
+        from langchain_core._api.deprecation import (
+            suppress_langchain_deprecation_warning,
+        )
+
+        llm = load_llm(args.model, args.ollama_url)
+
+    cache = None
+    if args.cache:
+        cache = ResponseCache(
+            args.cache, ttl=args.cache_ttl, max_entries=args.cache_size
+        )
+
+    semantic_cache = None
+    if args.semantic_threshold > 0:
+        semantic_cache = SemanticCache(
+            args.semantic_model,
+            threshold=args.semantic_threshold,
+            max_entries=args.cache_size,
+            path=args.semantic_cache,
+        )
+
+    if args.batch and args.sweep:
+        questions = read_questions(args.batch)
+        for level in [int(x) for x in args.sweep.split(",")]:
+            _, elapsed = run_batch(
+                args.ollama_url, args.model, questions, system_prompt, level
+            )
+            print(
+                f"concurrency={level} questions={len(questions)}"
+                f" seconds={elapsed:.3f} qps={len(questions) / elapsed:.2f}"
+            )
+    elif args.batch:
+
+        def emit(question: str, response: str):
+            response = " ".join(response.split())
+            if args.verbose > 0:
+                print(f"{question}\t{response}", flush=True)
+            else:
+                print(response, flush=True)
+
+        questions = read_questions(args.batch)
+        _, elapsed = run_batch(
+            args.ollama_url,
+            args.model,
+            questions,
+            system_prompt,
+            args.concurrency,
+            cache,
+            emit,
+        )
+        if args.verbose > 0:
+            print(
+                f"answered {len(questions)} questions in {elapsed:.3f}s"
+                f" ({len(questions) / elapsed:.2f}/s)",
+                file=sys.stderr,
+            )
+    elif args.stream:
+        started = time.perf_counter()
+        response = None
+        if cache is not None:
+            response = cache.get(args.model, system_prompt, args.query)
+        if response is not None:
+            cache.record(True, time.perf_counter() - started)
+            print(response.strip())
+        else:
+            from ollama import Client
+
+            response, timings = stream_model_response(
+                Client(host=args.ollama_url),
+                args.model,
+                args.query,
+                system_prompt,
+                max_words=args.max_words,
+                max_chars=args.max_chars,
+                stop_on_newline=args.newline_stop,
+                emit=lambda text: print(text, end="", flush=True),
+            )
+            print()
+            if cache is not None:
+                cache.record(False, time.perf_counter() - started)
+                # A stream stopped early is a partial answer, not one to replay.
+                if timings["stopped"] == "done":
+                    cache.put(args.model, system_prompt, args.query, response)
+            ttft = timings["time_to_first_token"]
+            print(
+                f"time_to_first_token={ttft or 0.0:.3f}s"
+                f" total={timings['total']:.3f}s stopped={timings['stopped']}",
+                file=sys.stderr,
+            )
+    elif args.replay:
+        with suppress_langchain_deprecation_warning():
+            report = replay(
+                llm,
+                read_questions(args.replay),
+                system_prompt,
+                cache,
+                semantic_cache,
+                args.verify,
+            )
+        print(json.dumps(report, indent=4))
+    else:
+        with suppress_langchain_deprecation_warning():
+            print(
+                get_model_response(
+                    llm, args.query, system_prompt, cache, semantic_cache
+                )
+            )
+
+    if cache is not None:
+        cache.save()
+        if args.verbose > 0:
+            print(cache.summary(), file=sys.stderr)
+    if semantic_cache is not None:
+        semantic_cache.save()
+        if args.verbose > 0:
+            print(semantic_cache.summary(), file=sys.stderr)
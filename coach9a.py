@@ -17,6 +17,27 @@ examples:
 
     ./.venv/bin/python coach9a.py
 
+    Load a different facts file, 8 concurrent embedding requests at a time:
+
+        ./.venv/bin/python coach9a.py --facts team_facts.jsonl --concurrency 8
+
+    Use a small local sentence-transformer instead of llama3 for embeddings:
+
+        ./.venv/bin/python coach9a.py -m sentence-transformers/all-MiniLM-L6-v2 -c michael_jordan_facts_minilm
+
+    Store facts as sentence-aware chunks of up to 64 tokens, for use with
+    coach9b.py --expand-parents:
+
+        ./.venv/bin/python coach9a.py --chunk-tokens 64 --chunk-overlap 16 -c michael_jordan_facts_chunked
+
+    A BM25 index for coach9b.py --hybrid is kept next to the collection, in
+    team_facts.db/michael_jordan_facts.bm25.json. Skip it with --no-bm25.
+
+    Re-running on an unchanged file does no embedding work, check the
+    "embedded=0" in the summary:
+
+        ./.venv/bin/python coach9a.py
+
 """
 
 
@@ -26,8 +47,179 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 warnings.simplefilter(action="ignore", category=UserWarning)
 
 import argparse
-from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from bm25 import BM25Index, index_path
+from chunking import Chunker
+from embedders import (
+    VERSION_METADATA_KEY,
+    bump_version,
+    check_embedder,
+    load_embedder,
+)
+from runtime import add_runtime_arguments, configure_runtime
+
+CHUNKED_METADATA_KEY = "chunked"
+
+
+def read_facts(path: str) -> Iterator[Tuple[str, str]]:
+    """Yields (id, text) pairs from a JSON lines file of {"id": ..., "text": ...}."""
+    with open(path, "r") as facts_file:
+        for line in facts_file:
+            line = line.strip()
+            if line:
+                fact = json.loads(line)
+                yield fact["id"], fact["text"]
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stored_hashes(collection, ids: List[str], chunked: bool) -> Dict[str, str]:
+    """Returns the content hash stored for each fact id that is present."""
+    if chunked:
+        existing = collection.get(
+            where={"parent_id": {"$in": ids}}, include=["metadatas"]
+        )
+        return {
+            metadata["parent_id"]: metadata.get("content_hash")
+            for metadata in existing["metadatas"]
+        }
+    existing = collection.get(ids=ids, include=["metadatas"])
+    return {
+        fact_id: (metadata or {}).get("content_hash")
+        for fact_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+
+
+def check_chunking(collection, chunker: Optional[Chunker]):
+    """Records whether the collection holds chunks, and refuses to mix
+    chunked and whole facts in one collection."""
+    metadata = dict(collection.metadata or {})
+    chunked = chunker is not None
+    if CHUNKED_METADATA_KEY not in metadata:
+        if collection.count() == 0 or not chunked:
+            metadata[CHUNKED_METADATA_KEY] = chunked
+            collection.modify(metadata=metadata)
+            return
+    if metadata.get(CHUNKED_METADATA_KEY, False) != chunked:
+        raise ValueError(
+            f"Collection {collection.name} was built"
+            f" {'with' if not chunked else 'without'} chunking."
+            " Use the same chunking options or a new collection."
+        )
+
+
+def ingest(
+    collection,
+    embedder,
+    facts: Iterable[Tuple[str, str]],
+    batch_size: int = 64,
+    chunker: Optional[Chunker] = None,
+    index: Optional[BM25Index] = None,
+) -> Dict[str, float]:
+    """Embeds and writes facts whose content changed since the last run.
+
+    Facts are read in batches. For each batch, facts already stored with the
+    same content hash are skipped, the remaining texts are embedded in one
+    embed_documents call, and the results are written with a single upsert.
+
+    With a chunker, each fact is stored as chunks with ids "<id>#<n>" and
+    parent_id, chunk_index, start and end metadata. The content hash also
+    covers the chunker settings, and a changed fact has its old chunks
+    deleted before the new ones are written.
+
+    With a BM25 index, every document written or deleted is also added to or
+    removed from the index.
+    """
+    check_embedder(collection, embedder, record=True)
+    check_chunking(collection, chunker)
+
+    stats = {
+        "docs": 0,
+        "unchanged": 0,
+        "embedded": 0,
+        "embed_seconds": 0.0,
+    }
+    started = time.perf_counter()
+
+    for batch in batched(facts, batch_size):
+        stats["docs"] += len(batch)
+        hashes = {
+            fact_id: content_hash(
+                text if chunker is None else f"{chunker.signature}\n{text}"
+            )
+            for fact_id, text in batch
+        }
+        stored = stored_hashes(collection, list(hashes), chunker is not None)
+
+        changed = [
+            (fact_id, text)
+            for fact_id, text in batch
+            if stored.get(fact_id) != hashes[fact_id]
+        ]
+        stats["unchanged"] += len(batch) - len(changed)
+        if not changed:
+            continue
+
+        records = []
+        if chunker is None:
+            for fact_id, text in changed:
+                records.append((fact_id, text, {"content_hash": hashes[fact_id]}))
+        else:
+            stale = [fact_id for fact_id, _ in changed if fact_id in stored]
+            if stale:
+                where = {"parent_id": {"$in": stale}}
+                if index is not None:
+                    index.remove(collection.get(where=where, include=[])["ids"])
+                collection.delete(where=where)
+            for fact_id, text in changed:
+                for chunk_index, (start, end) in enumerate(chunker.chunk(text)):
+                    metadata = {
+                        "content_hash": hashes[fact_id],
+                        "parent_id": fact_id,
+                        "chunk_index": chunk_index,
+                        "start": start,
+                        "end": end,
+                    }
+                    records.append(
+                        (f"{fact_id}#{chunk_index}", text[start:end], metadata)
+                    )
+
+        embed_started = time.perf_counter()
+        embeddings = embedder.embed_documents([text for _, text, _ in records])
+        stats["embed_seconds"] += time.perf_counter() - embed_started
+        stats["embedded"] += len(records)
+
+        collection.upsert(
+            ids=[record_id for record_id, _, _ in records],
+            documents=[text for _, text, _ in records],
+            embeddings=embeddings,
+            metadatas=[metadata for _, _, metadata in records],
+        )
+        if index is not None:
+            for record_id, text, _ in records:
+                index.add(record_id, text)
+
+    if stats["embedded"]:
+        stats["version"] = bump_version(collection)
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["docs_per_second"] = stats["docs"] / stats["seconds"] if stats["docs"] else 0
+    return stats
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -41,7 +233,7 @@ if __name__ == "__main__":
         "--embedding-model",
         type=str,
         default="llama3",
-        help="The model to be used for encoding the query and documents. (default: %(default)s)",
+        help="The model to be used for encoding the query and documents, an Ollama model or sentence-transformers/<model>. (default: %(default)s)",
     )
     parser.add_argument(
         "-c",
@@ -56,50 +248,101 @@ if __name__ == "__main__":
         default="team_facts.db",
         help="The vector database. (default: %(default)s)",
     )
+    parser.add_argument(
+        "-f",
+        "--facts",
+        type=str,
+        default="michael_jordan_facts.jsonl",
+        help="A JSON lines file of facts with id and text fields. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="The number of facts checked, embedded and written at a time. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="The maximum number of in-flight embedding requests, each batch is split across them. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=0,
+        help="Split facts into chunks of at most this many tokens, 0 to store whole facts. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=16,
+        help="The number of tokens repeated between consecutive chunks. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-sentence-chunks",
+        dest="sentence_chunks",
+        action="store_false",
+        help="Chunk with plain token windows instead of packing whole sentences.",
+    )
+    parser.add_argument(
+        "--no-bm25",
+        dest="bm25",
+        action="store_false",
+        help="Do not maintain the BM25 index used by coach9b.py --hybrid.",
+    )
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
 
-    ollama_emb = OllamaEmbeddings(
-        model=args.embedding_model,
-    )
+    import chromadb
+
+    chromadb_client = chromadb.PersistentClient(path=args.db)
+    collection = chromadb_client.get_or_create_collection(name=args.collection)
 
-    chromadb_client = Chroma(
-        persist_directory=f"{args.db}",
-        collection_name=args.collection,
-        embedding_function=ollama_emb,
+    embedder = load_embedder(
+        args.embedding_model, ollama_url=args.ollama_url, concurrency=args.concurrency
     )
 
-    ids, texts = zip(
-        *[
-            ("mj1", "Michael Jordan is a retired professional basketball player."),
-            (
-                "mj2",
-                "In 1984 Jordan, a guard standing 6 feet 6 inches (1.98 meters), was drafted by the Chicago Bulls. He quickly became known as an exceptionally talented shooter and passer and a tenacious defender. In his first season (1984-85), he led the league in scoring and was named Rookie of the Year; after missing most of the following season with a broken foot, he returned to lead the NBA in scoring for seven consecutive seasons, averaging about 33 points per game. He was only the second player (after Wilt Chamberlain) to score 3,000 points in a single season (1986-87). Jordan was named the NBA's Most Valuable Player (MVP) five times (1988, 1991, 1992, 1996, 1998) and was also named Defensive Player of the Year in 1988.",
-            ),
-            (
-                "mj3",
-                "Jordan grew up in Wilmington, North Carolina, and entered the University of North Carolina at Chapel Hill in 1981. As a freshman, he made the winning basket against Georgetown in the 1982 national championship game. Jordan was named College Player of the Year in both his sophomore and junior years, leaving North Carolina after his junior year. He led the U.S. basketball team to Olympic gold medals in 1984 in Los Angeles and in 1992 in Barcelona, Spain. The players who competed in the latter Games became known as the Dream Team.",
-            ),
-            (
-                "mj4",
-                "In October 1993, after leading the Bulls to their third consecutive championship, Jordan retired briefly and pursued a career in professional baseball. He returned to basketball in March 1995. In the 1995-96 season Jordan led the Bulls to a 72-10 regular season record, the best in the history of the NBA (broken in 2015-16 by the Golden State Warriors). From 1996 to 1998 the Jordan-led Bulls again won three championships in a row, and each time Jordan was named MVP of the NBA finals. After the 1997-98 season Jordan retired again.",
-            ),
-            (
-                "mj5",
-                'During this time Jordan earned the nickname "Air Jordan" because of his extraordinary leaping ability and acrobatic maneuvers, and his popularity reached heights few athletes (or celebrities of any sort) have known. He accumulated millions of dollars from endorsements, most notably for his Nike Air Jordan basketball shoes.',
-            ),
-            (
-                "mj6",
-                "Jordan remained close to the sport, buying a share of the Washington Wizards in January 2000. He was also appointed president of basketball operations for the club. However, managing rosters and salary caps was not enough for Jordan, and in September 2001 he renounced his ownership and management positions with the Wizards in order to be a player on the team. His second return to the NBA was greeted with enthusiasm by the league, which had suffered declining attendance and television ratings since his 1998 retirement. After the 2002-03 season, Jordan announced his final retirement. He ended his career with 32,292 total points and a 30.1-points-per-game average, which was the best in league history at that time, as well as 2,514 steals, then the second most ever.",
-            ),
-            (
-                "mj7",
-                "In 2006 Jordan became minority owner and general manager of the NBA's Charlotte Bobcats (now known as the Charlotte Hornets). He bought a controlling interest in the team in 2010 and became the first former NBA player to become a majority owner of one of the league's franchises. Jordan sold his share in 2023.",
-            ),
-            (
-                "mj8",
-                "Jordan made a successful film, Space Jam (1996), in which he starred with animated characters Bugs Bunny and Daffy Duck. In 1996 the NBA named him one of the 50 greatest players of all time, and in 2009 he was elected to the Naismith Memorial Basketball Hall of Fame. He was awarded the Presidential Medal of Freedom in 2016.",
-            ),
-        ]
+    chunker = None
+    if args.chunk_tokens > 0:
+        chunker = Chunker(
+            args.chunk_tokens, args.chunk_overlap, sentence_aware=args.sentence_chunks
+        )
+
+    index = None
+    if args.bm25:
+        # The index is rebuilt from the collection whenever it is missing or
+        # was saved at a different version, then kept up to date incrementally.
+        path = index_path(args.db, args.collection)
+        version = (collection.metadata or {}).get(VERSION_METADATA_KEY, 0)
+        if os.path.exists(path):
+            index = BM25Index.load(path)
+        if index is None or index.version != version:
+            index = BM25Index.from_collection(collection)
+
+    stats = ingest(
+        collection,
+        embedder,
+        read_facts(args.facts),
+        batch_size=args.batch_size,
+        chunker=chunker,
+        index=index,
     )
 
-    chromadb_client.add_texts(texts=list(texts), ids=list(ids))
+    if index is not None:
+        index.version = (collection.metadata or {}).get(VERSION_METADATA_KEY, 0)
+        index.save(path)
+
+    print(
+        f"docs={stats['docs']} unchanged={stats['unchanged']}"
+        f" embedded={stats['embedded']} embed_seconds={stats['embed_seconds']:.3f}"
+        f" seconds={stats['seconds']:.3f} docs/sec={stats['docs_per_second']:.1f}",
+        file=sys.stderr,
+    )
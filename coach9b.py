@@ -17,21 +17,536 @@ examples:
 
     ./.venv/bin/python coach9b.py
 
+    Query a collection built with a sentence-transformer embedder (see coach9a.py):
+
+        ./.venv/bin/python coach9b.py -m sentence-transformers/all-MiniLM-L6-v2 -c michael_jordan_facts_minilm
+
+    Keep the prompt small, trimming retrieved facts to 200 tokens and only the
+    sentences relevant to the question:
+
+        ./.venv/bin/python coach9b.py -v --context-tokens 200 --extract-sentences
+
+    Query a chunked collection, expanding to the whole fact only when several
+    of its chunks are retrieved:
+
+        ./.venv/bin/python coach9b.py -v -c michael_jordan_facts_chunked --expand-parents auto
+
+    Fuse vector search with BM25, skipping the embedding call when one fact
+    is a clear lexical match:
+
+        ./.venv/bin/python coach9b.py -v --hybrid --lexical-margin 2 "What happened in 1993?"
+
+    Serve questions from a long running process that keeps the retriever and
+    LLM warm:
+
+        ./.venv/bin/python coach9b.py --serve --port 8009
+
+        curl -s localhost:8009/ask -d '{"query": "What is Michael Jordan known for?"}'
+
+        curl -s localhost:8009/stats
+
+    Load test it (see bench_rag.py):
+
+        ./.venv/bin/python bench_rag.py --url http://127.0.0.1:8009 --requests 200 --concurrency 16
+
 """
 
 
 import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import struct
+import sys
+import threading
+import time
 import warnings
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from runtime import add_runtime_arguments, configure_runtime
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 warnings.simplefilter(action="ignore", category=UserWarning)
 
-from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain.prompts import PromptTemplate
+from bm25 import BM25Index, confident, index_path, reciprocal_rank_fusion
+from chunking import stitch
+from context_budget import budget_context, count_tokens
+from embedders import VERSION_METADATA_KEY, check_embedder, load_embedder
+
+template = """
+You are a helpful AI assistant.
+Answer based on the context provided. 
+context: {context}
+input: {input}
+answer:
+"""
+
+STAGES = ["lexical", "embed", "retrieve", "expand", "compress", "generate", "total"]
+EXPAND_MODES = ["never", "auto", "always"]
+
+
+class StageTimings:
+    """Collects per-stage latencies across requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def add(self, timings: Dict[str, float]):
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            summary = {}
+            for stage, samples in self.samples.items():
+                if not samples:
+                    continue
+                ordered = sorted(samples)
+                summary[stage] = {
+                    "count": len(ordered),
+                    "mean": statistics.fmean(ordered),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                }
+            return summary
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class RetrievalCache:
+    """A two-level cache in front of the embed and retrieve stages.
+
+    The first level maps normalized question text to its embedding. The
+    second maps (embedding, k, collection version) to the retrieved ids and
+    documents. coach9a bumps the "version" on the collection metadata
+    whenever it writes, and the version is re-read at most every
+    `check_interval` seconds, so results are invalidated automatically.
+    """
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        max_entries: int = 1024,
+        check_interval: float = 1.0,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.embeddings: OrderedDict = OrderedDict()
+        self.results: OrderedDict = OrderedDict()
+        self.current_version = None
+        self.checked_at = 0.0
+        self.stats = {
+            "embedding_hits": 0,
+            "embedding_misses": 0,
+            "result_hits": 0,
+            "result_misses": 0,
+            "invalidations": 0,
+        }
+
+    def version(self) -> int:
+        now = time.monotonic()
+        with self.lock:
+            if (
+                self.current_version is not None
+                and now - self.checked_at <= self.check_interval
+            ):
+                return self.current_version
+        # Read outside the lock so lookups are not held up by the request.
+        metadata = self.client.get_collection(self.collection_name).metadata or {}
+        version = metadata.get(VERSION_METADATA_KEY, 0)
+        with self.lock:
+            # A request that started later has already applied a newer read.
+            if self.current_version is not None and now < self.checked_at:
+                return self.current_version
+            if self.current_version is not None and version != self.current_version:
+                self.results.clear()
+                self.stats["invalidations"] += 1
+            self.current_version = version
+            self.checked_at = now
+            return version
+
+    def _get(self, entries: OrderedDict, key, stat: str):
+        with self.lock:
+            value = entries.get(key)
+            self.stats[f"{stat}_{'hits' if value is not None else 'misses'}"] += 1
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries: OrderedDict, key, value):
+        with self.lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    @staticmethod
+    def _result_key(vector: List[float], k: int, version: int) -> str:
+        digest = hashlib.sha256(struct.pack(f"{len(vector)}d", *vector)).hexdigest()
+        return f"{digest}:{k}:{version}"
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        return self._get(self.embeddings, normalize_query(query), "embedding")
+
+    def put_embedding(self, query: str, vector: List[float]):
+        self._put(self.embeddings, normalize_query(query), vector)
+
+    def get_result(self, vector: List[float], k: int):
+        key = self._result_key(vector, k, self.version())
+        return self._get(self.results, key, "result")
+
+    def put_result(self, vector: List[float], k: int, result):
+        self._put(self.results, self._result_key(vector, k, self.version()), result)
+
+    def summary(self) -> Dict[str, float]:
+        with self.lock:
+            summary = dict(self.stats)
+            for level in ["embedding", "result"]:
+                lookups = summary[f"{level}_hits"] + summary[f"{level}_misses"]
+                summary[f"{level}_hit_rate"] = (
+                    summary[f"{level}_hits"] / lookups if lookups else 0.0
+                )
+            summary["version"] = self.current_version
+            return summary
+
+
+class RAGPipeline:
+    """Answers questions from a chromadb collection with an Ollama LLM.
+
+    The stages of the retrieval chain (embed the question, retrieve the k
+    nearest facts, generate an answer from the stuffed prompt) are run
+    explicitly so each can be timed, and so the collection, embedder and LLM
+    client are built once and reused across requests.
+
+    When `context_tokens` is set, or `extract_sentences` is enabled, the
+    retrieved facts are ranked, deduplicated and trimmed to the token budget
+    before being stuffed into the prompt (see context_budget.py).
+
+    When the collection was built from chunks (coach9a.py --chunk-tokens),
+    `expand_parents` controls when retrieved chunks are replaced by the whole
+    fact they came from: "never", "always", or "auto" to expand only the
+    facts that two or more retrieved chunks came from.
+
+    When a BM25 index is given (`lexical`), its ranking is fused with the
+    vector search. With `lexical_margin`, questions whose best BM25 hit
+    outscores the runner-up by that factor skip the embedding call and use
+    the BM25 ranking alone. With `lexical_path` and a cache, the index is
+    reloaded from that file once the cache sees a newer collection version.
+
+    When a RetrievalCache is given, repeated questions skip the embed,
+    retrieve and expand stages.
+    """
+
+    def __init__(
+        self,
+        collection,
+        embedder,
+        model: str = "llama3",
+        ollama_url: str = None,
+        k: int = 5,
+        context_tokens: int = 0,
+        extract_sentences: bool = False,
+        cache: Optional[RetrievalCache] = None,
+        expand_parents: str = "auto",
+        lexical: Optional[BM25Index] = None,
+        lexical_margin: float = 0.0,
+        lexical_path: Optional[str] = None,
+    ):
+        self.collection = collection
+        self.embedder = embedder
+        self.model = model
+        self.ollama_url = ollama_url
+        self.k = k
+        self.context_tokens = context_tokens
+        self.extract_sentences = extract_sentences
+        self.cache = cache
+        self.expand_parents = expand_parents
+        self.lexical = lexical
+        self.lexical_margin = lexical_margin
+        self.lexical_path = lexical_path
+        self.lexical_lock = threading.Lock()
+        self.lexical_checked = 0.0
+        self.client = None
+        self.loop = None
+        self.timings = StageTimings()
+
+    def expand(self, context: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        """Replaces retrieved (id, text, parent_id) chunks with their parent
+        fact, rebuilt from all of its chunks, keeping retrieval order."""
+        parents = [parent_id for _, _, parent_id in context]
+        if self.expand_parents == "always":
+            expand = set(parents)
+        elif self.expand_parents == "auto":
+            expand = {
+                parent_id for parent_id in parents if parents.count(parent_id) > 1
+            }
+        else:
+            expand = set()
+        if not expand:
+            return context
+
+        result = self.collection.get(
+            where={"parent_id": {"$in": sorted(expand)}},
+            include=["documents", "metadatas"],
+        )
+        chunks: Dict[str, List] = {}
+        for text, metadata in zip(result["documents"], result["metadatas"]):
+            chunks.setdefault(metadata["parent_id"], []).append(
+                (metadata["start"], metadata["end"], text)
+            )
+
+        expanded = []
+        seen = set()
+        for id, text, parent_id in context:
+            if parent_id not in chunks:
+                expanded.append((id, text, parent_id))
+            elif parent_id not in seen:
+                seen.add(parent_id)
+                expanded.append((parent_id, stitch(chunks[parent_id]), parent_id))
+        return expanded
+
+    def fetch(self, ids: List[str]) -> List[Tuple[str, str, str]]:
+        """Reads (id, text, parent_id) for the given ids, in the same order."""
+        if not ids:
+            return []
+        result = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {
+            id: (id, text, (metadata or {}).get("parent_id", id))
+            for id, text, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        }
+        return [found[id] for id in ids if id in found]
+
+    def fuse(self, context, lexical_hits) -> List[Tuple[str, str, str]]:
+        """Merges the vector and BM25 rankings with reciprocal rank fusion."""
+        by_id = {entry[0]: entry for entry in context}
+        fused = reciprocal_rank_fusion([list(by_id), [id for id, _ in lexical_hits]])
+        fused = fused[: self.k]
+        by_id.update(
+            (entry[0], entry)
+            for entry in self.fetch([id for id in fused if id not in by_id])
+        )
+        return [by_id[id] for id in fused if id in by_id]
+
+    def refresh_lexical(self) -> bool:
+        """Reloads the BM25 index when the collection has moved past the
+        version it was saved at. coach9a.py saves the index after it writes,
+        so a reload that still finds the old version is retried after the
+        cache's check interval. Returns whether the index is current."""
+        if self.lexical is None or self.cache is None:
+            return True
+        version = self.cache.version()
+        with self.lexical_lock:
+            if self.lexical.version == version or self.lexical_path is None:
+                return self.lexical.version == version
+            now = time.monotonic()
+            if now - self.lexical_checked < self.cache.check_interval:
+                return False
+            self.lexical_checked = now
+            try:
+                self.lexical = BM25Index.load(self.lexical_path)
+            except (OSError, ValueError) as error:
+                print(
+                    f"warning: cannot reload the BM25 index: {error}", file=sys.stderr
+                )
+            return self.lexical.version == version
+
+    async def retrieve(self, query: str, timings: Dict[str, float]):
+        """Returns the retrieved (id, text, parent_id) context and how it was
+        retrieved: "vector", "hybrid" or "lexical"."""
+        lexical_hits = []
+        # Results fused with an outdated index are not cached for the new version.
+        lexical_current = await asyncio.to_thread(self.refresh_lexical)
+        if self.lexical is not None:
+            mark = time.perf_counter()
+            lexical_hits = self.lexical.search(query, self.k)
+            timings["lexical"] = time.perf_counter() - mark
+
+        if self.lexical_margin and confident(lexical_hits, self.lexical_margin):
+            # A clear lexical winner, the question does not need embedding.
+            mark = time.perf_counter()
+            context = await asyncio.to_thread(
+                self.fetch, [id for id, _ in lexical_hits]
+            )
+            timings["retrieve"] = time.perf_counter() - mark
+            mark = time.perf_counter()
+            context = await asyncio.to_thread(self.expand, context)
+            timings["expand"] = time.perf_counter() - mark
+            return context, "lexical"
+
+        retrieval = "hybrid" if self.lexical is not None else "vector"
+        mark = time.perf_counter()
+        vector = self.cache.get_embedding(query) if self.cache else None
+        if vector is None:
+            vector = await asyncio.to_thread(self.embedder.embed_query, query)
+            if self.cache:
+                self.cache.put_embedding(query, vector)
+        timings["embed"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        context = self.cache.get_result(vector, self.k) if self.cache else None
+        if context is not None:
+            timings["retrieve"] = time.perf_counter() - mark
+            return context, retrieval
+
+        result = await asyncio.to_thread(
+            self.collection.query,
+            query_embeddings=[vector],
+            n_results=self.k,
+            include=["documents", "metadatas"],
+        )
+        context = [
+            (id, text, (metadata or {}).get("parent_id", id))
+            for id, text, metadata in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0]
+            )
+        ]
+        if lexical_hits:
+            context = await asyncio.to_thread(self.fuse, context, lexical_hits)
+        timings["retrieve"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        context = await asyncio.to_thread(self.expand, context)
+        timings["expand"] = time.perf_counter() - mark
+        if self.cache and lexical_current:
+            self.cache.put_result(vector, self.k, context)
+        return context, retrieval
+
+    async def aanswer(self, query: str) -> Dict:
+        if self.client is None:
+            from ollama import AsyncClient
+
+            self.client = AsyncClient(host=self.ollama_url)
+
+        timings = {}
+        started = time.perf_counter()
+        context, retrieval = await self.retrieve(query, timings)
+
+        if self.context_tokens or self.extract_sentences:
+            mark = time.perf_counter()
+            parent_ids = {id: parent_id for id, _, parent_id in context}
+            budgeted = budget_context(
+                query,
+                [(id, text) for id, text, _ in context],
+                max_tokens=self.context_tokens or None,
+                sentences=self.extract_sentences,
+            )
+            context = [(id, text, parent_ids[id]) for id, text in budgeted]
+            timings["compress"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        prompt = template.format(
+            context="\n\n".join(text for _, text, _ in context), input=query
+        )
+        response = await self.client.generate(
+            model=self.model, prompt=prompt, options={"stop": ["<|eot_id|>"]}
+        )
+        timings["generate"] = time.perf_counter() - mark
+        timings["total"] = time.perf_counter() - started
+
+        self.timings.add(timings)
+        return {
+            "input": query,
+            "context": [
+                {"id": id, "parent_id": parent_id, "page_content": text}
+                for id, text, parent_id in context
+            ],
+            "answer": response["response"],
+            "retrieval": retrieval,
+            "prompt_tokens": count_tokens(prompt),
+            "timings": timings,
+        }
+
+    def answer(self, query: str) -> Dict:
+        # The LLM client is bound to the loop that first uses it, so repeated
+        # calls share one loop instead of asyncio.run creating a new one each time.
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self.aanswer(query))
+
+
+def serve(pipeline: RAGPipeline, host: str, port: int, verbose: int = 0):
+    """Serves POST /ask {"query": ...} and GET /stats over HTTP.
+
+    Requests are accepted on a thread per connection and handed to a single
+    event loop, so retrieval and generation for concurrent requests overlap
+    while sharing the warm pipeline.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    started = time.perf_counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if verbose > 0:
+                super().log_message(format, *args)
+
+        def _send_json(self, status: int, body: Dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                summary = pipeline.timings.summary()
+                requests = summary.get("total", {}).get("count", 0)
+                uptime = time.perf_counter() - started
+                self._send_json(
+                    200,
+                    {
+                        "requests": requests,
+                        "uptime_seconds": uptime,
+                        "stages": summary,
+                        "cache": pipeline.cache.summary() if pipeline.cache else None,
+                    },
+                )
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/ask":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                query = json.loads(self.rfile.read(length))["query"]
+                if not isinstance(query, str):
+                    raise TypeError("query is not a string")
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {"error": 'expected {"query": "..."}'})
+                return
+            future = asyncio.run_coroutine_threadsafe(pipeline.aanswer(query), loop)
+            try:
+                self._send_json(200, future.result())
+            except Exception as error:
+                self._send_json(500, {"error": str(error)})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print(f"Listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
 
 
 if __name__ == "__main__":
@@ -46,7 +561,7 @@ if __name__ == "__main__":
         "--embedding-model",
         type=str,
         default="llama3",
-        help="The model to be used for encoding the query and documents. (default: %(default)s)",
+        help="The model to be used for encoding the query and documents, an Ollama model or sentence-transformers/<model>. (default: %(default)s)",
     )
     parser.add_argument(
         "-c",
@@ -61,6 +576,63 @@ if __name__ == "__main__":
         default="team_facts.db",
         help="The vector database. (default: %(default)s)",
     )
+    parser.add_argument(
+        "--ollama-url",
+        type=str,
+        default=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+        help="The Ollama server. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=0,
+        help="Rank, deduplicate and trim retrieved facts to this many tokens, 0 to stuff them all. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--extract-sentences",
+        action="store_true",
+        help="Keep only the sentences of each retrieved fact that share terms with the question.",
+    )
+    parser.add_argument(
+        "--expand-parents",
+        choices=EXPAND_MODES,
+        default="auto",
+        help="When to replace retrieved chunks with the whole fact they came from, auto expands facts matched by two or more chunks. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--hybrid",
+        action="store_true",
+        help="Fuse the vector search with the BM25 index built by coach9a.py.",
+    )
+    parser.add_argument(
+        "--lexical-margin",
+        type=float,
+        default=0.0,
+        help="With --hybrid, skip embedding the question when the best BM25 hit scores this many times the runner-up, 0 to always embed. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="The number of question embeddings and retrieval results to cache, 0 to disable. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep running and answer questions over HTTP.",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="The address to serve on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8009,
+        help="The port to serve on. (default: %(default)s)",
+    )
     parser.add_argument(
         "query",
         nargs="?",
@@ -68,35 +640,63 @@ if __name__ == "__main__":
         default="What is Michael Jordan known for?",
         help="The message to process (default: %(default)s)",
     )
+    add_runtime_arguments(parser)
     args = parser.parse_args()
+    configure_runtime(args)
 
-    ollama_emb = OllamaEmbeddings(
-        model=args.embedding_model,
-    )
+    embedder = load_embedder(args.embedding_model, ollama_url=args.ollama_url)
 
-    chromadb_client = Chroma(
-        persist_directory=f"{args.db}",
-        collection_name=args.collection,
-        embedding_function=ollama_emb,
-    )
-    retriever = chromadb_client.as_retriever(search_kwargs={"k": 5})
+    import chromadb
 
-    llm = Ollama(model="llama3", stop=["<|eot_id|>"])
+    persistent_client = chromadb.PersistentClient(path=args.db)
+    collection = persistent_client.get_collection(args.collection)
+    check_embedder(collection, embedder)
 
-    template = """
-You are a helpful AI assistant.
-Answer based on the context provided. 
-context: {context}
-input: {input}
-answer:
-"""
-    prompt = PromptTemplate.from_template(template)
-    combine_docs_chain = create_stuff_documents_chain(llm, prompt)
-    retrieval_chain = create_retrieval_chain(retriever, combine_docs_chain)
+    lexical = None
+    if args.hybrid:
+        lexical = BM25Index.load(index_path(args.db, args.collection))
+        version = (collection.metadata or {}).get(VERSION_METADATA_KEY, 0)
+        if lexical.version != version:
+            print(
+                f"warning: the BM25 index is at version {lexical.version} and the"
+                f" collection at {version}, re-run coach9a.py to update it",
+                file=sys.stderr,
+            )
 
-    response = retrieval_chain.invoke({"input": args.query})
+    cache = None
+    if args.cache_size > 0:
+        cache = RetrievalCache(
+            persistent_client, args.collection, max_entries=args.cache_size
+        )
 
-    if args.verbose > 1:
-        print(response)
+    pipeline = RAGPipeline(
+        collection,
+        embedder,
+        model="llama3",
+        ollama_url=args.ollama_url,
+        k=5,
+        context_tokens=args.context_tokens,
+        extract_sentences=args.extract_sentences,
+        cache=cache,
+        expand_parents=args.expand_parents,
+        lexical=lexical,
+        lexical_margin=args.lexical_margin,
+        lexical_path=index_path(args.db, args.collection) if args.hybrid else None,
+    )
+
+    if args.serve:
+        serve(pipeline, args.host, args.port, args.verbose)
     else:
-        print(response["answer"])
+        response = pipeline.answer(args.query)
+
+        if args.verbose > 1:
+            print(response)
+        else:
+            print(response["answer"])
+        if args.verbose > 0:
+            print(
+                " ".join(f"{k}={v:.3f}s" for k, v in response["timings"].items()),
+                f"prompt_tokens={response['prompt_tokens']}",
+                f"retrieval={response['retrieval']}",
+                file=sys.stderr,
+            )
@@ -0,0 +1,168 @@
+"""Rank, deduplicate and trim retrieved documents to fit a prompt token budget.
+
+Token counts are estimated with a word-and-punctuation split, which tracks
+the llama3 tokenizer closely enough for budgeting without loading it.
+
+"""
+
+import re
+from typing import List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+STOPWORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "as",
+    "at",
+    "be",
+    "by",
+    "did",
+    "do",
+    "does",
+    "for",
+    "from",
+    "he",
+    "his",
+    "how",
+    "in",
+    "is",
+    "it",
+    "many",
+    "of",
+    "on",
+    "or",
+    "the",
+    "to",
+    "was",
+    "were",
+    "what",
+    "when",
+    "where",
+    "which",
+    "who",
+    "why",
+    "with",
+}
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in SENTENCE_PATTERN.split(text.strip()) if sentence]
+
+
+def terms(text: str) -> Set[str]:
+    return {
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+    }
+
+
+def shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(text.lower())
+    return {tuple(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def overlap(query_terms: Set[str], text: str) -> float:
+    if not query_terms:
+        return 0.0
+    return len(query_terms & terms(text)) / len(query_terms)
+
+
+def rank(query: str, documents: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Orders (id, text) pairs, given in retrieval order, by a blend of
+    retrieval rank and the fraction of query terms each one contains."""
+    query_terms = terms(query)
+    scored = [
+        (1.0 / (1 + position) + overlap(query_terms, text), position, (id, text))
+        for position, (id, text) in enumerate(documents)
+    ]
+    return [document for _, _, document in sorted(scored, key=lambda s: (-s[0], s[1]))]
+
+
+def deduplicate(
+    documents: List[Tuple[str, str]], threshold: float = 0.5
+) -> List[Tuple[str, str]]:
+    """Drops documents whose word 3-gram Jaccard similarity with an earlier
+    kept document is at or above the threshold."""
+    kept = []
+    kept_shingles = []
+    for id, text in documents:
+        candidate = shingles(text)
+        if any(
+            len(candidate & other) / len(candidate | other) >= threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append((id, text))
+        kept_shingles.append(candidate)
+    return kept
+
+
+def extract_sentences(query: str, text: str) -> str:
+    """Keeps only the sentences that share a term with the query, in their
+    original order, falling back to the first sentence."""
+    query_terms = terms(query)
+    sentences = split_sentences(text)
+    relevant = [s for s in sentences if overlap(query_terms, s) > 0]
+    return " ".join(relevant or sentences[:1])
+
+
+def truncate(text: str, max_tokens: int, split_sentence: bool = True) -> str:
+    """Cuts text to at most max_tokens at a sentence boundary. If not even
+    the first sentence fits, cuts it mid-sentence when `split_sentence` is
+    set, otherwise returns an empty string."""
+    kept = []
+    used = 0
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept or not split_sentence:
+        return " ".join(kept)
+    matches = list(TOKEN_PATTERN.finditer(text))
+    if len(matches) <= max_tokens:
+        return text
+    return text[: matches[max_tokens].start()].rstrip() if max_tokens else ""
+
+
+def budget_context(
+    query: str,
+    documents: List[Tuple[str, str]],
+    max_tokens: Optional[int] = None,
+    sentences: bool = False,
+    dedup_threshold: float = 0.5,
+) -> List[Tuple[str, str]]:
+    """Ranks, deduplicates, optionally reduces to query-relevant sentences,
+    and trims (id, text) pairs so their combined size fits max_tokens, if
+    given."""
+    documents = deduplicate(rank(query, documents), dedup_threshold)
+    if sentences:
+        documents = [(id, extract_sentences(query, text)) for id, text in documents]
+
+    if max_tokens is None:
+        return documents
+
+    budgeted = []
+    remaining = max_tokens
+    for id, text in documents:
+        if remaining <= 0:
+            break
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            # Only the most relevant document is worth a partial sentence.
+            text = truncate(text, remaining, split_sentence=not budgeted)
+            tokens = count_tokens(text)
+            if not text:
+                break
+        budgeted.append((id, text))
+        remaining -= tokens
+    return budgeted
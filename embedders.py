@@ -0,0 +1,129 @@
+"""Pluggable embedding models for the chromadb collections used by coach9a and coach9b.
+
+An embedder has `embed_documents`, `embed_query` and a stable `name`.
+The name is recorded on the collection when it is first written, so a
+collection built with one embedder cannot silently be queried with another.
+The collection also records a version that is bumped on every write.
+
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from registry import REGISTRY
+
+EMBEDDER_METADATA_KEY = "embedder"
+VERSION_METADATA_KEY = "version"
+
+
+class OllamaEmbedder:
+    """Embeds texts through Ollama's batch embed endpoint, splitting a batch
+    into up to `concurrency` requests in flight over one pooled connection.
+
+    Documents and queries get the "passage: " and "query: " prefixes that
+    LangChain's OllamaEmbeddings adds, which the first coach9a.py used.
+    """
+
+    document_prefix = "passage: "
+    query_prefix = "query: "
+
+    def __init__(self, model: str, url: str = None, concurrency: int = 4):
+        self.model = model
+        self.concurrency = concurrency
+        from ollama import Client
+
+        self.client = Client(
+            host=url or os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        )
+
+    @property
+    def name(self) -> str:
+        # Not "ollama:", which collections embedded through /api/embeddings
+        # recorded. Those vectors are not normalized and do not compare.
+        return f"ollama-embed:{self.model}"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return list(self.client.embed(model=self.model, input=texts)["embeddings"])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([self.query_prefix + text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [self.document_prefix + text for text in texts]
+        if len(texts) <= 1 or self.concurrency <= 1:
+            return self._embed(texts) if texts else []
+        size = -(-len(texts) // self.concurrency)
+        slices = [texts[start : start + size] for start in range(0, len(texts), size)]
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            return [
+                vector
+                for vectors in executor.map(self._embed, slices)
+                for vector in vectors
+            ]
+
+
+class SentenceTransformerEmbedder:
+    """Embeds texts in-process with a sentence-transformers model, shared
+    through the model registry."""
+
+    def __init__(self, model: str, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+        self.encoder = REGISTRY.sentence_transformer(model)
+
+    @property
+    def name(self) -> str:
+        return f"sentence-transformers:{self.model}"
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encoder.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True
+        ).tolist()
+
+
+def load_embedder(spec: str, ollama_url: str = None, concurrency: int = 4):
+    """Creates an embedder from a model spec.
+
+    "ollama:<model>" and bare model names such as "llama3" use Ollama;
+    "st:<model>" and "sentence-transformers/<model>" run a sentence-transformer
+    locally.
+    """
+    if spec.startswith("st:"):
+        return SentenceTransformerEmbedder(spec[len("st:") :])
+    if spec.startswith("sentence-transformers:"):
+        return SentenceTransformerEmbedder(spec[len("sentence-transformers:") :])
+    if spec.startswith("sentence-transformers/"):
+        return SentenceTransformerEmbedder(spec)
+    if spec.startswith("ollama:"):
+        spec = spec[len("ollama:") :]
+    return OllamaEmbedder(spec, url=ollama_url, concurrency=concurrency)
+
+
+def bump_version(collection) -> int:
+    """Increments the collection's version, so that caches of its query
+    results know to invalidate."""
+    metadata = dict(collection.metadata or {})
+    metadata[VERSION_METADATA_KEY] = metadata.get(VERSION_METADATA_KEY, 0) + 1
+    collection.modify(metadata=metadata)
+    return metadata[VERSION_METADATA_KEY]
+
+
+def check_embedder(collection, embedder, record: bool = False):
+    """Raises ValueError if the collection was built with a different
+    embedder. When `record` is set and the collection has no embedder
+    recorded yet, records this one."""
+    metadata = dict(collection.metadata or {})
+    built_with = metadata.get(EMBEDDER_METADATA_KEY)
+    if built_with is None:
+        if record:
+            metadata[EMBEDDER_METADATA_KEY] = embedder.name
+            collection.modify(metadata=metadata)
+        return
+    if built_with != embedder.name:
+        raise ValueError(
+            f"Collection {collection.name} was built with {built_with},"
+            f" not {embedder.name}. Use the same embedding model or a new collection."
+        )
@@ -0,0 +1,288 @@
+"""A local stand-in for the Hugging Face Hub download API.
+
+This server answers the subset of the Hub API used by snapshot_download
+(repo info, file tree and resolve) for any model or dataset id, with small
+generated files and configurable latency and per-connection bandwidth, so
+cache.py can be exercised without network access or large downloads.
+
+"""
+
+__usage__ = """
+examples:
+
+    Run a stand-in with 2MB weight files, 100ms per request and 4MB/s per
+    connection:
+
+        ./.venv/bin/python hub_stub.py --port 8011 --file-size 2000000 --latency 0.1 --bandwidth 4000000
+
+    Point cache.py at it, with a scratch cache:
+
+        HF_HOME=/tmp/hub_stub_cache ./.venv/bin/python cache.py --endpoint http://127.0.0.1:8011 --skip-ollama
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+CHUNK_SIZE = 64 * 1024
+API_PATTERN = re.compile(
+    r"^/api/(?P<kind>models|datasets)/(?P<repo>.+?)"
+    r"(?:/(?P<action>revision|tree)/(?P<revision>[^/]+)(?:/(?P<path>.*))?)?$"
+)
+RESOLVE_PATTERN = re.compile(
+    r"^/(?:(?P<kind>datasets)/)?(?P<repo>.+?)/resolve/(?P<revision>[^/]+)/(?P<path>.+)$"
+)
+
+
+class StubRepo:
+    """A generated repo: a couple of small text files and one weights file."""
+
+    def __init__(self, kind: str, repo_id: str, file_size: int):
+        self.kind = kind
+        self.repo_id = repo_id
+        seed = f"{kind}/{repo_id}"
+        self.commit = hashlib.sha1(seed.encode("utf-8")).hexdigest()
+        weights = "data/train.parquet" if kind == "datasets" else "model.safetensors"
+        self.files: Dict[str, bytes] = {
+            "README.md": f"# {repo_id}\n\nA hub_stub.py repo.\n".encode("utf-8"),
+            "config.json": json.dumps({"_name_or_path": repo_id}).encode("utf-8"),
+            weights: self._generate(f"{seed}/{weights}", file_size),
+        }
+        self.lfs = {weights}
+
+    @staticmethod
+    def _generate(seed: str, size: int) -> bytes:
+        block = b"".join(
+            hashlib.sha256(f"{seed}/{i}".encode("utf-8")).digest() for i in range(128)
+        )
+        return (block * (size // len(block) + 1))[:size]
+
+    @staticmethod
+    def blob_id(content: bytes) -> str:
+        return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+    def etag(self, path: str) -> str:
+        content = self.files[path]
+        if path in self.lfs:
+            return hashlib.sha256(content).hexdigest()
+        return self.blob_id(content)
+
+    def tree(self) -> List[Dict]:
+        entries = []
+        for path, content in self.files.items():
+            entry = {
+                "type": "file",
+                "oid": self.blob_id(content),
+                "size": len(content),
+                "path": path,
+            }
+            if path in self.lfs:
+                entry["lfs"] = {
+                    "oid": self.etag(path),
+                    "size": len(content),
+                    "pointerSize": 134,
+                }
+            entries.append(entry)
+        return entries
+
+    def info(self) -> Dict:
+        return {
+            "id": self.repo_id,
+            "sha": self.commit,
+            "private": False,
+            "siblings": [
+                {"rfilename": path, "size": len(content)}
+                for path, content in self.files.items()
+            ],
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbose > 0:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = unquote(urlparse(self.path).path)
+
+        match = API_PATTERN.match(path)
+        if match:
+            repo = self.server.repo(match["kind"], match["repo"])
+            if match["action"] == "tree":
+                self._send_json(200, repo.tree())
+            else:
+                self._send_json(200, repo.info())
+            return
+
+        match = RESOLVE_PATTERN.match(path)
+        if match:
+            repo = self.server.repo(match["kind"] or "models", match["repo"])
+            if match["path"] not in repo.files:
+                self.send_response(404)
+                self.send_header("X-Error-Code", "EntryNotFound")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send_file(repo, match["path"])
+            return
+
+        self._send_json(404, {"error": "not found"})
+
+    def _send_file(self, repo: StubRepo, path: str):
+        content = self.server.count_download(repo, path)
+        start = 0
+        range_header = self.headers.get("Range", "")
+        range_match = re.match(r"bytes=(\d+)-", range_header)
+        if range_match:
+            start = int(range_match.group(1))
+
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content) - start))
+        self.send_header("X-Repo-Commit", repo.commit)
+        self.send_header("ETag", f'"{repo.etag(path)}"')
+        if path in repo.lfs:
+            self.send_header("X-Linked-Etag", f'"{repo.etag(path)}"')
+            self.send_header("X-Linked-Size", str(len(content)))
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        try:
+            for offset in range(start, len(content), CHUNK_SIZE):
+                chunk = content[offset : offset + CHUNK_SIZE]
+                self.wfile.write(chunk)
+                if self.server.bandwidth:
+                    time.sleep(len(chunk) / self.server.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        file_size: int = 1_000_000,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+        verbose: int = 0,
+    ):
+        super().__init__(address, StubHandler)
+        self.file_size = file_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.repos: Dict[Tuple[str, str], StubRepo] = {}
+        self.downloads: Dict[str, int] = {}
+
+    def repo(self, kind: str, repo_id: str) -> StubRepo:
+        with self.lock:
+            if (kind, repo_id) not in self.repos:
+                self.repos[(kind, repo_id)] = StubRepo(kind, repo_id, self.file_size)
+            return self.repos[(kind, repo_id)]
+
+    def count_download(self, repo: StubRepo, path: str) -> bytes:
+        with self.lock:
+            key = f"{repo.kind}/{repo.repo_id}/{path}"
+            self.downloads[key] = self.downloads.get(key, 0) + 1
+        return repo.files[path]
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubServer:
+    """Starts a stand-in server on a background thread and returns it. Use
+    port 0 to pick a free port, then read it back from server.url."""
+    server = StubServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="The address to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8011,
+        help="The port to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--file-size",
+        type=int,
+        default=1_000_000,
+        help="The size in bytes of each repo's weights file. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before answering each request. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        help="Bytes per second sent on each connection. (default: unlimited)",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        (args.host, args.port),
+        file_size=args.file_size,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        verbose=args.verbose,
+    )
+    print(f"Listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,289 @@
+"""A persisted index of play call intents, their phrases and embeddings.
+
+coach2.py classifies a call by the intent of its closest phrases. The index
+keeps one embedding row per (intent, phrase), so adding, removing or
+rewording a phrase encodes at most the phrases that changed and copies the
+other rows, instead of re-embedding the whole library.
+
+Classification reads an immutable snapshot of the rows. An update builds a
+new snapshot from the current one and swaps it in with a single assignment,
+so classifying during a game never waits on an update or sees one half
+applied.
+
+Saving writes a uniquely named temporary file and renames it over the index,
+and refuses to overwrite changes another process saved in the meantime. A
+long running classifier calls `reload` to pick up edits saved by coach2.py.
+
+"""
+
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class IntentSnapshot:
+    """The rows of the index at one version. Not modified once built."""
+
+    def __init__(
+        self,
+        intents: List[str],
+        phrases: List[str],
+        embeddings: np.ndarray,
+        version: int = 0,
+    ):
+        self.intents = intents
+        self.phrases = phrases
+        self.embeddings = embeddings
+        self.embeddings.setflags(write=False)
+        self.version = version
+
+    def rows(self, intent: str, phrases: Optional[Set[str]] = None) -> List[int]:
+        return [
+            row
+            for row, (row_intent, phrase) in enumerate(zip(self.intents, self.phrases))
+            if row_intent == intent and (phrases is None or phrase in phrases)
+        ]
+
+    def library(self) -> Dict[str, Set[str]]:
+        library: Dict[str, Set[str]] = {}
+        for intent, phrase in zip(self.intents, self.phrases):
+            library.setdefault(intent, set()).add(phrase)
+        return library
+
+
+def read_snapshot(path: str, model_name: str, precision: str) -> IntentSnapshot:
+    """Reads a saved index, raising a ValueError when it was embedded with a
+    different model or precision."""
+    with open(path, "r") as index_file:
+        data = json.load(index_file)
+    saved = (data["model"], data.get("precision", "float32"))
+    if saved != (model_name, precision):
+        raise ValueError(
+            f"Intent index {path} was built with {saved[0]} in {saved[1]},"
+            f" not {model_name} in {precision}. Use the same model"
+            " and precision or a new index."
+        )
+    return IntentSnapshot(
+        data["intents"],
+        data["phrases"],
+        np.asarray(data["embeddings"], dtype=np.float32).reshape(
+            len(data["phrases"]), data["dimension"]
+        ),
+        data["version"],
+    )
+
+
+class IntentIndex:
+    """Intents and phrases with their embeddings, updated row by row."""
+
+    def __init__(
+        self,
+        model,
+        model_name: str,
+        snapshot: IntentSnapshot,
+        precision: str = "float32",
+    ):
+        self.model = model
+        self.model_name = model_name
+        self.precision = precision
+        # The version of the saved file this index was loaded from or saved as.
+        self.saved_version: Optional[int] = None
+        self.snapshot = snapshot
+        self.lock = threading.Lock()
+
+    def encode(self, phrases: List[str]) -> np.ndarray:
+        if not phrases:
+            return self.snapshot.embeddings[:0]
+        return np.asarray(self.model.encode(phrases), dtype=np.float32)
+
+    @classmethod
+    def from_library(
+        cls,
+        model,
+        model_name: str,
+        library: Dict[str, Iterable[str]],
+        precision: str = "float32",
+    ) -> "IntentIndex":
+        intents, phrases = [], []
+        for intent, intent_phrases in library.items():
+            for phrase in sorted(set(intent_phrases)):
+                intents.append(intent)
+                phrases.append(phrase)
+        embeddings = np.asarray(model.encode(phrases), dtype=np.float32)
+        return cls(
+            model, model_name, IntentSnapshot(intents, phrases, embeddings), precision
+        )
+
+    @classmethod
+    def load(
+        cls, path: str, model, model_name: str, precision: str = "float32"
+    ) -> "IntentIndex":
+        """Loads a saved index, raising a ValueError when it was embedded
+        with a different model or precision."""
+        index = cls(
+            model, model_name, read_snapshot(path, model_name, precision), precision
+        )
+        index.saved_version = index.snapshot.version
+        return index
+
+    def reload(self, path: str) -> bool:
+        """Swaps in the saved index when it is at a newer version than the
+        one in use. Returns whether it did."""
+        snapshot = read_snapshot(path, self.model_name, self.precision)
+        with self.lock:
+            if snapshot.version <= self.snapshot.version:
+                return False
+            self.snapshot = snapshot
+            self.saved_version = snapshot.version
+        return True
+
+    def save(self, path: str):
+        """Writes the current snapshot to a temporary file and renames it
+        over `path`, so a reader never loads a partly written index. Raises a
+        ValueError, instead of overwriting, when another process saved the
+        index since this one loaded or saved it."""
+        snapshot = self.snapshot
+        if os.path.exists(path):
+            with open(path, "r") as index_file:
+                version = json.load(index_file)["version"]
+            if version != self.saved_version:
+                raise ValueError(
+                    f"Intent index {path} was saved at version {version} by"
+                    " another process. Reload it and apply the changes again."
+                )
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".", suffix=".tmp"
+        )
+        with os.fdopen(descriptor, "w") as index_file:
+            json.dump(
+                {
+                    "format": FORMAT_VERSION,
+                    "model": self.model_name,
+                    "precision": self.precision,
+                    "version": snapshot.version,
+                    "dimension": snapshot.embeddings.shape[1],
+                    "intents": snapshot.intents,
+                    "phrases": snapshot.phrases,
+                    "embeddings": snapshot.embeddings.tolist(),
+                },
+                index_file,
+            )
+        os.replace(temporary, path)
+        self.saved_version = snapshot.version
+
+    def _swap(self, intents: List[str], phrases: List[str], embeddings: np.ndarray):
+        self.snapshot = IntentSnapshot(
+            intents, phrases, embeddings, self.snapshot.version + 1
+        )
+
+    def add(self, intent: str, phrases: Iterable[str]) -> int:
+        """Adds phrases to an intent, creating it if needed. Returns the
+        number of rows added."""
+        phrases = sorted(set(phrases) - self.snapshot.library().get(intent, set()))
+        embeddings = self.encode(phrases)
+        with self.lock:
+            current = self.snapshot
+            existing = set(current.phrases[row] for row in current.rows(intent))
+            new = [row for row, phrase in enumerate(phrases) if phrase not in existing]
+            if not new:
+                return 0
+            self._swap(
+                current.intents + [intent] * len(new),
+                current.phrases + [phrases[row] for row in new],
+                np.concatenate([current.embeddings, embeddings[new]]),
+            )
+        return len(new)
+
+    def remove(self, intent: str, phrases: Optional[Iterable[str]] = None) -> int:
+        """Removes phrases from an intent, or the whole intent when no
+        phrases are given. Returns the number of rows removed."""
+        with self.lock:
+            current = self.snapshot
+            removed = set(
+                current.rows(intent, set(phrases) if phrases is not None else None)
+            )
+            if not removed:
+                return 0
+            kept = [row for row in range(len(current.phrases)) if row not in removed]
+            self._swap(
+                [current.intents[row] for row in kept],
+                [current.phrases[row] for row in kept],
+                current.embeddings[kept],
+            )
+        return len(removed)
+
+    def rename(self, intent: str, new_intent: str) -> int:
+        """Moves an intent's phrases to a new name, or merges them into an
+        existing one, without re-embedding them. Returns the number of rows
+        moved."""
+        with self.lock:
+            current = self.snapshot
+            moved = current.rows(intent)
+            if not moved or intent == new_intent:
+                return 0
+            existing = set(current.phrases[row] for row in current.rows(new_intent))
+            duplicates = set(row for row in moved if current.phrases[row] in existing)
+            kept = [row for row in range(len(current.phrases)) if row not in duplicates]
+            self._swap(
+                [
+                    (
+                        new_intent
+                        if current.intents[row] == intent
+                        else current.intents[row]
+                    )
+                    for row in kept
+                ],
+                [current.phrases[row] for row in kept],
+                current.embeddings[kept],
+            )
+        return len(moved)
+
+    def replace(self, intent: str, phrase: str, new_phrase: str) -> bool:
+        """Rewords one of an intent's phrases, re-embedding only that row. A
+        rewording to a phrase the intent already has drops the old row."""
+        if phrase == new_phrase:
+            return False
+        embedding = None
+        if not self.snapshot.rows(intent, {new_phrase}):
+            embedding = self.encode([new_phrase])
+        with self.lock:
+            current = self.snapshot
+            rows = current.rows(intent, {phrase})
+            if not rows:
+                return False
+            if current.rows(intent, {new_phrase}):
+                kept = [row for row in range(len(current.phrases)) if row != rows[0]]
+                self._swap(
+                    [current.intents[row] for row in kept],
+                    [current.phrases[row] for row in kept],
+                    current.embeddings[kept],
+                )
+                return True
+            if embedding is None:
+                # new_phrase was removed since the check above.
+                embedding = self.encode([new_phrase])
+            embeddings = current.embeddings.copy()
+            embeddings[rows[0]] = embedding[0]
+            phrases = list(current.phrases)
+            phrases[rows[0]] = new_phrase
+            self._swap(list(current.intents), phrases, embeddings)
+        return True
+
+    def classify(self, query: str) -> Set[Tuple[float, str, str]]:
+        """The (score, intent, phrase) of the best scoring phrases, as
+        coach2.get_intent returns them."""
+        snapshot = self.snapshot
+        if not snapshot.phrases:
+            return set()
+        query_embedding = np.asarray(self.model.encode(query), dtype=np.float32)
+        scores = snapshot.embeddings @ query_embedding
+        top_score = scores.max()
+        return {
+            (float(scores[row]), snapshot.intents[row], snapshot.phrases[row])
+            for row in np.flatnonzero(scores >= top_score)
+        }
@@ -0,0 +1,461 @@
+"""A local stand-in for the Ollama HTTP API.
+
+This server answers the subset of the Ollama API used by the coach scripts
+(generate, chat and embeddings) with canned responses and configurable
+latency, so batch modes, streaming, ingestion and benchmarks can be exercised
+without a GPU or a real model.
+
+"""
+
+__usage__ = """
+examples:
+
+    Run a stand-in on a different port than a real Ollama:
+
+        ./.venv/bin/python ollama_stub.py --port 11435
+
+    Simulate a slow model, 0.5s before the first token and 50ms per token:
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --latency 0.5 --token-latency 0.05
+
+    Make prompt processing scale with prompt length, 1ms per prompt token:
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --prompt-latency 0.001
+
+    Reuse the prompt prefix shared with the previous request, as a loaded
+    model does, and script code actions for the coach10 weather agent:
+
+        ./.venv/bin/python ollama_stub.py --port 11435 --prompt-latency 0.001 --prefix-cache
+
+    Point a coach script at it:
+
+        ./.venv/bin/python coach8.py --ollama-url http://127.0.0.1:11435 --batch questions.txt
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+CANNED_ANSWERS = [
+    ("capital of america", "Washington, D.C."),
+    ("michael jordan", "Basketball legend"),
+    ("mj", "Michael Jordan"),
+    ("bulls", "Chicago Bulls"),
+]
+DEFAULT_ANSWER = "I don't know"
+
+
+AGENT_TOOL = "get_the_weather"
+AGENT_BATCH_TOOL = "get_the_weather_for_locations"
+
+
+def agent_answer(prompt: str) -> str:
+    """Scripted code actions for the coach10 weather agent: look up every
+    location named in the task, then answer from the tool output."""
+    task = prompt.split("Task:")[-1]
+    if "Observation:" in task:
+        observation = task.split("Observation:")[-1].strip()
+        return f"Thought: I have the weather.\nCode:\n```py\nfinal_answer({observation!r})\n```"
+    match = re.search(r"weather (?:in|for|at) (.+?)(?:[?!]|\.\s|\.?$)", task.strip())
+    locations = ["Dayton, Ohio"]
+    if match:
+        locations = [
+            x.strip() for x in re.split(r"\s+and\s+|;", match.group(1)) if x.strip()
+        ]
+    if len(locations) > 1 and AGENT_BATCH_TOOL in prompt:
+        code = (
+            f"weather = {AGENT_BATCH_TOOL}(locations={'; '.join(locations)!r})\nweather"
+        )
+    else:
+        calls = [f"{AGENT_TOOL}(location={x!r})" for x in locations]
+        call = calls[0] if len(calls) == 1 else f"[{', '.join(calls)}]"
+        code = f"weather = {call}\nweather"
+    return f"Thought: I will look up the weather.\nCode:\n```py\n{code}\n```"
+
+
+def canned_answer(prompt: str) -> str:
+    if AGENT_TOOL in prompt:
+        return agent_answer(prompt)
+    # Only the user turn is matched, the system prompt is the same every time.
+    user_turn = prompt.split("<|start_header_id|>user<|end_header_id|>")[-1].lower()
+    for needle, answer in CANNED_ANSWERS:
+        if re.search(rf"\b{re.escape(needle)}\b", user_turn):
+            return answer
+    return DEFAULT_ANSWER
+
+
+def embed(text: str, dimensions: int) -> List[float]:
+    """A deterministic bag-of-words embedding, so that texts sharing words are
+    close to each other and retrieval results are meaningful."""
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\s*\S+", text)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, avoid Nagle delays between them.
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbose > 0:
+            super().log_message(format, *args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_chunk(self, body: dict):
+        payload = json.dumps(body).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii"))
+        self.wfile.write(payload + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(
+                200,
+                {
+                    "models": [
+                        {
+                            "name": name,
+                            "model": name,
+                            "size": self.server.pull_size,
+                            "digest": hashlib.sha256(name.encode("utf-8")).hexdigest(),
+                        }
+                        for name in self.server.models
+                    ]
+                },
+            )
+        elif self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/generate":
+            self._generate(request, request.get("prompt", ""), chat=False)
+        elif self.path == "/api/embeddings":
+            time.sleep(self.server.embed_latency)
+            self._send_json(
+                200,
+                {"embedding": embed(request.get("prompt", ""), self.server.dimensions)},
+            )
+        elif self.path == "/api/embed":
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.server.embed_latency)
+            self._send_json(
+                200,
+                {
+                    "model": request.get("model", ""),
+                    "embeddings": [embed(x, self.server.dimensions) for x in inputs],
+                },
+            )
+        elif self.path == "/api/show":
+            model = request.get("model") or request.get("name", "")
+            if model in self.server.models:
+                self._send_json(
+                    200,
+                    {
+                        "modelfile": "",
+                        "parameters": "",
+                        "template": "",
+                        "details": {},
+                        "model_info": {},
+                    },
+                )
+            else:
+                self._send_json(404, {"error": f"model '{model}' not found"})
+        elif self.path == "/api/pull":
+            self._pull(request)
+        elif self.path == "/api/chat":
+            prompt = "\n".join(
+                m.get("content", "") for m in request.get("messages", [])
+            )
+            self._generate(request, prompt, chat=True)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _pull(self, request: dict):
+        """Reports the download of two layers in a few steps, then adds the
+        model to the served models."""
+        model = request.get("model") or request.get("name", "")
+        updates = [{"status": "pulling manifest"}]
+        for layer in range(2):
+            digest = "sha256:" + hashlib.sha256(f"{model}/{layer}".encode()).hexdigest()
+            total = self.server.pull_size // 2
+            for step in range(1, 5):
+                updates.append(
+                    {
+                        "status": f"pulling {digest[7:19]}",
+                        "digest": digest,
+                        "total": total,
+                        "completed": total * step // 4,
+                    }
+                )
+        updates += [
+            {"status": "verifying sha256 digest"},
+            {"status": "writing manifest"},
+            {"status": "success"},
+        ]
+
+        if not request.get("stream", True):
+            time.sleep(self.server.pull_latency * len(updates))
+            self.server.models.append(model)
+            self._send_json(200, updates[-1])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for update in updates:
+            time.sleep(self.server.pull_latency)
+            self._send_chunk(update)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        with self.server.lock:
+            if model not in self.server.models:
+                self.server.models.append(model)
+
+    def _generate(self, request: dict, prompt: str, chat: bool):
+        model = request.get("model", "")
+        started = time.perf_counter()
+        tokens = tokenize(self.server.reply(prompt))
+        prompt_tokens = tokenize(prompt)
+        evaluated = len(prompt_tokens) - self.server.cached_prefix(
+            model, prompt_tokens, request.get("keep_alive")
+        )
+        time.sleep(self.server.latency + self.server.prompt_latency * evaluated)
+
+        def piece(text: str, done: bool) -> dict:
+            created_at = datetime.now(timezone.utc).isoformat()
+            body = {"model": model, "created_at": created_at, "done": done}
+            if chat:
+                body["message"] = {"role": "assistant", "content": text}
+            else:
+                body["response"] = text
+            if done:
+                body["done_reason"] = "stop"
+                body["total_duration"] = int((time.perf_counter() - started) * 1e9)
+                body["prompt_eval_count"] = evaluated
+                body["eval_count"] = len(tokens)
+            return body
+
+        if not request.get("stream", True):
+            time.sleep(self.server.token_latency * len(tokens))
+            self._send_json(200, piece("".join(tokens), True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._send_chunk(piece(token, False))
+                time.sleep(self.server.token_latency)
+            self._send_chunk(piece("", True))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, which is how generation is aborted.
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        embed_latency: float = 0.0,
+        prompt_latency: float = 0.0,
+        dimensions: int = 384,
+        models: List[str] = None,
+        verbose: int = 0,
+        prefix_cache: bool = False,
+        pull_size: int = 1_000_000,
+        pull_latency: float = 0.0,
+    ):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.prompt_latency = prompt_latency
+        self.dimensions = dimensions
+        self.models = (
+            list(models)
+            if models is not None
+            else ["llama3", "llama3:8b", "llama3:70b"]
+        )
+        self.pull_size = pull_size
+        self.pull_latency = pull_latency
+        self.verbose = verbose
+        self.reply = canned_answer
+        self.prefix_cache = prefix_cache
+        self.prompts: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+    def cached_prefix(self, model: str, tokens: List[str], keep_alive=None) -> int:
+        """With prefix_cache set, returns how many leading prompt tokens match
+        the previous prompt to the same model, which a real server would not
+        evaluate again. keep_alive=0 unloads the model and its cache."""
+        if not self.prefix_cache:
+            return 0
+        with self.lock:
+            previous = self.prompts.get(model, [])
+            if keep_alive in (0, "0", "0s"):
+                self.prompts.pop(model, None)
+            else:
+                self.prompts[model] = tokens
+        cached = 0
+        for a, b in zip(previous, tokens):
+            if a != b:
+                break
+            cached += 1
+        # The last token is always evaluated to produce the first output.
+        return min(cached, len(tokens) - 1) if tokens else 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubServer:
+    """Starts a stand-in server on a background thread and returns it. Use
+    port 0 to pick a free port, then read it back from server.url."""
+    server = StubServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="The address to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=11435,
+        help="The port to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before the first token. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--token-latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait between tokens. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--prompt-latency",
+        type=float,
+        default=0.0,
+        help="Seconds of prefill per prompt token, added to the first token latency. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--embed-latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait for each embedding request. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--models",
+        type=str,
+        help="Comma separated models that are already pulled, an empty string for none. (default: llama3,llama3:8b,llama3:70b)",
+    )
+    parser.add_argument(
+        "--pull-latency",
+        type=float,
+        default=0.0,
+        help="Seconds between progress updates when pulling a model. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Skip prompt latency for the prefix shared with the previous prompt to the same model, like a loaded model's KV cache.",
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=384,
+        help="The size of returned embeddings. (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        (args.host, args.port),
+        latency=args.latency,
+        token_latency=args.token_latency,
+        embed_latency=args.embed_latency,
+        prompt_latency=args.prompt_latency,
+        dimensions=args.dimensions,
+        verbose=args.verbose,
+        prefix_cache=args.prefix_cache,
+        models=(
+            None
+            if args.models is None
+            else [model for model in args.models.split(",") if model]
+        ),
+        pull_latency=args.pull_latency,
+    )
+    print(f"Listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
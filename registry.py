@@ -0,0 +1,277 @@
+"""A process-wide registry of loaded models.
+
+Each model is loaded once, on first use, and the same instance is handed to
+every caller in the process, so coach1, coach2, coach5, coach6 and coach7
+can share one copy of all-MiniLM-L6-v2 when they run together. The registry
+records how much resident memory each load added and, when a memory cap is
+set, evicts the least recently used models to stay under it.
+
+"""
+
+import argparse
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+MAX_MEMORY_ENV = "MODEL_REGISTRY_MAX_MB"
+PRECISIONS = ["float32", "bfloat16", "int8"]
+
+
+def resident_bytes() -> int:
+    """The current resident set size of this process, or 0 where
+    /proc/self/statm is not available."""
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class LoadedModel:
+    def __init__(
+        self,
+        key: str,
+        model,
+        resident: int,
+        load_seconds: float,
+        requires: Optional[Set[str]] = None,
+    ):
+        self.key = key
+        self.model = model
+        self.resident = resident
+        self.load_seconds = load_seconds
+        self.requires = requires or set()
+        self.hits = 0
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    """Loads models by key on first use and keeps them until evicted.
+
+    A key names a model, such as "sentence-transformers:all-MiniLM-L6-v2",
+    and is paired with a loader by `register` or by passing the loader to
+    `get`. Loads are serialized, so the resident memory a load adds is
+    measured without another load running alongside it. A loader that gets
+    another model from the registry, as BERTopic does with its embedding
+    model, is only charged for what it added itself, and is recorded as
+    holding that model. Evicting a model also evicts the models that hold
+    it, since its memory is not freed while they do.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.loaders: Dict[str, Callable[[], object]] = {}
+        self.models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self.lock = threading.RLock()
+        self.loading: List[Tuple[str, Set[str]]] = []
+        self.charged = 0
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def register(self, key: str, loader: Callable[[], object]):
+        with self.lock:
+            self.loaders[key] = loader
+
+    def get(self, key: str, loader: Optional[Callable[[], object]] = None):
+        with self.lock:
+            if loader is not None and key not in self.loaders:
+                self.loaders[key] = loader
+            if self.loading:
+                self.loading[-1][1].add(key)
+            entry = self.models.get(key)
+            if entry is not None:
+                self.models.move_to_end(key)
+                entry.hits += 1
+                entry.last_used = time.monotonic()
+                self.stats["hits"] += 1
+                return entry.model
+            if key not in self.loaders:
+                raise KeyError(f"No loader registered for {key}")
+
+            charged = self.charged
+            before = resident_bytes()
+            started = time.perf_counter()
+            requires: Set[str] = set()
+            self.loading.append((key, requires))
+            try:
+                model = self.loaders[key]()
+            finally:
+                self.loading.pop()
+            load_seconds = time.perf_counter() - started
+            nested = self.charged - charged
+            resident = max(resident_bytes() - before - nested, 0)
+
+            self.models[key] = LoadedModel(key, model, resident, load_seconds, requires)
+            self.charged += resident
+            self.stats["loads"] += 1
+            self._enforce(keep=key)
+            return model
+
+    def _enforce(self, keep: str):
+        if self.max_bytes is None:
+            return
+        evicted = False
+        for key in list(self.models):
+            if self.total_bytes() <= self.max_bytes:
+                break
+            if key != keep and key in self.models and keep not in self._holders(key):
+                self._remove(key)
+                evicted = True
+        if evicted:
+            gc.collect()
+        if self.total_bytes() > self.max_bytes:
+            print(
+                f"{keep} alone needs {self.models[keep].resident / 1e6:.0f}MB,"
+                f" over the {self.max_bytes / 1e6:.0f}MB model memory cap",
+                file=sys.stderr,
+            )
+
+    def _holders(self, key: str) -> Set[str]:
+        """The loaded models that hold `key`, directly or through another."""
+        holders: Set[str] = set()
+        pending = [key]
+        while pending:
+            held = pending.pop()
+            for entry in self.models.values():
+                if held in entry.requires and entry.key not in holders:
+                    holders.add(entry.key)
+                    pending.append(entry.key)
+        return holders
+
+    def _remove(self, key: str):
+        for holder in self._holders(key):
+            self._remove_entry(holder)
+        self._remove_entry(key)
+
+    def _remove_entry(self, key: str):
+        entry = self.models.pop(key)
+        self.charged -= entry.resident
+        self.stats["evictions"] += 1
+
+    def evict(self, key: str) -> bool:
+        """Drops the registry's reference to a model and to the models that
+        hold it. The memory is only returned once no caller holds the
+        instances either."""
+        with self.lock:
+            if key not in self.models:
+                return False
+            self._remove(key)
+        gc.collect()
+        return True
+
+    def total_bytes(self) -> int:
+        return sum(entry.resident for entry in self.models.values())
+
+    def usage(self) -> List[Dict]:
+        """Loaded models from least to most recently used."""
+        with self.lock:
+            return [
+                {
+                    "model": entry.key,
+                    "resident_bytes": entry.resident,
+                    "load_seconds": entry.load_seconds,
+                    "hits": entry.hits,
+                }
+                for entry in self.models.values()
+            ]
+
+    def report(self, file=sys.stderr):
+        for entry in self.usage():
+            print(
+                f"{entry['model']}: {entry['resident_bytes'] / 1e6:.1f}MB"
+                f" loaded in {entry['load_seconds']:.2f}s, {entry['hits']} hits",
+                file=file,
+            )
+        print(
+            f"models: {self.total_bytes() / 1e6:.1f}MB resident"
+            f" loads={self.stats['loads']} hits={self.stats['hits']}"
+            f" evictions={self.stats['evictions']}",
+            file=file,
+        )
+
+    def sentence_transformer(self, name: str, precision: str = "float32"):
+        """A sentence-transformer in float32, in bfloat16, or with its linear
+        layers dynamically quantized to int8 (see reduce_precision)."""
+
+        def load():
+            from sentence_transformers import SentenceTransformer
+
+            return reduce_precision(SentenceTransformer(name), precision)
+
+        return self.get(
+            f"sentence-transformers:{name}{precision_suffix(precision)}", load
+        )
+
+    def span_marker(self, name: str):
+        def load():
+            from span_marker import SpanMarkerModel
+
+            return SpanMarkerModel.from_pretrained(name)
+
+        return self.get(f"span-marker:{name}", load)
+
+    def bertopic(self, name: str, embedding_model: str, precision: str = "float32"):
+        def load():
+            from bertopic import BERTopic
+
+            return BERTopic.load(
+                name,
+                embedding_model=self.sentence_transformer(embedding_model, precision),
+            )
+
+        return self.get(
+            f"bertopic:{name}+{embedding_model}{precision_suffix(precision)}", load
+        )
+
+    def pipeline(self, task: str, model: str, **kwargs):
+        def load():
+            from transformers import pipeline
+
+            return pipeline(task, model=model, **kwargs)
+
+        options = "".join(f"+{key}={value}" for key, value in sorted(kwargs.items()))
+        return self.get(f"pipeline:{task}:{model}{options}", load)
+
+
+def add_precision_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="The precision the model runs in. bfloat16 and int8 use less memory and can encode faster on CPU. (default: %(default)s)",
+    )
+
+
+def precision_suffix(precision: str) -> str:
+    return "" if precision == "float32" else f"@{precision}"
+
+
+def reduce_precision(model, precision: str):
+    """Casts a torch model to bfloat16, or replaces its linear layers with
+    dynamically quantized int8 ones. Both are for CPU inference: bfloat16
+    halves the weights and is fast where the CPU supports it (AVX512-BF16,
+    AMX), int8 quarters the linear weights and quantizes activations on the
+    fly."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, use one of {PRECISIONS}")
+    if precision == "float32":
+        return model
+    import torch
+
+    model.eval()
+    if precision == "bfloat16":
+        return model.to(torch.bfloat16)
+    return torch.ao.quantization.quantize_dynamic(
+        model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def max_bytes_from_env() -> Optional[int]:
+    value = os.getenv(MAX_MEMORY_ENV)
+    return int(float(value) * 1e6) if value else None
+
+
+REGISTRY = ModelRegistry(max_bytes=max_bytes_from_env())
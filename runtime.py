@@ -0,0 +1,96 @@
+"""Thread settings shared by the coach scripts.
+
+PyTorch, the tokenizers library and the BLAS libraries under numpy each size
+their thread pools to every core on the machine, so two or three scripts run
+side by side oversubscribe the CPU. add_runtime_arguments gives a script
+--threads, --interop-threads and --tokenizers-parallelism, and
+configure_runtime applies them.
+
+The BLAS and OpenMP pools read their size from the environment when they are
+first loaded, so configure_runtime has to run before torch or numpy is
+imported. The scripts import them after parsing their arguments for this,
+and configure_runtime warns when numpy was loaded first, since its pool then
+keeps the size it started with. torch's own pool is resized either way.
+
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict, Optional
+
+THREADS_ENV = "COACH_THREADS"
+INTEROP_THREADS_ENV = "COACH_INTEROP_THREADS"
+POOL_ENV = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def add_runtime_arguments(
+    parser: argparse.ArgumentParser, tokenizers_parallelism: Optional[str] = None
+):
+    group = parser.add_argument_group("runtime")
+    group.add_argument(
+        "--threads",
+        type=int,
+        default=env_int(THREADS_ENV),
+        help=f"Threads for torch intra-op work and the BLAS and OpenMP pools. (default: ${THREADS_ENV}, or one per core)",
+    )
+    group.add_argument(
+        "--interop-threads",
+        type=int,
+        default=env_int(INTEROP_THREADS_ENV),
+        help=f"Threads torch runs independent operations on. (default: ${INTEROP_THREADS_ENV}, or one per core)",
+    )
+    group.add_argument(
+        "--tokenizers-parallelism",
+        choices=["true", "false"],
+        default=tokenizers_parallelism,
+        help=f"Whether the Hugging Face tokenizers library may use threads. (default: {tokenizers_parallelism or 'its own choice'})",
+    )
+
+
+def configure_runtime(args) -> Dict[str, int]:
+    """Applies the runtime arguments and returns the settings in effect."""
+    if args.tokenizers_parallelism is not None:
+        os.environ["TOKENIZERS_PARALLELISM"] = args.tokenizers_parallelism
+    if args.threads:
+        for name in POOL_ENV:
+            os.environ[name] = str(args.threads)
+        if "numpy" in sys.modules:
+            print(
+                f"numpy was imported before the runtime settings, its BLAS pool"
+                f" keeps its own size instead of --threads {args.threads}",
+                file=sys.stderr,
+            )
+
+    settings = {}
+    if args.threads:
+        settings["threads"] = args.threads
+    # torch reads OMP_NUM_THREADS when it is imported, so it is only imported
+    # here when it already was, or for the interop pool, which has no variable.
+    if args.interop_threads or "torch" in sys.modules:
+        try:
+            import torch
+        except ImportError:
+            return settings
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        if args.interop_threads:
+            # Only allowed once, before torch runs any parallel work.
+            try:
+                torch.set_num_interop_threads(args.interop_threads)
+            except RuntimeError as error:
+                print(f"Cannot set interop threads: {error}", file=sys.stderr)
+        settings["threads"] = torch.get_num_threads()
+        settings["interop_threads"] = torch.get_num_interop_threads()
+    return settings
@@ -0,0 +1,65 @@
+"""Training-ready tokenized datasets, saved once and memory-mapped after.
+
+cache.py --materialize tokenizes the squad and billsum training splits the
+way coach3a.py and coach4a.py do and saves them with save_to_disk, in a
+directory keyed by dataset, tokenizer and max length. The training scripts
+load them with --tokenized instead of tokenizing on every run.
+
+"""
+
+import json
+import os
+from typing import Dict
+
+METADATA_FILE = "materialized.json"
+SEED = 42
+TEST_SIZE = 0.2
+
+
+def tokenized_path(root: str, dataset: str, tokenizer: str, max_length: int) -> str:
+    name = f"{dataset}--{tokenizer.replace('/', '--')}--{max_length}"
+    return os.path.join(root, name)
+
+
+def metadata(dataset: str, split: str, tokenizer: str, max_length: int) -> Dict:
+    return {
+        "dataset": dataset,
+        "split": split,
+        "tokenizer": tokenizer,
+        "max_length": max_length,
+        "seed": SEED,
+        "test_size": TEST_SIZE,
+    }
+
+
+def save_tokenized(tokenized_dataset, path: str, expected: Dict):
+    """Saves a DatasetDict and the metadata it was built with. The metadata
+    is written last, so an interrupted save is never loaded."""
+    metadata_path = os.path.join(path, METADATA_FILE)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+    tokenized_dataset.save_to_disk(path)
+    with open(metadata_path, "w") as metadata_file:
+        json.dump(expected, metadata_file, indent=2)
+
+
+def is_materialized(path: str, expected: Dict) -> bool:
+    try:
+        with open(os.path.join(path, METADATA_FILE), "r") as metadata_file:
+            return json.load(metadata_file) == expected
+    except (OSError, ValueError):
+        return False
+
+
+def load_tokenized(path: str, expected: Dict):
+    """Memory-maps a materialized DatasetDict, raising a ValueError when it is
+    missing or was built from a different dataset, split or tokenizer."""
+    from datasets import load_from_disk
+
+    if not is_materialized(path, expected):
+        raise ValueError(
+            f"No tokenized dataset at {path} for {expected['dataset']}"
+            f" {expected['split']} with {expected['tokenizer']}"
+            f" max_length={expected['max_length']}, run cache.py --materialize"
+        )
+    return load_from_disk(path)
@@ -0,0 +1,196 @@
+"""A local stand-in for the open-meteo geocoding and forecast APIs.
+
+This server answers the two endpoints used by WeatherLookupTool in
+weather_tools.py, /v1/search and /v1/forecast, with deterministic locations
+and temperatures and configurable latency, so the coach10 agent tools can be
+exercised offline.
+
+"""
+
+__usage__ = """
+examples:
+
+    Run a stand-in, 200ms per request:
+
+        ./.venv/bin/python weather_stub.py --port 8010 --latency 0.2
+
+    Point coach10 at it:
+
+        ./.venv/bin/python coach10.py --geocoding-url http://127.0.0.1:8010 --forecast-url http://127.0.0.1:8010
+"""
+
+import argparse
+import hashlib
+import json
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlparse
+
+LOCATIONS: Dict[str, Tuple[float, float]] = {
+    "dayton": (39.7589478, -84.1916069),
+    "chicago": (41.85003, -87.65005),
+    "charlotte": (35.22709, -80.84313),
+    "washington": (38.89511, -77.03637),
+    "wilmington": (34.22573, -77.94471),
+}
+
+
+def locate(name: str) -> Tuple[float, float]:
+    """Known cities get their real location, anything else a stable made-up one."""
+    key = name.strip().lower()
+    if key in LOCATIONS:
+        return LOCATIONS[key]
+    digest = hashlib.md5(key.encode("utf-8")).digest()
+    latitude = 25 + digest[0] / 255 * 24
+    longitude = -124 + digest[1] / 255 * 57
+    return round(latitude, 5), round(longitude, 5)
+
+
+def temperature(latitude: float, longitude: float) -> float:
+    """A stable temperature in fahrenheit for a location."""
+    digest = hashlib.md5(f"{latitude:.2f},{longitude:.2f}".encode("utf-8")).digest()
+    return round(20 + digest[0] / 255 * 70, 1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbose > 0:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.server.lock:
+            self.server.requests[url.path] = self.server.requests.get(url.path, 0) + 1
+        time.sleep(self.server.latency)
+
+        if url.path == "/v1/search":
+            name = query.get("name", "")
+            if not name:
+                self._send_json(200, {"generationtime_ms": 0.1})
+                return
+            latitude, longitude = locate(name)
+            self._send_json(
+                200,
+                {
+                    "results": [
+                        {
+                            "name": name.title(),
+                            "latitude": latitude,
+                            "longitude": longitude,
+                        }
+                    ],
+                    "generationtime_ms": 0.1,
+                },
+            )
+        elif url.path == "/v1/forecast":
+            try:
+                latitude = float(query["latitude"])
+                longitude = float(query["longitude"])
+            except (KeyError, ValueError):
+                self._send_json(
+                    400, {"error": True, "reason": "latitude and longitude required"}
+                )
+                return
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M")
+            self._send_json(
+                200,
+                {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "current_units": {"time": "iso8601", "temperature_2m": "°F"},
+                    "current": {
+                        "time": now,
+                        "interval": 900,
+                        "temperature_2m": temperature(latitude, longitude),
+                    },
+                },
+            )
+        elif url.path == "/stats":
+            with self.server.lock:
+                self._send_json(200, {"requests": dict(self.server.requests)})
+        else:
+            self._send_json(404, {"error": True, "reason": "not found"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self, address: Tuple[str, int], latency: float = 0.0, verbose: int = 0
+    ):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubServer:
+    """Starts a stand-in server on a background thread and returns it. Use
+    port 0 to pick a free port, then read it back from server.url."""
+    server = StubServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog=__usage__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="The address to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8010,
+        help="The port to listen on. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before answering each request. (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        (args.host, args.port), latency=args.latency, verbose=args.verbose
+    )
+    print(f"Listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,248 @@
+"""The weather tools of the coach10.py agent.
+
+WeatherLookupTool looks up the current temperature of a location through the
+open-meteo geocoding and forecast APIs, and WeatherBatchLookupTool looks up
+several at once. They subclass the transformers agents Tool, so coach10.py
+imports this module only once it builds the agent, after its runtime settings
+are applied, and its --help does not load transformers.
+
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from transformers import Tool
+
+GEOCODING_URL = "https://geocoding-api.open-meteo.com"
+FORECAST_URL = "https://api.open-meteo.com"
+DAYTON = (39.7589478, -84.1916069)
+
+
+def pooled_session(pool_size: int = 16, retries: int = 2) -> requests.Session:
+    """A session that keeps up to `pool_size` connections per host open and
+    retries connection errors and 502/503/504 responses."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class WeatherLookupTool(Tool):
+    name = "get_the_weather"
+    description = (
+        "This is a tool that returns the weather of a specific location."
+        "It returns the temperature in fahrenheit."
+    )
+
+    inputs = {
+        "location": {
+            "type": "text",
+            "description": "the location (i.e. Dayton, Ohio)",
+        }
+    }
+    output_type = "text"
+
+    def __init__(
+        self,
+        *args,
+        session: requests.Session = None,
+        geocoding_url: str = GEOCODING_URL,
+        forecast_url: str = FORECAST_URL,
+        timeout: float = 5.0,
+        forecast_ttl: float = 600.0,
+        **kwargs,
+    ):
+        """Lookups share one pooled session. Geocoding results are cached for
+        the life of the tool, and forecasts for `forecast_ttl` seconds keyed by
+        the location rounded to 2 decimal places (about 1km), so repeat
+        lookups during an agent run do not touch the network."""
+        super().__init__(*args, **kwargs)
+        self.session = session or pooled_session()
+        self.geocoding_url = geocoding_url.rstrip("/")
+        self.forecast_url = forecast_url.rstrip("/")
+        self.timeout = timeout
+        self.forecast_ttl = forecast_ttl
+        self.lock = threading.Lock()
+        self.geocodes: Dict[str, Tuple[float, float]] = {}
+        self.forecasts: Dict[Tuple[float, float], Tuple[float, str]] = {}
+        self.stats = {
+            "geocode_hits": 0,
+            "geocode_misses": 0,
+            "forecast_hits": 0,
+            "forecast_misses": 0,
+            "errors": 0,
+        }
+
+    def _count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def geocode(self, city: str) -> Tuple[float, float]:
+        key = city.strip().lower()
+        with self.lock:
+            cached = self.geocodes.get(key)
+        if cached is not None:
+            self._count("geocode_hits")
+            return cached
+        self._count("geocode_misses")
+
+        geocode = self.session.get(
+            f"{self.geocoding_url}/v1/search",
+            params={"name": city, "count": 1, "language": "en", "format": "json"},
+            timeout=self.timeout,
+        ).json()
+
+        latitude, longitude = DAYTON
+        if (
+            len(geocode) > 0
+            and "results" in geocode
+            and len(geocode["results"]) > 0
+            and "latitude" in geocode["results"][0]
+            and "longitude" in geocode["results"][0]
+        ):
+            latitude = geocode["results"][0]["latitude"]
+            longitude = geocode["results"][0]["longitude"]
+
+        with self.lock:
+            self.geocodes[key] = (latitude, longitude)
+        return latitude, longitude
+
+    def forecast(self, latitude: float, longitude: float) -> str:
+        key = (round(latitude, 2), round(longitude, 2))
+        now = time.monotonic()
+        with self.lock:
+            cached = self.forecasts.get(key)
+        if cached is not None and cached[0] > now:
+            self._count("forecast_hits")
+            return cached[1]
+        self._count("forecast_misses")
+
+        weather = self.session.get(
+            f"{self.forecast_url}/v1/forecast",
+            params={
+                "latitude": key[0],
+                "longitude": key[1],
+                "current": "temperature_2m",
+                "temperature_unit": "fahrenheit",
+                "forecast_days": 1,
+            },
+            timeout=self.timeout,
+        ).json()
+
+        if "current" in weather and "temperature_2m" in weather["current"]:
+            temperature = f"{weather['current']['temperature_2m']}"
+            with self.lock:
+                self.forecasts[key] = (now + self.forecast_ttl, temperature)
+            return temperature
+
+        return f"unknown"
+
+    @staticmethod
+    def city(location: str) -> str:
+        parts = list(filter(None, [x.strip() for x in location.split(",")]))
+        return parts[0] if parts else "Dayton"
+
+    def lookup(self, location: str) -> str:
+        try:
+            return self.forecast(*self.geocode(self.city(location)))
+        except (requests.RequestException, ValueError):
+            # Failed lookups are not cached, the agent can retry.
+            self._count("errors")
+            return f"unknown"
+
+    def forward(self, location: str) -> str:
+        return self.lookup(location)
+
+    async def alookup(self, location: str) -> str:
+        return await asyncio.to_thread(self.lookup, location)
+
+    async def alookup_many(self, locations: List[str]) -> Dict[str, str]:
+        """Looks up every location concurrently. Locations naming the same
+        city, such as "Chicago" and "chicago, IL", share one geocode, and
+        cities geocoded to the same rounded coordinates share one forecast."""
+        unique = list(dict.fromkeys(location.strip() for location in locations))
+        cities = {location: self.city(location).lower() for location in unique}
+
+        async def geocode(city: str) -> Optional[Tuple[float, float]]:
+            try:
+                return await asyncio.to_thread(self.geocode, city)
+            except (requests.RequestException, ValueError):
+                self._count("errors")
+                return None
+
+        names = list(dict.fromkeys(cities.values()))
+        coordinates = dict(
+            zip(names, await asyncio.gather(*(geocode(city) for city in names)))
+        )
+
+        async def forecast(point: Tuple[float, float]) -> str:
+            try:
+                return await asyncio.to_thread(self.forecast, *point)
+            except (requests.RequestException, ValueError):
+                self._count("errors")
+                return f"unknown"
+
+        points = list(
+            dict.fromkeys(
+                (round(point[0], 2), round(point[1], 2))
+                for point in coordinates.values()
+                if point is not None
+            )
+        )
+        forecasts = dict(
+            zip(points, await asyncio.gather(*(forecast(point) for point in points)))
+        )
+
+        results = {}
+        for location in unique:
+            point = coordinates[cities[location]]
+            results[location] = (
+                forecasts[(round(point[0], 2), round(point[1], 2))]
+                if point is not None
+                else f"unknown"
+            )
+        return results
+
+    def lookup_many(self, locations: List[str]) -> Dict[str, str]:
+        return asyncio.run(self.alookup_many(locations))
+
+
+class WeatherBatchLookupTool(Tool):
+    name = "get_the_weather_for_locations"
+    description = (
+        "This is a tool that returns the weather of several locations at once."
+        "It returns one line per location with the temperature in fahrenheit."
+        "Use it instead of calling get_the_weather once per location."
+    )
+
+    inputs = {
+        "locations": {
+            "type": "text",
+            "description": "the locations separated by semicolons (i.e. Dayton, Ohio; Chicago, Illinois)",
+        }
+    }
+    output_type = "text"
+
+    def __init__(self, weather: WeatherLookupTool, *args, **kwargs):
+        """Fans the locations out over `weather`, sharing its session and caches."""
+        super().__init__(*args, **kwargs)
+        self.weather = weather
+
+    def forward(self, locations: str) -> str:
+        results = self.weather.lookup_many(
+            [location for location in locations.split(";") if location.strip()]
+        )
+        return "\n".join(
+            f"{location}: {result}" for location, result in results.items()
+        )